@@ -1,4 +1,6 @@
 # backend/app/core/config.py
+from typing import Literal
+
 from pydantic import Field, AnyHttpUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -21,6 +23,10 @@ class Settings(BaseSettings):
         default="postgresql+asyncpg://app_user:appuserpass@db:5432/local_test_db_lorgan",
         description="SQLAlchemy async URL",
     )
+    # Connection pool (SQLAlchemy defaults: 5 + 10 overflow, 30s wait)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
 
     # ===== LLM Service (Ollama) =====
     # Ollama API base URL (e.g., http://localhost:11434)
@@ -35,8 +41,76 @@ class Settings(BaseSettings):
     OLLAMA_TIMEOUT: float = 60.0
     # Optional: JSON string of Ollama options (temperature, top_p, seed, reasoning, etc.)
     OLLAMA_OPTIONS_JSON: str | None = None
+    # Comma-separated num_ctx buckets; each request uses the smallest one that fits
+    # (empty, or num_ctx set in OLLAMA_OPTIONS_JSON = static options)
+    OLLAMA_NUM_CTX_LADDER: str | None = "2048,4096,8192,16384,32768"
+    # Output tokens reserved on top of the prompt when picking num_ctx (num_predict wins if set)
+    OLLAMA_NUM_CTX_OUTPUT_RESERVE: int = 1024
     # Base URL for the bundled mock LLM (used when "default" model is selected)
     MOCK_LLM_BASE_URL: AnyHttpUrl | str = "http://mock-llm:5000"
+    # "auto" model size: pick the largest model whose estimated wait fits this SLO (ms)
+    OLLAMA_AUTO_LATENCY_SLO_MS: float = 15000.0
+    # Answer length (tokens) assumed when estimating the wait for "auto"
+    OLLAMA_AUTO_EXPECTED_OUTPUT_TOKENS: int = 512
+    # Requests Ollama serves concurrently per model (matches OLLAMA_NUM_PARALLEL on the daemon)
+    OLLAMA_NUM_PARALLEL: int = 1
+
+    # ===== Chat history =====
+    # Prompt token budget for prior turns (summary + recent messages) per model size
+    CHAT_HISTORY_BUDGETS_JSON: str | None = '{"default": 1024, "small": 1024, "medium": 2048, "large": 4096}'
+    # Upper bound on recent messages loaded per conversation
+    CHAT_HISTORY_MAX_MESSAGES: int = 40
+    # Conversations whose history window is kept in process memory
+    CHAT_HISTORY_CACHE_SIZE: int = 512
+    # Model preset used to write rolling summaries
+    CHAT_SUMMARY_MODEL_SIZE: str = "small"
+
+    # ===== SSE relay =====
+    # Flush merged delta frames at least this often (ms); 0 flushes on size only
+    SSE_COALESCE_MS: float = 25.0
+    # ...or once this many bytes of delta text are buffered; both 0 = one frame per token
+    SSE_COALESCE_MAX_BYTES: int = 2048
+    # Frames kept per generation for Last-Event-ID replay
+    STREAM_BUFFER_MAX_FRAMES: int = 4096
+    # Bytes queued per viewer before STREAM_SLOW_CONSUMER_POLICY applies
+    STREAM_SUBSCRIBER_QUEUE_BYTES: int = 262144
+    # resync (drop backlog, send a snapshot) | spill (overflow to a temp file) | drop (end that client's stream)
+    STREAM_SLOW_CONSUMER_POLICY: Literal["resync", "spill", "drop"] = "resync"
+    # Spill files: directory (system temp if unset) and per-viewer cap, beyond which the viewer is dropped
+    STREAM_SPILL_DIR: str | None = None
+    STREAM_SPILL_MAX_BYTES: int = 67108864
+    # WebSocket transport: seconds to wait for the auth message, conversations followed per socket
+    WS_AUTH_TIMEOUT_S: float = 10.0
+    WS_MAX_SUBSCRIPTIONS: int = 32
+    # Seconds a finished generation stays replayable
+    STREAM_REPLAY_TTL_S: float = 120.0
+    # Stop a generation nobody has been connected to for this long (0 = always finish)
+    STREAM_ABANDON_AFTER_S: float = 60.0
+
+    # ===== Stream persistence (write-behind) =====
+    # Finished streams waiting to be written before new ones block at submit
+    WRITE_BEHIND_MAX_BACKLOG: int = 1000
+    # Turns written per transaction
+    WRITE_BEHIND_BATCH_SIZE: int = 50
+    # How long the writer waits to fill a batch when more turns are already queued
+    WRITE_BEHIND_MAX_DELAY_MS: float = 20.0
+    # Attempts per batch on transient DB errors (dropped connection, deadlock, serialization)
+    WRITE_BEHIND_MAX_RETRIES: int = 3
+    # Seconds a stream may wait for backlog space before reporting an error
+    WRITE_BEHIND_SUBMIT_TIMEOUT: float = 5.0
+
+    # ===== Sessions =====
+    # New conversations from the same client (ip + user agent) reuse its session until it
+    # has been idle this long; 0 opens a session per conversation
+    SESSION_REUSE_IDLE_S: int = 1800
+
+    # ===== Idempotency keys =====
+    # How long a completed Idempotency-Key replays its original result
+    IDEMPOTENCY_TTL_S: int = 86400
+    # An in-progress key older than this belongs to a request that died; a retry may take it over
+    IDEMPOTENCY_IN_FLIGHT_TIMEOUT_S: int = 900
+    # Seconds between background sweeps of expired keys (0 disables the sweeper)
+    IDEMPOTENCY_PURGE_INTERVAL_S: float = 300.0
 
     # ===== Filesystem storage =====
     # File storage root directory (directory in container)
@@ -44,6 +118,18 @@ class Settings(BaseSettings):
         default="/app/storage/uploads",
         description="Root directory for file storage"
     )
+    # Seconds between blob store garbage collections (0 = never)
+    BLOB_GC_INTERVAL_S: float = 600.0
+    # How long a blob stays unreferenced before it is removed
+    BLOB_GC_GRACE_S: float = 3600.0
+    # Blobs removed per garbage collection transaction
+    BLOB_GC_BATCH_BLOBS: int = 500
+    # Resumable upload sessions expire this long after their last chunk
+    UPLOAD_SESSION_TTL_S: int = 86400
+    # Open resumable upload sessions per user
+    UPLOAD_SESSION_MAX_PER_USER: int = 8
+    # Seconds between sweeps of expired upload sessions (0 = never)
+    UPLOAD_SESSION_SWEEP_INTERVAL_S: float = 300.0
 
     # ===== Storage / Quota =====
     # Single user quota in bytes (100 MB)
@@ -52,6 +138,28 @@ class Settings(BaseSettings):
     QUOTA_WARN_RATIO: float = 0.8
     QUOTA_AUTO_ARCHIVE_ON_LIMIT: bool = False
     QUOTA_AUTO_ARCHIVE_RELEASE_RATIO: float = 0.2  # Earliest 20% auto-release
+    # Seconds between drift checks of the trigger-maintained usage counters (0 = never)
+    QUOTA_RECONCILE_INTERVAL_S: float = 3600.0
+    # Users per reconciliation transaction
+    QUOTA_RECONCILE_BATCH_USERS: int = 500
+    # Seconds between folds of pending organization pool deltas into the pool rows (0 = never)
+    QUOTA_ORG_FOLD_INTERVAL_S: float = 5.0
+    # Pool deltas folded per transaction
+    QUOTA_ORG_FOLD_BATCH: int = 5000
+    # Chat turns reserve their user message plus this much for the reply before generating
+    QUOTA_RESERVE_REPLY_BYTES: int = 16384
+    # Age after which a worker's cached usage snapshot is reloaded in the background
+    QUOTA_SNAPSHOT_TTL_S: float = 30.0
+    # Idle users kept in the in-process quota ledger before it is pruned
+    QUOTA_LEDGER_MAX_USERS: int = 10000
+    # Usage ratio at which the background worker releases a user's oldest data (auto-archive only)
+    QUOTA_AUTORELEASE_HIGH_WATER: float = 0.95
+    # Seconds between scans for users at the high-water mark (0 = no background release)
+    QUOTA_AUTORELEASE_INTERVAL_S: float = 60.0
+    # Users per background release transaction
+    QUOTA_AUTORELEASE_BATCH_USERS: int = 100
+    # Rows fetched per round trip while streaming the admin quota report as CSV
+    QUOTA_REPORT_FETCH_ROWS: int = 1000
 
     # ===== Email settings =====
     # Password reset code settings
@@ -1,4 +1,5 @@
 # backend/app/core/database.py
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 
@@ -8,6 +9,9 @@ engine = create_async_engine(
     settings.DATABASE_URL,
     echo=False,
     future=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
 )
 
 AsyncSessionLocal = sessionmaker(
@@ -16,7 +20,31 @@ AsyncSessionLocal = sessionmaker(
     expire_on_commit=False,
 )
 
+# High-water mark of checked-out connections since start (or the last reset)
+_pool_peak = {"checked_out": 0}
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(*_):
+    _pool_peak["checked_out"] = max(_pool_peak["checked_out"], engine.sync_engine.pool.checkedout())
+
+
+def pool_stats(reset_peak: bool = False) -> dict:
+    """Connection pool occupancy, for load tests and the /metrics endpoint."""
+    pool = engine.sync_engine.pool
+    stats = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "peak_checked_out": _pool_peak["checked_out"],
+        "max_connections": settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW,
+    }
+    if reset_peak:
+        _pool_peak["checked_out"] = pool.checkedout()
+    return stats
+
 
 async def get_db():
     async with AsyncSessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
@@ -57,13 +57,23 @@ async def get_current_user(
         token: Annotated[HTTPAuthorizationCredentials, Depends(oauth2_scheme)],
         db: Annotated[AsyncSession, Depends(get_db)],
 ) -> User:
+    return await user_from_token(db, token.credentials)
+
+
+async def user_from_token(db: AsyncSession, token: str | None) -> User:
+    """
+    Resolve a bearer JWT to an active user, raising 401 otherwise.
+    Shared by get_current_user and transports without a Depends chain (WebSocket).
+    """
     credentials_error = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_error
     try:
-        payload = jwt.decode(token.credentials, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
         user_id: str | None = payload.get("sub")
         if user_id is None:
             raise HTTPException(
@@ -1,15 +1,49 @@
 # backend/app/main.py
+from contextlib import asynccontextmanager
 from textwrap import dedent
 
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 
 from app.core.config import settings
-from app.routers import account, admin, analytics, auth, chat, files, passwd_reset, quota
+from app.core.database import pool_stats
+from app.core.deps import require_super_admin
+from app.routers import account, admin, admin_quota, analytics, auth, chat, files, passwd_reset, quota
+from app.services import metrics
+from app.services.blobs import blob_collector
+from app.services.idempotency import idempotency_sweeper, in_flight
+from app.services.llm_load import load_tracker
+from app.services.persistence import write_behind
+from app.services.quotas import org_quota_folder, quota_auto_releaser, quota_ledger, quota_reconciler
+from app.services.sse import frame_stats
+from app.services.streams import stream_registry
+from app.services.tokens import token_estimator
+from app.services.upload_sessions import upload_session_sweeper
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    quota_reconciler.start()
+    org_quota_folder.start()
+    quota_auto_releaser.start()
+    blob_collector.start()
+    upload_session_sweeper.start()
+    idempotency_sweeper.start()
+    yield
+    await idempotency_sweeper.stop()
+    await upload_session_sweeper.stop()
+    await blob_collector.stop()
+    await quota_auto_releaser.stop()
+    await org_quota_folder.stop()
+    await quota_reconciler.stop()
+    # Write out streamed turns still queued before the process exits
+    await write_behind.stop()
+
 
 app = FastAPI(
     title=settings.APP_NAME,
+    lifespan=lifespan,
     docs_url="/docs",
     redoc_url="/redoc",
     openapi_url="/openapi.json",
@@ -23,6 +57,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Keyset pagination cursor of the message and conversation lists
+    expose_headers=["X-Next-Cursor"],
 )
 
 
@@ -128,6 +164,7 @@ app.include_router(files.router, prefix="/api/v1")
 app.include_router(analytics.router, prefix="/api/v1")
 app.include_router(account.router, prefix="/api/v1")
 app.include_router(admin.router, prefix="/api/v1")
+app.include_router(admin_quota.router, prefix="/api/v1")
 
 
 # Health check endpoint
@@ -136,6 +173,35 @@ async def health():
     return {"status": "ok"}
 
 
+metrics.register_collector("db_pool", pool_stats)
+metrics.register_collector("llm_load", load_tracker.snapshot)
+metrics.register_collector("token_estimator", token_estimator.snapshot)
+metrics.register_collector("write_behind", write_behind.snapshot)
+metrics.register_collector("sse", frame_stats.snapshot)
+metrics.register_collector("streams", stream_registry.snapshot)
+metrics.register_collector("idempotency", in_flight.snapshot)
+metrics.register_collector("idempotency_sweep", idempotency_sweeper.snapshot)
+metrics.register_collector("quota_reconcile", quota_reconciler.snapshot)
+metrics.register_collector("quota_org_fold", org_quota_folder.snapshot)
+metrics.register_collector("quota_ledger", quota_ledger.snapshot)
+metrics.register_collector("quota_autorelease", quota_auto_releaser.snapshot)
+metrics.register_collector("blob_gc", blob_collector.snapshot)
+metrics.register_collector("upload_sessions", upload_session_sweeper.snapshot)
+
+
+# Runtime metrics of this worker process (DB pool occupancy, model load, ...); super-admins only
+@app.get("/metrics", tags=["health"], dependencies=[Depends(require_super_admin)])
+async def runtime_metrics():
+    return metrics.snapshot()
+
+
+# Reset the high-water marks (e.g. before a load test run)
+@app.post("/metrics/reset_peaks", tags=["health"], status_code=204,
+          dependencies=[Depends(require_super_admin)])
+async def reset_metric_peaks():
+    pool_stats(reset_peak=True)
+
+
 # @app.get("/docs", include_in_schema=False)
 # async def custom_docs() -> HTMLResponse:
 #     return HTMLResponse(CUSTOM_DOCS_HTML.replace("__APP_NAME__", settings.APP_NAME))
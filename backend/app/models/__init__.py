@@ -1,11 +1,13 @@
 # app/models/__init__.py
 from .base import Base
 from .conversation import Conversation
-from .document import Document
+from .document import Blob, Document, UploadChunk, UploadSession
+from .idempotency import IdempotencyKey
 from .message import Message
 from .organization import Organization
 from .passwd_reset import PasswordResetCode
 from .session import Session
 from .user import User
 
-__all__ = ["Base", "User", "Organization", "Conversation", "Message", "Document", "Session", "PasswordResetCode"]
+__all__ = ["Base", "User", "Organization", "Conversation", "Message", "Document", "Session", "PasswordResetCode",
+           "IdempotencyKey", "Blob", "UploadSession", "UploadChunk"]
@@ -1,5 +1,5 @@
 # backend/app/models/conversation.py
-from sqlalchemy import Column, String, DateTime, BigInteger, ForeignKey, Index, text, CheckConstraint
+from sqlalchemy import Column, String, Text, DateTime, BigInteger, Integer, ForeignKey, Index, text, CheckConstraint
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.models.base import Base
@@ -36,6 +36,16 @@ class Conversation(Base):
         nullable=False,
         server_default='0')
 
+    # Rolling summary of older turns that no longer fit the prompt history window
+    summary_md = Column(Text, nullable=True)
+    # created_at of the newest message folded into summary_md
+    summary_upto = Column(DateTime(timezone=True), nullable=True)
+
+    # Sidebar fields, kept in sync with the message table by trg_msg_conv_bytes
+    message_count = Column(Integer, nullable=False, server_default='0')
+    last_message_at = Column(DateTime(timezone=True), nullable=True)
+    last_message_preview = Column(Text, nullable=True)
+
     created_at = Column(
         DateTime(timezone=True),
         server_default=text("now()"),
@@ -49,6 +59,19 @@ class Conversation(Base):
     )
     __table_args__ = (
         Index("idx_conv_user_time", "user_id", "created_at"),
+        # Keyset pages of the conversation list; deleted/archived rows never appear there
+        Index(
+            "idx_conv_user_listed",
+            "user_id", text("updated_at DESC"), text("id DESC"),
+            postgresql_where=text("status NOT IN ('deleted', 'archived_quota')"),
+        ),
+        # Oldest-first walk of the quota auto-release (fn_quota_tag_oldest_20_percent)
+        Index(
+            "idx_conv_user_releasable",
+            "user_id", "created_at", "id",
+            postgresql_where=text("status NOT IN ('deleted', 'archived_quota')"),
+        ),
 
         CheckConstraint("storage_size >= 0", name="chk_conversation_storage_size"),
+        CheckConstraint("message_count >= 0", name="chk_conversation_message_count"),
     )
@@ -2,12 +2,29 @@
 import datetime
 from uuid import uuid4
 
-from sqlalchemy import Column, Text, DateTime, BigInteger, ForeignKey
+from sqlalchemy import Column, Text, DateTime, BigInteger, ForeignKey, Index, Integer, text
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.models.base import Base
 
 
+class Blob(Base):
+    """Content-addressed file ({STORAGE_ROOT}/blobs/ab/cd/<sha256>), shared by the documents with that content."""
+    __tablename__ = "blob"
+
+    sha256 = Column(Text, primary_key=True)
+    size_bytes = Column(BigInteger, nullable=False)
+    # Documents (not deleted) stored in this blob, kept by trg_blob_refs
+    ref_count = Column(Integer, nullable=False, server_default="0")
+    # Since when ref_count is 0; the blob GC removes it after BLOB_GC_GRACE_S
+    zero_since = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=text("now()"), nullable=False)
+
+    __table_args__ = (
+        Index("idx_blob_unreferenced", "zero_since", postgresql_where=text("ref_count = 0")),
+    )
+
+
 class Document(Base):
     __tablename__ = "document"
 
@@ -19,6 +36,8 @@ class Document(Base):
     processed_text = Column(Text, nullable=True)
     processed_text_bytes = Column(BigInteger, nullable=True)
     sha256 = Column(Text, nullable=True)
+    # Set when the file lives in the blob store (NULL: file at storage_url from before it)
+    blob_sha256 = Column(Text, ForeignKey("blob.sha256", ondelete="SET NULL"), nullable=True)
     status = Column(Text, nullable=False, default="uploaded")  # uploaded/archived_quota/deleted
     created_at = Column(
         DateTime(timezone=True),
@@ -46,6 +65,10 @@ class UserDocument(Base):
         default=lambda: datetime.datetime.now(datetime.UTC),
         nullable=False
     )
+    __table_args__ = (
+        # Oldest-first walk of the quota auto-release (fn_quota_tag_oldest_20_percent)
+        Index("idx_user_doc_user_linked", "user_id", "linked_at", "document_id"),
+    )
 
 
 class ConversationDocument(Base):
@@ -67,3 +90,43 @@ class ConversationDocument(Base):
         default=lambda: datetime.datetime.now(datetime.UTC),
         nullable=False
     )
+
+
+class UploadSession(Base):
+    """Resumable upload in progress: chunks go by offset into a preallocated file until finalize."""
+    __tablename__ = "upload_session"
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("user_profile.id", ondelete="CASCADE"),
+        nullable=False
+    )
+    filename = Column(Text, nullable=False)
+    mime_type = Column(Text, nullable=False)
+    size_bytes = Column(BigInteger, nullable=False)
+    # Announced by the client, verified on finalize
+    sha256 = Column(Text, nullable=False)
+    conversation_id = Column(UUID(as_uuid=True), nullable=True)
+    status = Column(Text, nullable=False, server_default="open")  # open/finalizing
+    created_at = Column(DateTime(timezone=True), server_default=text("now()"), nullable=False)
+    # Moved on by every chunk; expired sessions are swept with their file
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("idx_upload_session_user", "user_id"),
+        Index("idx_upload_session_expires", "expires_at"),
+    )
+
+
+class UploadChunk(Base):
+    """Byte range [start_byte, end_byte) written into an upload session's file."""
+    __tablename__ = "upload_chunk"
+
+    session_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("upload_session.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+    start_byte = Column(BigInteger, primary_key=True)
+    end_byte = Column(BigInteger, nullable=False)
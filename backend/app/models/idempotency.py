@@ -0,0 +1,34 @@
+# backend/app/models/idempotency.py
+from sqlalchemy import Column, DateTime, Text, ForeignKey, Index, text
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.models.base import Base
+
+
+class IdempotencyKey(Base):
+    """Client-supplied Idempotency-Key of a message POST and the turn it produced."""
+    __tablename__ = "idempotency_key"
+
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("user_profile.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    key = Column(Text, primary_key=True)  # length checked by the routes (MAX_KEY_LENGTH)
+    # Hash of endpoint + conversation + body: the same key with another request is rejected
+    request_hash = Column(Text, nullable=False)
+    conversation_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("conversation.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    status = Column(Text, nullable=False, server_default="in_progress")  # in_progress/completed
+    user_message_id = Column(UUID(as_uuid=True), nullable=True)
+    assistant_message_id = Column(UUID(as_uuid=True), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=text("now()"), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("idx_idem_expires", "expires_at"),
+    )
@@ -29,6 +29,10 @@ class Session(Base):
         nullable=True,
         server_default="active"
     )
+    # sha256 of "ip|user agent" (fn_session_fingerprint); conversations from the same client share a session
+    fingerprint = Column(String(64), nullable=True)
+    # Last conversation created in this session; reuse stops after SESSION_REUSE_IDLE_S
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
 
     created_at = Column(
         DateTime(timezone=True),
@@ -38,4 +42,5 @@ class Session(Base):
 
     __table_args__ = (
         Index("idx_session_user_time", "user_id", "created_at"),
+        Index("idx_session_user_fp_seen", "user_id", "fingerprint", text("last_seen_at DESC")),
     )
@@ -1,4 +1,4 @@
 # backend/app/routers/__init__.py
-from . import auth, chat, files, analytics, account, admin, passwd_reset, quota
+from . import auth, chat, files, analytics, account, admin, admin_quota, passwd_reset, quota
 
-__all__ = ["auth", "chat", "files", "analytics", "account", "admin", "passwd_reset", "quota"]
+__all__ = ["auth", "chat", "files", "analytics", "account", "admin", "admin_quota", "passwd_reset", "quota"]
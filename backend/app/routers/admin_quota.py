@@ -0,0 +1,179 @@
+# backend/app/routers/admin_quota.py
+from __future__ import annotations
+
+import csv
+import io
+from typing import Annotated, Literal
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_db
+from app.core.deps import require_admin, require_super_admin, is_super_admin
+from app.models.organization import Organization
+from app.models.user import User
+from app.schemas.quota_admin import (
+    OrgQuotaOut, OrgQuotaLimitIn, QuotaConsumerOut, QuotaReportPage, QuotaReportRowOut
+)
+from app.services.quotas import (
+    QuotaReportRow, get_org_quota, iter_quota_report, quota_report_page, set_org_quota_limit
+)
+
+router = APIRouter(prefix="/admin/quota", tags=["Admin Quota"])
+
+ReportSort = Literal["used_bytes", "used_ratio", "conv_bytes", "doc_bytes", "archived_bytes", "email"]
+_CSV_COLUMNS = (
+    "user_id", "email", "display_name", "organization_id", "organization_name", "limit_bytes",
+    "used_conv_bytes", "used_doc_bytes", "used_bytes", "used_ratio", "archived_bytes",
+)
+
+
+async def _org_for_admin(db: AsyncSession, organization_id: UUID, current_user: User) -> Organization:
+    """
+    Global Super-admin: any organization
+    Organization-level Admin: only their own organization
+    """
+    if not is_super_admin(current_user) and current_user.organization_id != organization_id:
+        raise HTTPException(status_code=403, detail="Org admins can only view their own organization")
+    org = await db.get(Organization, organization_id)
+    if org is None:
+        raise HTTPException(status_code=404, detail="Organization not found")
+    return org
+
+
+async def _org_quota_out(db: AsyncSession, org: Organization, top: int) -> OrgQuotaOut:
+    state, consumers = await get_org_quota(db, org.id, top)
+    return OrgQuotaOut(
+        organization={"id": org.id, "name": org.name},
+        limit_bytes=state.limit_bytes,
+        used_bytes=state.used_bytes,
+        used_ratio=(state.used_bytes / state.limit_bytes) if state.limit_bytes else None,
+        members=state.members,
+        top_consumers=[
+            QuotaConsumerOut(
+                user_id=c.user_id,
+                display_name=c.display_name,
+                email=c.email,
+                limit_bytes=c.limit_bytes,
+                used_conv_bytes=c.used_conv_bytes,
+                used_doc_bytes=c.used_doc_bytes,
+                used_bytes=c.used_bytes,
+                share=(c.used_bytes / state.used_bytes) if state.used_bytes else 0.0,
+            )
+            for c in consumers
+        ],
+    )
+
+
+@router.get("/organizations/{organization_id}", response_model=OrgQuotaOut)
+async def org_quota(
+        organization_id: UUID,
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(require_admin)],
+        top: int = Query(default=10, ge=0, le=100),
+):
+    """
+    Pooled quota of an organization and its `top` members by usage. Everything comes from
+    the trigger-maintained usage counters; no conversation or document is scanned.
+    """
+    org = await _org_for_admin(db, organization_id, current_user)
+    return await _org_quota_out(db, org, top)
+
+
+@router.put("/organizations/{organization_id}", response_model=OrgQuotaOut)
+async def set_org_quota(
+        organization_id: UUID,
+        payload: OrgQuotaLimitIn,
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(require_super_admin)],
+):
+    """
+    Set the organization's pooled allowance (bytes), shared by all members on top of their
+    own limits; `limit_bytes: null` removes the pool. Super-admin only.
+    """
+    org = await _org_for_admin(db, organization_id, current_user)
+    await set_org_quota_limit(db, org.id, payload.limit_bytes)
+    await db.commit()
+    return await _org_quota_out(db, org, 10)
+
+
+def _report_row_out(r: QuotaReportRow) -> QuotaReportRowOut:
+    org_mini = {"id": r.organization_id, "name": r.organization_name} if r.organization_id else None
+    return QuotaReportRowOut(
+        user_id=r.user_id,
+        email=r.email,
+        display_name=r.display_name,
+        organization=org_mini,
+        limit_bytes=r.limit_bytes,
+        used_conv_bytes=r.used_conv_bytes,
+        used_doc_bytes=r.used_doc_bytes,
+        used_bytes=r.used_bytes,
+        used_ratio=r.used_ratio,
+        archived_bytes=r.archived_bytes,
+    )
+
+
+# A spreadsheet evaluates a cell starting with one of these as a formula
+_CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _csv_cell(value) -> object:
+    """Display names and emails are user input: quote would-be formulas so they open as text."""
+    if value is None:
+        return ""
+    if isinstance(value, str) and value.startswith(_CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+async def _csv_chunks(organization_id: UUID | None, sort: str, descending: bool):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(_CSV_COLUMNS)
+    async for rows in iter_quota_report(organization_id, sort, descending):
+        for r in rows:
+            writer.writerow([_csv_cell(getattr(r, c)) for c in _CSV_COLUMNS])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+@router.get("/report", response_model=QuotaReportPage)
+async def quota_report(
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(require_admin)],
+        organization_id: UUID | None = Query(default=None, description="Super-admin only; default: all organizations"),
+        sort: ReportSort = Query(default="used_bytes"),
+        order: Literal["desc", "asc"] = Query(default="desc"),
+        limit: int = Query(default=50, ge=1, le=500),
+        offset: int = Query(default=0, ge=0),
+        format: Literal["json", "csv"] = Query(default="json"),
+):
+    """
+    Per-user storage usage: conversation and document bytes, usage ratio and quota-archived
+    bytes, read from the maintained counters in one query.
+    Global Super-admin: all organizations, or the one given by organization_id
+    Organization-level Admin: their own organization
+    format=csv streams every matching row (limit/offset ignored) as a download.
+    """
+    if not is_super_admin(current_user):
+        if not current_user.organization_id:
+            raise HTTPException(status_code=400, detail="Org admin must belong to an organization")
+        if organization_id is not None and organization_id != current_user.organization_id:
+            raise HTTPException(status_code=403, detail="Org admins can only view their own organization")
+        organization_id = current_user.organization_id
+
+    descending = order == "desc"
+    if format == "csv":
+        return StreamingResponse(
+            _csv_chunks(organization_id, sort, descending),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="quota-report.csv"'},
+        )
+
+    rows, total = await quota_report_page(db, organization_id, sort, descending, limit, offset)
+    return QuotaReportPage(items=[_report_row_out(r) for r in rows], total=total, limit=limit, offset=offset)
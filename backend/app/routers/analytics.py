@@ -1,6 +1,6 @@
 # backend/app/routers/analytics.py
 from datetime import datetime, timedelta, timezone
-from typing import Annotated, Dict
+from typing import Annotated, Dict, Sequence
 from zoneinfo import ZoneInfo
 
 from fastapi import APIRouter, Depends, Query
@@ -12,9 +12,12 @@ from app.core.deps import require_admin
 from app.models.message import Message
 from app.models.user import User
 from app.schemas.analytics import SummaryMetrics, SummaryOut, TrendsOut, DailyPoint, HourlyPoint
+from app.services.tokens import token_estimator
 
 router = APIRouter(prefix="/admin/analytics", tags=["Analytics"])
 SYDNEY = ZoneInfo("Australia/Sydney")
+# Ids per content_md lookup for messages that need a local estimate
+_CONTENT_FETCH_BATCH = 1000
 
 
 def _now_utc() -> datetime:
@@ -30,10 +33,11 @@ def _extract_tokens(meta: dict | None) -> int:
     if not meta:
         return 0
     u = meta.get("usage") or {}
-    if isinstance(u, dict):
+    if isinstance(u, dict) and u:
         if "total_tokens" in u:
             try:
-                return int(u["total_tokens"])
+                if int(u["total_tokens"]) > 0:
+                    return int(u["total_tokens"])
             except Exception:
                 pass
         total = 0
@@ -42,8 +46,34 @@ def _extract_tokens(meta: dict | None) -> int:
                 total += int(u.get(k, 0) or 0)
             except Exception:
                 continue
-        return total
-    return 0
+        if total:
+            return total
+    # No usage reported (e.g. failed upstream): fall back to the stored local estimate
+    try:
+        return int(meta.get("token_estimate") or 0)
+    except Exception:
+        return 0
+
+
+async def _tokens_for_rows(db: AsyncSession, rows: Sequence) -> list[int]:
+    """
+    Usage tokens per (id, meta) row. Only rows with neither usage nor a stored estimate
+    have their content_md fetched, in id batches, and estimated in one batch per model.
+    """
+    tokens = [_extract_tokens(row.meta) for row in rows]
+    missing = [i for i, t in enumerate(tokens) if not t]
+    for start in range(0, len(missing), _CONTENT_FETCH_BATCH):
+        idxs = missing[start:start + _CONTENT_FETCH_BATCH]
+        q = select(Message.id, Message.content_md).where(Message.id.in_([rows[i].id for i in idxs]))
+        content = dict((await db.execute(q)).all())
+        by_model: dict[str | None, list[int]] = {}
+        for i in idxs:
+            by_model.setdefault((rows[i].meta or {}).get("model"), []).append(i)
+        for model, model_idxs in by_model.items():
+            estimates = token_estimator.estimate_batch([content.get(rows[i].id) for i in model_idxs], model)
+            for i, est in zip(model_idxs, estimates):
+                tokens[i] = est
+    return tokens
 
 
 def _extract_latency(meta: dict | None) -> float | None:
@@ -79,19 +109,19 @@ async def _compute_summary_metrics(
     )
     total_messages = int((await db.execute(q_count)).scalar_one())
 
-    q_assist = select(Message.meta).where(
+    q_assist = select(Message.id, Message.meta).where(
         Message.created_at >= start,
         Message.created_at < end,
         Message.role == "assistant",
     )
-    meta_rows = (await db.execute(q_assist)).scalars().all()
+    rows = (await db.execute(q_assist)).all()
 
-    tokens_used = 0
+    # Same per-message tokens (usage, stored estimate, then content estimate) as the trends
+    tokens_used = sum(await _tokens_for_rows(db, rows))
     latencies: list[float] = []
-    success_total = len(meta_rows)
+    success_total = len(rows)
     success_count = 0
-    for meta in meta_rows:
-        tokens_used += _extract_tokens(meta)
+    for meta in (row.meta for row in rows):
         latency = _extract_latency(meta)
         if latency is not None:
             latencies.append(latency)
@@ -146,19 +176,19 @@ async def get_trends(
     start_sy = datetime.combine(dates_sy[0], datetime.min.time(), tzinfo=SYDNEY)
     start_utc = start_sy.astimezone(timezone.utc)
 
-    q7 = select(Message).where(
+    q7 = select(Message.id, Message.created_at, Message.meta).where(
         Message.created_at >= start_utc,
         Message.created_at < now_utc,
         Message.role == "assistant",
     )
-    rows7 = (await db.execute(q7)).scalars().all()
+    rows7 = (await db.execute(q7)).all()
 
     daily_map: Dict[str, int] = {d.isoformat(): 0 for d in dates_sy}  # 预填 0
-    for m in rows7:
+    for m, tokens in zip(rows7, await _tokens_for_rows(db, rows7)):
         dt_sy = (m.created_at if m.created_at.tzinfo else m.created_at.replace(tzinfo=timezone.utc)).astimezone(SYDNEY)
         key = dt_sy.date().isoformat()
         if key in daily_map:
-            daily_map[key] += _extract_tokens(getattr(m, "meta", None))
+            daily_map[key] += tokens
     daily_points = [DailyPoint(date=k, tokens=v) for k, v in sorted(daily_map.items())]
 
     # --- 24-hour Hourly Buckets (Sydney timezone) ---
@@ -167,19 +197,19 @@ async def get_trends(
     start_24_sy = hours_sy[0]
     start_24_utc = start_24_sy.astimezone(timezone.utc)
 
-    q24 = select(Message).where(
+    q24 = select(Message.id, Message.created_at, Message.meta).where(
         Message.created_at >= start_24_utc,
         Message.created_at < now_utc,
         Message.role == "assistant",
     )
-    rows24 = (await db.execute(q24)).scalars().all()
+    rows24 = (await db.execute(q24)).all()
 
     hourly_map: Dict[str, int] = {h.strftime("%H:00"): 0 for h in hours_sy}  # 预填 0
-    for m in rows24:
+    for m, tokens in zip(rows24, await _tokens_for_rows(db, rows24)):
         dt_sy = (m.created_at if m.created_at.tzinfo else m.created_at.replace(tzinfo=timezone.utc)).astimezone(SYDNEY)
         key = dt_sy.strftime("%H:00")
         if key in hourly_map:
-            hourly_map[key] += _extract_tokens(getattr(m, "meta", None))
+            hourly_map[key] += tokens
 
     hourly_points = [HourlyPoint(hour=k, tokens=v) for k, v in sorted(hourly_map.items())]
 
@@ -3,29 +3,51 @@ from __future__ import annotations
 
 import asyncio
 import json
-from typing import Annotated, List
-from uuid import UUID
-
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+import logging
+from contextlib import aclosing
+from typing import Annotated, AsyncIterator, List, Literal
+from uuid import UUID, uuid4
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+from sqlalchemy import Text, delete, literal, select, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.requests import Request
-from starlette.responses import StreamingResponse
+from starlette.responses import Response, StreamingResponse
 
-from app.core.database import get_db
-from app.core.deps import get_current_user
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, get_db
+from app.core.deps import get_current_user, user_from_token
 from app.models.conversation import Conversation
 from app.models.document import Document, ConversationDocument, UserDocument
+from app.models.idempotency import IdempotencyKey
 from app.models.message import Message, MessageRole
-from app.models.session import Session
 from app.models.user import User
 from app.schemas.chat import ConversationCreate, ConversationOut, ConversationRename, MessageCreate, MessageOut
+from app.services.history import (
+    history_budget_for, load_history, message_token_estimate, remember_messages, schedule_summary_refresh,
+)
+from app.services import idempotency, metrics
 from app.services.llm_client import get_client_for
+from app.services.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_after
+from app.services.persistence import PendingTurn, PersistenceBacklogFull, write_behind
 from app.services.rag import build_context_for_query
-from app.services.quotas import compute_text_bytes, can_accept_size, maybe_autorelease
+from app.services.sessions import create_conversation_in_session
+from app.services.sse import coalesce_deltas, encode_frame, encode_json, iter_frames
+from app.services.streams import GenerationInProgress, LiveStream, stream_registry
+from app.services.quotas import QuotaReservation, compute_text_bytes, ensure_reserved, quota_ledger
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/chat", tags=["Chat"])
 
+_SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# Same predicate as the partial index idx_conv_user_listed, spelled with literals: the planner
+# can only match a partial index when the query's condition provably implies the index's,
+# which bound parameters under a generic prepared-statement plan do not
+_LISTED_CONVERSATIONS = text("conversation.status NOT IN ('deleted', 'archived_quota')")
+
 
 # === Helper Functions ===
 def _extract_client_meta(req: Request) -> tuple[str | None, str | None]:
@@ -34,18 +56,6 @@ def _extract_client_meta(req: Request) -> tuple[str | None, str | None]:
     return ip, ua
 
 
-async def _create_session_for_user(db: AsyncSession, user: User, req: Request) -> Session:
-    ip, ua = _extract_client_meta(req)
-    s = Session(
-        user_id=user.id,
-        ip_address=ip,
-        user_agent=ua,
-    )
-    db.add(s)
-    await db.flush()
-    return s
-
-
 async def _get_active_conv(db: AsyncSession, cid: UUID, uid: UUID) -> Conversation | None:
     return (
         await db.execute(
@@ -58,18 +68,80 @@ async def _get_active_conv(db: AsyncSession, cid: UUID, uid: UUID) -> Conversati
         )).scalar_one_or_none()
 
 
-async def _ensure_quota_for(db: AsyncSession, user_id: UUID, incoming_size: int) -> bool:
+async def _discard_message(db: AsyncSession, msg: Message) -> None:
+    """
+    Remove an already committed message whose turn could not complete, so a failed
+    generation leaves no orphan user message behind (matches the old single-transaction rollback).
     """
-    Wraps "quota check + maybe autorelease and recheck" logic. Returns whether allowed.
+    await db.execute(delete(Message).where(Message.id == msg.id))
+    await db.commit()
+
+
+async def _abandon_turn(user_id: UUID, idempotency_key: str | None, msg: Message) -> None:
     """
-    check = await can_accept_size(db, user_id, incoming_size)
-    if check.allowed:
-        return True
-    released = await maybe_autorelease(db, user_id)
-    if released:
-        check = await can_accept_size(db, user_id, incoming_size)
-        return check.allowed
-    return False
+    _discard_message plus the Idempotency-Key release, in a session of its own: run under
+    asyncio.shield it completes even when the request was cancelled (client gone, shutdown).
+    """
+    async with AsyncSessionLocal() as db:
+        if idempotency_key is not None:
+            await idempotency.release(db, user_id, idempotency_key)
+        await _discard_message(db, msg)
+
+
+async def _claim_idempotency_key(
+        db: AsyncSession,
+        user_id: UUID,
+        key: str,
+        endpoint: str,
+        conv: Conversation,
+        payload: MessageCreate,
+) -> IdempotencyKey | None:
+    """None when this request owns the key; otherwise the record of the original request."""
+    if not key.strip() or len(key) > idempotency.MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="invalid_idempotency_key")
+    request_hash = idempotency.request_fingerprint(endpoint, conv.id, payload)
+    try:
+        return await idempotency.claim(db, user_id, key, request_hash, conv.id)
+    except idempotency.IdempotencyKeyMismatch:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="idempotency_key_reused")
+
+
+def _idempotent_request_in_progress() -> HTTPException:
+    # The original runs in another worker (or its stream is gone): the client retries shortly
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail="idempotent_request_in_progress",
+                         headers={"Retry-After": "1"})
+
+
+async def _load_turn(db: AsyncSession, original: IdempotencyKey) -> tuple[Message, Message]:
+    """User and assistant message of a completed idempotent request."""
+    result = await db.execute(
+        select(Message).where(Message.id.in_([original.user_message_id, original.assistant_message_id]))
+    )
+    by_id = {m.id: m for m in result.scalars().all()}
+    user_msg = by_id.get(original.user_message_id)
+    assistant_msg = by_id.get(original.assistant_message_id)
+    if user_msg is None or assistant_msg is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return user_msg, assistant_msg
+
+
+def _replayed_turn_frames(assistant_msg: Message) -> bytes:
+    """The SSE events of a finished turn, rebuilt from its stored assistant message."""
+    meta = assistant_msg.meta or {}
+    complete_event = {
+        "type": "complete",
+        "usage": meta.get("usage") or {},
+        "latency_ms": meta.get("latency_ms") or 0.0,
+        "answer": assistant_msg.content_md,
+    }
+    if meta.get("reasoning"):
+        complete_event["reasoning"] = meta["reasoning"]
+    events = (
+        {"type": "model", "model": meta.get("model"), "model_size": meta.get("model_size")},
+        complete_event,
+        {"type": "saved", "message_id": str(assistant_msg.id)},
+    )
+    return b"".join(encode_frame(ev) for ev in events)
 
 
 async def _prepare_document_context(
@@ -118,16 +190,37 @@ async def _prepare_document_context(
 # === List/Create/Rename/Delete Conversations ===
 @router.get("/conversations", response_model=List[ConversationOut])
 async def list_my_conversations(
+        response: Response,
         db: Annotated[AsyncSession, Depends(get_db)],
         current_user: Annotated[User, Depends(get_current_user)],
+        limit: int = Query(default=50, ge=1, le=200),
+        cursor: str | None = Query(default=None, description="X-Next-Cursor of the previous page"),
+        include_archived: bool = Query(default=False, description="Also list conversations archived by the quota"),
 ):
-    result = await db.execute(
+    """
+    One page of conversations, most recently active first, keyset-paginated on
+    (updated_at, id); the next cursor comes back in the X-Next-Cursor header. The
+    preview columns are maintained by the message trigger, so this is a single
+    index range scan with no join to message.
+    """
+    stmt = (
         select(Conversation)
         .where(Conversation.user_id == current_user.id,
-               Conversation.status != "deleted")
-        .order_by(Conversation.created_at.desc())
+               Conversation.status != "deleted" if include_archived else _LISTED_CONVERSATIONS)
     )
-    return [ConversationOut.model_validate(c) for c in result.scalars().all()]
+    if cursor:
+        try:
+            after_ts, after_id = decode_cursor(cursor)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stmt = stmt.where(keyset_after(Conversation.updated_at, Conversation.id, after_ts, after_id))
+    stmt = stmt.order_by(Conversation.updated_at.desc(), Conversation.id.desc()).limit(limit + 1)
+
+    convs = list((await db.execute(stmt)).scalars().all())
+    if len(convs) > limit:
+        convs = convs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(convs[-1].updated_at, convs[-1].id)
+    return [ConversationOut.model_validate(c) for c in convs]
 
 
 @router.post("/conversations", response_model=ConversationOut, status_code=status.HTTP_201_CREATED)
@@ -137,15 +230,10 @@ async def create_conversation(
         db: Annotated[AsyncSession, Depends(get_db)],
         current_user: Annotated[User, Depends(get_current_user)],
 ):
-    sess = await _create_session_for_user(db, current_user, req)
-    conv = Conversation(
-        user_id=current_user.id,
-        session_id=sess.id,
-        title=payload.title or "New chat",
-    )
-    db.add(conv)
+    # Reuses the client's session (or opens one) in the same statement as the insert
+    ip, ua = _extract_client_meta(req)
+    conv = await create_conversation_in_session(db, current_user.id, ip, ua, payload.title or "New chat")
     await db.commit()
-    await db.refresh(conv)
     return ConversationOut.model_validate(conv)
 
 
@@ -178,26 +266,92 @@ async def soft_delete_conversation(
 
     conv.status = "deleted"
     await db.commit()
+    quota_ledger.invalidate(current_user.id)
     return
 
 
 @router.get("/conversations/{conversation_id}/messages", response_model=List[MessageOut])
 async def list_messages(
         conversation_id: UUID,
+        response: Response,
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(get_current_user)],
+        limit: int = Query(default=50, ge=1, le=200),
+        cursor: str | None = Query(default=None, description="X-Next-Cursor of the previous page"),
+        order: Literal["desc", "asc"] = Query(default="desc"),
+        include: str | None = Query(default=None, description="Comma-separated heavy fields to include: reasoning"),
+):
+    """
+    One page of messages, newest first by default, keyset-paginated on (created_at, id).
+    The cursor for the next page is returned in the X-Next-Cursor header (absent on the
+    last page). meta.reasoning is left out unless ?include=reasoning; meta.has_reasoning
+    tells whether there is one to fetch via GET .../messages/{message_id}.
+    """
+    conv = await _get_active_conv(db, conversation_id, current_user.id)
+    if not conv:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    with_reasoning = "reasoning" in {part.strip() for part in (include or "").split(",")}
+    # jsonb - 'key' strips the field in the database, so it never crosses the wire
+    meta_col = Message.meta if with_reasoning else Message.meta.op("-", return_type=JSONB)(literal("reasoning", Text))
+    stmt = (
+        select(
+            Message.id,
+            Message.role,
+            Message.content_md,
+            meta_col.label("meta"),
+            Message.meta.has_key("reasoning").label("has_reasoning"),
+            Message.created_at,
+        )
+        .where(Message.conversation_id == conversation_id)
+    )
+    if cursor:
+        try:
+            after_ts, after_id = decode_cursor(cursor)
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stmt = stmt.where(keyset_after(Message.created_at, Message.id, after_ts, after_id, descending=order == "desc"))
+    if order == "desc":
+        stmt = stmt.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        stmt = stmt.order_by(Message.created_at.asc(), Message.id.asc())
+
+    rows = (await db.execute(stmt.limit(limit + 1))).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    return [
+        MessageOut(
+            id=row.id,
+            role=row.role,
+            content_md=row.content_md,
+            meta={**(row.meta or {}), "has_reasoning": bool(row.has_reasoning)},
+            created_at=row.created_at,
+        )
+        for row in rows
+    ]
+
+
+@router.get("/conversations/{conversation_id}/messages/{message_id:uuid}", response_model=MessageOut)
+async def get_message(
+        conversation_id: UUID,
+        message_id: UUID,
         db: Annotated[AsyncSession, Depends(get_db)],
         current_user: Annotated[User, Depends(get_current_user)],
 ):
+    """A single message with all its fields, including meta.reasoning."""
     conv = await _get_active_conv(db, conversation_id, current_user.id)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
 
-    msgs = (
+    msg = (
         await db.execute(
-            select(Message)
-            .where(Message.conversation_id == conversation_id)
-            .order_by(Message.created_at.asc())
-        )).scalars().all()
-    return [MessageOut.model_validate(m) for m in msgs]
+            select(Message).where(Message.id == message_id, Message.conversation_id == conversation_id)
+        )).scalar_one_or_none()
+    if not msg:
+        raise HTTPException(status_code=404, detail="Message not found")
+    return MessageOut.model_validate(msg)
 
 
 @router.post("/conversations/{conversation_id}/messages", response_model=List[MessageOut],
@@ -205,23 +359,102 @@ async def list_messages(
 async def send_message_no_stream(
         conversation_id: UUID,
         payload: MessageCreate,
+        response: Response,
         db: Annotated[AsyncSession, Depends(get_db)],
         current_user: Annotated[User, Depends(get_current_user)],
+        idempotency_key: Annotated[str | None, Header(alias="Idempotency-Key")] = None,
 ):
+    """
+    With an Idempotency-Key, a retry of a completed request returns the stored turn and
+    a retry while the original still runs waits for its result; neither generates again.
+    Replays carry an Idempotent-Replayed: true header.
+    """
     conv = await _get_active_conv(db, conversation_id, current_user.id)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
-
-    # ===== Predict quota size before sending message =====
-    user_bytes = compute_text_bytes(payload.content)
-    if not await _ensure_quota_for(db, current_user.id, user_bytes):
+    if idempotency_key is None:
+        return await _reply_no_stream(db, conv, payload, current_user)
+
+    user_id = current_user.id
+    original = await _claim_idempotency_key(db, user_id, idempotency_key, "messages", conv, payload)
+    if original is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+        if original.status == "completed":
+            return [MessageOut.model_validate(m) for m in await _load_turn(db, original)]
+        running = idempotency.in_flight.get(user_id, idempotency_key)
+        if running is None:
+            raise _idempotent_request_in_progress()
+        # Don't hold a pooled connection while the original waits for the model
+        await db.rollback()
+        metrics.incr("idempotency.attached")
+        return await asyncio.shield(running)
+
+    idempotency.in_flight.start(user_id, idempotency_key)
+    try:
+        result = await _reply_no_stream(db, conv, payload, current_user, idempotency_key)
+    except BaseException as e:
+        idempotency.in_flight.finish(user_id, idempotency_key, error=e)
+        raise
+    idempotency.in_flight.finish(user_id, idempotency_key, result=result)
+    return result
+
+
+async def _reserve_turn_quota(db: AsyncSession, user_id: UUID, user_bytes: int) -> QuotaReservation:
+    """Hold the user message plus QUOTA_RESERVE_REPLY_BYTES for the answer, or 413."""
+    reservation = await quota_ledger.reserve(db, user_id, user_bytes + settings.QUOTA_RESERVE_REPLY_BYTES)
+    if reservation is None:
         raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                             detail="quota_exceeded_on_user_message")
+    return reservation
+
+
+async def _reply_no_stream(
+        db: AsyncSession,
+        conv: Conversation,
+        payload: MessageCreate,
+        current_user: User,
+        idempotency_key: str | None = None,
+) -> list[MessageOut]:
+    """
+    One turn without streaming. An Idempotency-Key claimed by the caller is committed
+    with the user message, completed with the assistant message, and released when
+    the turn is discarded.
+    """
+    # ===== Reserve quota for the turn before sending message =====
+    user_bytes = compute_text_bytes(payload.content)
+    reservation = await _reserve_turn_quota(db, current_user.id, user_bytes)
+    try:
+        return await _reply_with_reservation(db, conv, payload, current_user, idempotency_key,
+                                             user_bytes, reservation)
+    finally:
+        reservation.release()  # no-op once committed
 
+
+async def _reply_with_reservation(
+        db: AsyncSession,
+        conv: Conversation,
+        payload: MessageCreate,
+        current_user: User,
+        idempotency_key: str | None,
+        user_bytes: int,
+        reservation: QuotaReservation,
+) -> list[MessageOut]:
     doc_ids = await _prepare_document_context(db, current_user.id, conv.id, payload.document_ids)
     user_meta = {"document_ids": doc_ids} if doc_ids else {}
     user_meta["model_size"] = payload.model_size
 
+    rag_context = build_context_for_query(payload.content)
+    context_text = rag_context.text if rag_context else None
+    context_sources = rag_context.sources if rag_context else []
+
+    # Resolve the model first: the history budget and token estimates depend on it
+    client, resolved_model, resolved_size = get_client_for(
+        payload.model_size, prompt_text=f"{context_text or ''}{payload.content}"
+    )
+    history_budget = history_budget_for(resolved_size)
+    history = await load_history(db, conv, history_budget, resolved_model)
+    user_meta["token_estimate"] = message_token_estimate(payload.content, resolved_model)
+
     user_msg = Message(
         conversation_id=conv.id,
         session_id=conv.session_id,
@@ -231,31 +464,38 @@ async def send_message_no_stream(
         meta=user_meta,
     )
     db.add(user_msg)
-    await db.flush()
-
-    rag_context = build_context_for_query(payload.content)
-    context_text = rag_context.text if rag_context else None
-    context_sources = rag_context.sources if rag_context else []
+    # Short transaction #1: persist the user message and give the pooled connection back
+    # before the model runs (up to OLLAMA_TIMEOUT); nothing below touches `db` until #2.
+    await db.commit()
 
     # ===== Call mock llm (no stream), and get assistance response =====
     # Call Mock LLM: Pass the username and organization name
-    client, resolved_model, resolved_size = get_client_for(payload.model_size)
     display_name = getattr(current_user, "display_name", None) or getattr(current_user, "email", None)
     # Organization name: organization_id (UUID).
     # If there is no organization name, pass None here. Mock is default_org by default.
     organization_name = "default_org"
 
-    answer, usage, latency, reasoning = await client.assist_no_stream_reply(
-        user_message=payload.content,
-        user_name=display_name,
-        organization_name=organization_name,
-        context=context_text,
-    )
+    try:
+        answer, usage, latency, reasoning = await client.assist_no_stream_reply(
+            user_message=payload.content,
+            user_name=display_name,
+            organization_name=organization_name,
+            context=context_text,
+            history=history.as_messages(),
+        )
+    except BaseException:
+        # Also on cancellation, or the user message stays without a reply and the key in_progress
+        await asyncio.shield(_abandon_turn(current_user.id, idempotency_key, user_msg))
+        raise
 
-    # ===== Check quota predict before writing =====
+    # ===== Short transaction #2: quota check + assistant write =====
     assistant_bytes = compute_text_bytes(answer)
 
-    if not await _ensure_quota_for(db, current_user.id, assistant_bytes):
+    if not await ensure_reserved(db, reservation, user_bytes + assistant_bytes, assistant_bytes):
+        await db.rollback()
+        if idempotency_key is not None:
+            await idempotency.release(db, current_user.id, idempotency_key)
+        await _discard_message(db, user_msg)
         raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                             detail="quota_exceeded_on_assistant_message")
 
@@ -265,13 +505,18 @@ async def send_message_no_stream(
         "latency_ms": latency,
         "model": resolved_model,
         "model_size": resolved_size,
+        "token_estimate": message_token_estimate(answer, resolved_model),
     }
+    if payload.model_size == "auto":
+        assistant_meta["model_size_requested"] = "auto"
     if context_sources:
         assistant_meta["rag_sources"] = context_sources
     if reasoning:
         assistant_meta["reasoning"] = reasoning
 
     assistant_msg = Message(
+        # Assigned up front: the idempotency record references it in the same transaction
+        id=uuid4(),
         conversation_id=conv.id,
         session_id=conv.session_id,
         role=MessageRole.assistant.value,
@@ -280,47 +525,72 @@ async def send_message_no_stream(
         meta=assistant_meta
     )
     db.add(assistant_msg)
+    if idempotency_key is not None:
+        await idempotency.complete(db, current_user.id, idempotency_key, user_msg.id, assistant_msg.id)
+    # expire_on_commit=False keeps both rows loaded; no refresh round-trip (and no new transaction) needed
     await db.commit()
-    await db.refresh(user_msg)
-    await db.refresh(assistant_msg)
+    reservation.commit()
+
+    remember_messages(conv, [user_msg, assistant_msg])
+    if history.overflow_tokens:
+        schedule_summary_refresh(conv.id, history_budget)
 
     return [MessageOut.model_validate(user_msg), MessageOut.model_validate(assistant_msg)]
 
 
-@router.post("/conversations/{conversation_id}/messages/stream")
-async def send_message_stream(
-        conversation_id: UUID,
+async def _start_generation(
+        db: AsyncSession,
+        conv: Conversation,
         payload: MessageCreate,
-        request: Request,
-        db: Annotated[AsyncSession, Depends(get_db)],
-        current_user: Annotated[User, Depends(get_current_user)],
-):
+        current_user: User,
+        idempotency_key: str | None = None,
+) -> LiveStream:
     """
-    Streaming Endpoint: Backend as "relay"
-    1) Write user message first (quota check)
-    2) Connect to mock-llm /chat streaming interface
-    3) Relay delta/complete as SSE events to frontend
-    4) On complete, do quota check and write assistant message; if not enough → send error event
-    SSE Event Format: text/event-stream
-      data: {"type":"delta","delta":"..."}\n\n
-      data: {"type":"complete","usage":{...},"latency_ms":...}\n\n
-      data: {"type":"error","error":"..."}\n\n
+    Shared by the SSE and WebSocket transports: quota check, write and commit the user
+    message, then start the generation in the background and return its live stream.
+    `db` is not used after this returns; the write-behind writer owns the rest of the turn,
+    including completing or releasing an Idempotency-Key the caller claimed on `db`.
     """
-    conv = await _get_active_conv(db, conversation_id, current_user.id)
-    if not conv:
-        raise HTTPException(status_code=404, detail="Conversation not found")
+    # One generation per conversation: a second would run detached from watch and resume
+    if stream_registry.busy(conv.id):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="generation_in_progress")
 
-    # Before sending: verify user quota for the user message + write
+    # Before sending: reserve quota for the user message + expected answer
     user_bytes = compute_text_bytes(payload.content)
+    reservation = await _reserve_turn_quota(db, current_user.id, user_bytes)
+    try:
+        return await _start_with_reservation(db, conv, payload, current_user, idempotency_key,
+                                             user_bytes, reservation)
+    except BaseException:
+        reservation.release()
+        raise
 
-    if not await _ensure_quota_for(db, current_user.id, user_bytes):
-        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                            detail="quota_exceeded_on_user_message")
 
+async def _start_with_reservation(
+        db: AsyncSession,
+        conv: Conversation,
+        payload: MessageCreate,
+        current_user: User,
+        idempotency_key: str | None,
+        user_bytes: int,
+        reservation: QuotaReservation,
+) -> LiveStream:
     doc_ids = await _prepare_document_context(db, current_user.id, conv.id, payload.document_ids)
     user_meta = {"document_ids": doc_ids} if doc_ids else {}
     user_meta["model_size"] = payload.model_size
 
+    rag_context = build_context_for_query(payload.content)
+    context_text = rag_context.text if rag_context else None
+    context_sources = rag_context.sources if rag_context else []
+
+    # Resolve the model first: the history budget and token estimates depend on it
+    client, resolved_model, resolved_size = get_client_for(
+        payload.model_size, prompt_text=f"{context_text or ''}{payload.content}"
+    )
+    history_budget = history_budget_for(resolved_size)
+    history = await load_history(db, conv, history_budget, resolved_model)
+    user_meta["token_estimate"] = message_token_estimate(payload.content, resolved_model)
+
     user_msg = Message(
         conversation_id=conv.id,
         session_id=conv.session_id,
@@ -330,116 +600,406 @@ async def send_message_stream(
         meta=user_meta,
     )
     db.add(user_msg)
-    await db.flush()
+    await db.commit()  # release the connection before streaming; the writer owns the rest of the turn
 
-    rag_context = build_context_for_query(payload.content)
-    context_text = rag_context.text if rag_context else None
-    context_sources = rag_context.sources if rag_context else []
-
-    client, resolved_model, resolved_size = get_client_for(payload.model_size)
+    user_id = current_user.id
     display_name = getattr(current_user, "display_name", None) or getattr(current_user, "email", None)
     organization_name = "default_org"
 
-    async def event_gen():
+    async def discard_user_message() -> None:
+        try:
+            await write_behind.submit(PendingTurn(
+                user_id=user_id,
+                user_message_id=user_msg.id,
+                assistant=None,
+                idempotency_key=idempotency_key,
+                reservation=reservation,
+            ))
+        except PersistenceBacklogFull:
+            reservation.release()
+            logger.warning("could not queue discard of user message %s", user_msg.id)
+
+    def on_saved(assistant_msg: Message) -> None:
+        remember_messages(conv, [user_msg, assistant_msg])
+        if history.overflow_tokens:
+            schedule_summary_refresh(conv.id, history_budget)
+
+    async def produce(stream: LiveStream) -> None:
         assistant_text_chunks: list[str] = []
         reasoning_text_chunks: list[str] = []
         received_delta = False
         usage: dict = {}
         latency_ms: float = 0.0
+        # Once the writer has the turn it also owns discarding it
+        handed_off = False
         try:
-            # Connect to mock-llm streaming interface, forwarding while receiving
-            async for ev in client.assist_stream_reply(
+            # Tell the client which model actually serves this answer ("auto" resolves per request)
+            model_event = {"type": "model", "model": resolved_model, "model_size": resolved_size}
+            stream.publish(model_event)
+
+            # Connect to mock-llm streaming interface, forwarding while receiving;
+            # per-token deltas are merged into fewer, larger frames
+            # aclosing: a stop breaks out early, and the pump and upstream stream must close now
+            async with aclosing(coalesce_deltas(client.assist_stream_reply(
                     user_message=payload.content,
                     user_name=display_name,
                     organization_name=organization_name,
                     context=context_text,
-            ):
-                # Client disconnected actively
-                if await request.is_disconnected():
-                    break
-
-                mtype = ev.get("type")
-
-                if mtype == "delta":
-                    delta = ev.get("delta") or ""
-                    if delta:
-                        assistant_text_chunks.append(delta)
-                        received_delta = True
-                        yield f'data: {json.dumps({"type": "delta", "delta": delta})}\n\n'.encode("utf-8")
-
-                elif mtype == "thinking":
-                    reasoning_delta = ev.get("delta") or ev.get("reasoning") or ""
-                    if reasoning_delta:
-                        reasoning_text_chunks.append(reasoning_delta)
-                        yield f'data: {json.dumps({"type": "thinking", "delta": reasoning_delta})}\n\n'.encode("utf-8")
-
-                elif mtype == "complete":
-                    usage = ev.get("usage") or {}
-                    latency_ms = float(ev.get("latency_ms") or 0.0)
-                    final_answer = ev.get("answer") or ev.get("delta") or ev.get("llm_answer") or ""
-                    if final_answer and not received_delta:
-                        assistant_text_chunks.append(final_answer)
-                    if ev.get("reasoning"):
-                        reasoning_text_chunks.append(ev.get("reasoning"))
-                    reasoning_text = "".join(reasoning_text_chunks)
-                    complete_event = {"type": "complete", "usage": usage, "latency_ms": latency_ms}
-                    if final_answer:
-                        complete_event["answer"] = final_answer
-                    if reasoning_text:
-                        complete_event["reasoning"] = reasoning_text
-                    yield f'data: {json.dumps(complete_event)}\n\n'.encode("utf-8")
-                    break
-
-                elif mtype == "error":
-                    yield f'data: {json.dumps({"type": "error", "error": ev.get("error", "unknown")})}\n\n'.encode(
-                        "utf-8")
-                    return
-
-                await asyncio.sleep(0)
-
-            # Complete text splicing and quota check
+                    history=history.as_messages(),
+            ))) as events:
+                async for ev in events:
+                    # Stop requested, or nobody reconnected in time: keep the partial answer
+                    if stream.should_stop():
+                        break
+
+                    mtype = ev.get("type")
+
+                    if mtype == "delta":
+                        delta = ev.get("delta") or ""
+                        if delta:
+                            assistant_text_chunks.append(delta)
+                            received_delta = True
+                            stream.publish({"type": "delta", "delta": delta})
+
+                    elif mtype == "thinking":
+                        reasoning_delta = ev.get("delta") or ev.get("reasoning") or ""
+                        if reasoning_delta:
+                            reasoning_text_chunks.append(reasoning_delta)
+                            stream.publish({"type": "thinking", "delta": reasoning_delta})
+
+                    elif mtype == "complete":
+                        usage = ev.get("usage") or {}
+                        latency_ms = float(ev.get("latency_ms") or 0.0)
+                        final_answer = ev.get("answer") or ev.get("delta") or ev.get("llm_answer") or ""
+                        if final_answer and not received_delta:
+                            assistant_text_chunks.append(final_answer)
+                        if ev.get("reasoning"):
+                            reasoning_text_chunks.append(ev.get("reasoning"))
+                        reasoning_text = "".join(reasoning_text_chunks)
+                        complete_event = {"type": "complete", "usage": usage, "latency_ms": latency_ms}
+                        if final_answer:
+                            complete_event["answer"] = final_answer
+                        if reasoning_text:
+                            complete_event["reasoning"] = reasoning_text
+                        stream.publish(complete_event)
+                        break
+
+                    elif mtype == "error":
+                        stream.publish({"type": "error", "error": ev.get("error", "unknown")})
+                        await discard_user_message()
+                        return
+
+            # Complete text splicing; quota check and insert happen in the write-behind writer
             assistant_text = "".join(assistant_text_chunks)
             reasoning_text = "".join(reasoning_text_chunks)
-            assistant_bytes = compute_text_bytes(assistant_text)
 
-            if not await _ensure_quota_for(db, current_user.id, assistant_bytes):
-                yield f"data: {json.dumps({'type': 'error', 'error': 'quota_exceeded_on_assistant_message'})}\n\n".encode(
-                    'utf-8')
-                return
-
-            # Quota enough → write assistant message
             assistant_meta = {
                 "usage": usage,
                 "latency_ms": latency_ms,
                 "model": resolved_model,
                 "model_size": resolved_size,
+                "token_estimate": message_token_estimate(assistant_text, resolved_model),
             }
+            if payload.model_size == "auto":
+                assistant_meta["model_size_requested"] = "auto"
             if context_sources:
                 assistant_meta["rag_sources"] = context_sources
             if reasoning_text:
                 assistant_meta["reasoning"] = reasoning_text
 
             assistant_msg = Message(
+                # Assigned up front so a retried batch inserts the same row
+                id=uuid4(),
                 conversation_id=conv.id,
                 session_id=conv.session_id,
                 role=MessageRole.assistant.value,
                 content_md=assistant_text,
-                size_bytes=assistant_bytes,
+                size_bytes=compute_text_bytes(assistant_text),
                 meta=assistant_meta,
             )
-            db.add(assistant_msg)
-            await db.commit()
+            try:
+                saved = await write_behind.submit(PendingTurn(
+                    user_id=user_id,
+                    user_message_id=user_msg.id,
+                    assistant=assistant_msg,
+                    on_saved=on_saved,
+                    idempotency_key=idempotency_key,
+                    reservation=reservation,
+                    turn_bytes=user_bytes + assistant_msg.size_bytes,
+                ))
+            except PersistenceBacklogFull:
+                reservation.release()
+                stream.publish({"type": "error", "error": "persistence_backlog_full"})
+                return
+            handed_off = True
+
+            result = await saved
+            if result.error:
+                stream.publish({"type": "error", "error": result.error})
+                return
 
             # Final ack event with message ID
-            ack = {"type": "saved", "message_id": str(assistant_msg.id)}
-            yield f"data: {json.dumps(ack)}\n\n".encode("utf-8")
+            ack = {"type": "saved", "message_id": str(result.message_id)}
+            stream.publish(ack)
 
         except Exception as e:
             err = {"type": "error", "error": f"backend_stream_error: {str(e)}"}
-            yield f"data: {json.dumps(err)}\n\n".encode("utf-8")
+            stream.publish(err)
+            if not handed_off:
+                await discard_user_message()
+        except BaseException:
+            # Cancelled (shutdown, task torn down): still hand back the user message and quota
+            if not handed_off:
+                await asyncio.shield(discard_user_message())
+            raise
+
+    # Generation runs in the background; responses and sockets are just its subscribers
+    try:
+        return stream_registry.start(conv.id, user_id, produce, idempotency_key=idempotency_key)
+    except GenerationInProgress:
+        # Another request started one while this user message was being written
+        await discard_user_message()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="generation_in_progress")
+
 
+@router.post("/conversations/{conversation_id}/messages/stream")
+async def send_message_stream(
+        conversation_id: UUID,
+        payload: MessageCreate,
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(get_current_user)],
+        idempotency_key: Annotated[str | None, Header(alias="Idempotency-Key")] = None,
+):
+    """
+    Streaming Endpoint: Backend as "relay"
+    1) Write and commit user message first (quota check); the stream holds no DB connection
+    2) Connect to mock-llm /chat streaming interface
+    3) Relay delta/complete as SSE events to frontend
+    4) On complete, hand the assistant message to the write-behind queue, which does the
+       quota check and insert; its outcome arrives as a saved or error event
+    Generation runs in the background and keeps going if the client drops; every frame
+    has an `id:` line, and GET .../messages/stream/resume with Last-Event-ID replays the rest.
+    SSE Event Format: text/event-stream
+      data: {"type":"model","model":"...","model_size":"..."}\n\n
+      data: {"type":"delta","delta":"..."}\n\n
+      data: {"type":"complete","usage":{...},"latency_ms":...}\n\n
+      data: {"type":"saved","message_id":"..."}\n\n
+      data: {"type":"error","error":"..."}\n\n
+    With an Idempotency-Key, a retry attaches to the original generation while it is
+    live (replaying from its first event) and afterwards gets the stored turn as
+    model/complete/saved events; neither starts a new generation.
+    """
+    conv = await _get_active_conv(db, conversation_id, current_user.id)
+    if not conv:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    if idempotency_key is not None:
+        original = await _claim_idempotency_key(db, current_user.id, idempotency_key, "messages/stream", conv, payload)
+        if original is not None:
+            return await _replay_stream(db, current_user.id, original)
+
+    stream = await _start_generation(db, conv, payload, current_user, idempotency_key)
     return StreamingResponse(
-        event_gen(),
+        stream.follow(0),
         media_type="text/event-stream",
-        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        headers=_SSE_HEADERS,
     )
+
+
+async def _replay_stream(db: AsyncSession, user_id: UUID, original: IdempotencyKey) -> StreamingResponse:
+    headers = {**_SSE_HEADERS, "Idempotent-Replayed": "true"}
+    if original.status == "completed":
+        _, assistant_msg = await _load_turn(db, original)
+        return StreamingResponse(iter([_replayed_turn_frames(assistant_msg)]),
+                                 media_type="text/event-stream", headers=headers)
+
+    stream = stream_registry.get(original.conversation_id, user_id)
+    if stream is None or stream.idempotency_key != original.key:
+        raise _idempotent_request_in_progress()
+    # The replay follows the in-memory stream; give the connection back first
+    await db.rollback()
+    metrics.incr("idempotency.attached")
+    return StreamingResponse(stream.follow(0), media_type="text/event-stream", headers=headers)
+
+
+@router.get("/conversations/{conversation_id}/messages/stream")
+async def watch_message_stream(
+        conversation_id: UUID,
+        current_user: Annotated[User, Depends(get_current_user)],
+):
+    """
+    Join the conversation's in-flight generation from another tab or screen without
+    starting a new one: a snapshot event with the text so far, then the live deltas.
+    Each viewer has its own bounded queue; a viewer that falls behind gets a fresh
+    snapshot instead of the frames it missed.
+    """
+    stream = stream_registry.get(conversation_id, current_user.id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="No active stream")
+    metrics.incr("streams.joined")
+    return StreamingResponse(
+        stream.follow(),
+        media_type="text/event-stream",
+        headers=_SSE_HEADERS,
+    )
+
+
+@router.get("/conversations/{conversation_id}/messages/stream/resume")
+async def resume_message_stream(
+        conversation_id: UUID,
+        current_user: Annotated[User, Depends(get_current_user)],
+        last_event_id: Annotated[str | None, Header(alias="Last-Event-ID")] = None,
+        after: Annotated[int | None, Query(description="Last event id seen, if the Last-Event-ID header cannot be set")] = None,
+):
+    """
+    Reattach to the conversation's latest generation: replay frames after
+    Last-Event-ID (or `after`), then follow the live tail. Finished generations stay
+    replayable for a short TTL. Without an id, or if the missed frames already left
+    the replay buffer, a {"type":"snapshot",...} event with the text so far comes first.
+    """
+    stream = stream_registry.get(conversation_id, current_user.id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="No active stream")
+
+    resume_from = after
+    if last_event_id and last_event_id.strip().isdigit():
+        resume_from = int(last_event_id.strip())
+    metrics.incr("streams.resumed")
+    return StreamingResponse(
+        stream.follow(resume_from),
+        media_type="text/event-stream",
+        headers=_SSE_HEADERS,
+    )
+
+
+# === WebSocket transport ===
+async def _authenticate_socket(websocket: WebSocket) -> User | None:
+    """
+    Token from a first {"type":"auth","token":...} message. Not from the query string, which
+    ends up in access logs.
+    """
+    try:
+        first = json.loads(await asyncio.wait_for(websocket.receive_text(), timeout=settings.WS_AUTH_TIMEOUT_S))
+        token = first.get("token") if isinstance(first, dict) and first.get("type") == "auth" else None
+    except (asyncio.TimeoutError, ValueError, WebSocketDisconnect):
+        token = None
+    try:
+        async with AsyncSessionLocal() as db:
+            return await user_from_token(db, token)
+    except HTTPException:
+        return None
+
+
+@router.websocket("/ws")
+async def chat_socket(websocket: WebSocket):
+    """
+    One socket for many conversations. Authenticates once with the same JWT as the
+    HTTP API, sent as the first message ({"type":"auth","token":"..."}), then carries JSON messages:
+      → {"type":"send","conversation_id":"...","content":"...","model_size":"...","document_ids":[...]}
+      → {"type":"stream","conversation_id":"..."}                      join the in-flight generation
+      → {"type":"resume","conversation_id":"...","last_event_id":N}    replay after N, then live
+      → {"type":"stop","conversation_id":"..."}                        stop generating, keep the partial answer
+      ← {"conversation_id":"...","id":N,"event":{...}}                 same events as the SSE stream
+      ← {"type":"end","conversation_id":"..."} / {"type":"error","conversation_id":"...","error":"..."}
+    Generation, persistence and replay are shared with send_message_stream. Each
+    conversation is pumped from its own bounded hub queue and writes take turns on
+    the socket, so one busy or lagging conversation cannot starve the others.
+    """
+    await websocket.accept()
+    user = await _authenticate_socket(websocket)
+    if user is None:
+        await websocket.close(code=4401, reason="Could not validate credentials")
+        return
+    metrics.incr("ws.connections")
+
+    send_lock = asyncio.Lock()
+    subscriptions: dict[UUID, asyncio.Task] = {}
+
+    async def send(message: bytes) -> None:
+        # asyncio.Lock wakes waiters in FIFO order: conversations take turns
+        async with send_lock:
+            await websocket.send_text(message.decode("utf-8"))
+
+    async def send_error(cid: UUID | str | None, error) -> None:
+        await send(encode_json({"type": "error", "conversation_id": str(cid) if cid else None, "error": error}))
+
+    async def pump(cid: UUID, chunks: AsyncIterator[bytes]) -> None:
+        prefix = b'{"conversation_id":"%s","id":' % str(cid).encode()
+        try:
+            async for event_id, data in iter_frames(chunks):
+                await send(prefix + (b"%d" % event_id if event_id is not None else b"null") + b',"event":' + data + b"}")
+                metrics.incr("ws.frames_out")
+            await send(encode_json({"type": "end", "conversation_id": str(cid)}))
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            if subscriptions.get(cid) is asyncio.current_task():
+                del subscriptions[cid]
+
+    async def subscribe(cid: UUID, chunks: AsyncIterator[bytes]) -> None:
+        previous = subscriptions.pop(cid, None)
+        if previous is not None:
+            previous.cancel()
+        if len(subscriptions) >= settings.WS_MAX_SUBSCRIPTIONS:
+            await send_error(cid, "too_many_subscriptions")
+            return
+        subscriptions[cid] = asyncio.create_task(pump(cid, chunks))
+
+    try:
+        while True:
+            raw = await websocket.receive_text()
+            try:
+                msg = json.loads(raw)
+                mtype = msg.get("type")
+                cid = UUID(str(msg.get("conversation_id")))
+            except (ValueError, AttributeError):
+                await send_error(None, "invalid_message")
+                continue
+
+            if mtype == "send":
+                try:
+                    payload = MessageCreate.model_validate(msg)
+                except ValidationError as e:
+                    await send_error(cid, e.errors(include_url=False, include_context=False))
+                    continue
+                try:
+                    # Short-lived session: the socket itself never holds a DB connection
+                    async with AsyncSessionLocal() as db:
+                        conv = await _get_active_conv(db, cid, user.id)
+                        if not conv:
+                            raise HTTPException(status_code=404, detail="Conversation not found")
+                        stream = await _start_generation(db, conv, payload, user)
+                except HTTPException as e:
+                    await send_error(cid, e.detail)
+                    continue
+                except Exception:
+                    # A failed send (DB, persistence, ...) ends this conversation's request, not the socket
+                    logger.exception("ws send for conversation %s failed", cid)
+                    await send_error(cid, "send_failed")
+                    continue
+                await subscribe(cid, stream.follow(0))
+
+            elif mtype in ("stream", "resume"):
+                stream = stream_registry.get(cid, user.id)
+                if stream is None:
+                    await send_error(cid, "No active stream")
+                    continue
+                last_event_id = msg.get("last_event_id") if mtype == "resume" else None
+                if last_event_id is not None and not str(last_event_id).isdigit():
+                    await send_error(cid, "invalid_last_event_id")
+                    continue
+                await subscribe(cid, stream.follow(int(last_event_id) if last_event_id is not None else None))
+
+            elif mtype == "stop":
+                stream = stream_registry.get(cid, user.id)
+                if stream is not None:
+                    # The subscription stays open for the complete/saved events of the partial answer
+                    stream.request_stop()
+
+            else:
+                await send_error(cid, "unknown_message_type")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in subscriptions.values():
+            task.cancel()
@@ -1,9 +1,16 @@
 # backend/app/routers/files.py
+import asyncio
+import datetime
+import errno
 import os
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
 from typing import Annotated, Optional
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, status, Query, Form
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
+from fastapi.responses import FileResponse, Response
+from starlette.requests import ClientDisconnect
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -11,11 +18,22 @@ from app.core.config import settings
 from app.core.database import get_db
 from app.core.deps import get_current_user
 from app.models.conversation import Conversation
-from app.models.document import Document, UserDocument, ConversationDocument
+from app.models.document import Document, UserDocument, ConversationDocument, UploadSession
 from app.models.user import User
-from app.schemas.file import DocumentOut, FileListOut, UsageOut, DocumentUploadResponse
-from app.services.quotas import get_quota_state, can_accept_size, maybe_autorelease, warn_needed
-from app.services.storage import save_upload_to_disk
+from app.schemas.file import (
+    ByteRange, DocumentOut, FileListOut, UsageOut, DocumentUploadResponse, UploadSessionCreate, UploadSessionOut,
+)
+from app.services.quotas import (
+    UploadCheck, get_quota_state, can_accept_size, maybe_autorelease, quota_auto_releaser, quota_ledger,
+    warn_needed,
+)
+from app.services import metrics, upload_sessions
+from app.services.blobs import claim_blob
+from app.services.storage import (
+    CHUNK, ChunkWriter, blob_path, hash_fd, incoming_path, lock_part, preallocate, store_blob, unstore_blob,
+    upload_session_path,
+)
+from app.services.uploads import ReceivedFile, UploadError, UploadQuotaExceeded, receive_multipart_file
 
 router = APIRouter(prefix="/files", tags=["Document Management"])
 
@@ -80,63 +98,104 @@ async def list_my_files(
     )
 
 
-@router.post("/upload", response_model=DocumentUploadResponse, status_code=status.HTTP_201_CREATED)
+# The body is parsed by hand (streamed), so describe the form for the API docs
+_UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["file"],
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "conversation_id": {"type": "string", "format": "uuid"},
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+def _quota_exceeded(check: UploadCheck) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail={
+            "error": "quota_exceeded",
+            "scope": check.scope,
+            "limit_bytes": check.limit_bytes,
+            "would_total": check.would_total,
+            "deficit": check.deficit,
+            "hint": "Please delete documents or conversations, or enable auto-archive.",
+        },
+    )
+
+
+def _declared_length(request: Request) -> int | None:
+    try:
+        length = int(request.headers.get("content-length", ""))
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+@router.post("/upload", response_model=DocumentUploadResponse, status_code=status.HTTP_201_CREATED,
+             openapi_extra=_UPLOAD_FORM_SCHEMA)
 async def upload_file(
+        request: Request,
         db: Annotated[AsyncSession, Depends(get_db)],
         current_user: Annotated[User, Depends(get_current_user)],
-        file: UploadFile = File(...),
-        conversation_id: Optional[UUID] = Form(default=None),
 ):
     """
-    Get the real file size by saving to disk first, then check quota with `fn_can_upload`;
-    if not allowed and auto-archive is enabled → call `fn_autorelease_on_message` to release 20% →
+    Multipart upload (`file`, optional `conversation_id`), streamed to a temp file off the event loop.
+    1) Content-Length is reserved against the cached quota before any byte is read (413 up front)
+    2) The received size is re-checked as it grows; the upload is cut off once it no longer fits
+    3) The final quota check with `fn_can_upload` semantics (auto-archive may release 20%)
+    4) Only then is the file moved into the blob store (or dropped, if that content is
+       already stored) and the Document written
     """
-    # Get the real file size by saving to disk
-    storage_url, size_bytes, sha256_hex = save_upload_to_disk(current_user.id, file.filename, file.file)
+    declared = _declared_length(request)
+    # Multipart framing makes Content-Length a slight overestimate of the file
+    reservation = await quota_ledger.reserve(db, current_user.id, declared or 0)
+    if reservation is None:
+        request_check = await can_accept_size(db, current_user.id, declared or 0)
+        raise _quota_exceeded(request_check)
 
-    # Check quota prediction (pass this size as incoming_size to DB)
-    check = await can_accept_size(db, current_user.id, size_bytes)
-    if not check.allowed:
-        released = await maybe_autorelease(db, current_user.id)
-        if released:
-            check = await can_accept_size(db, current_user.id, size_bytes)
+    temp_path = await asyncio.to_thread(incoming_path, current_user.id)
+    try:
+        try:
+            upload = await receive_multipart_file(
+                request, temp_path, admit=lambda received: reservation.resize(max(received, declared or 0))
+            )
+        except UploadQuotaExceeded as e:
+            raise _quota_exceeded(await can_accept_size(db, current_user.id, e.received))
+        except UploadError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        except ClientDisconnect:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="upload_interrupted")
 
-    if not check.allowed:
-        # Exceeded quota: remove the just-saved file and raise error
         try:
-            os.remove(storage_url)
-        except Exception:
-            pass
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail={
-                "error": "quota_exceeded",
-                "limit_bytes": check.limit_bytes,
-                "would_total": check.would_total,
-                "deficit": check.deficit,
-                "hint": "Please delete documents or conversations, or enable auto-archive.",
-            },
-        )
+            return await _store_upload(db, current_user, upload)
+        finally:
+            # Gone after a move into the blob store; otherwise refused or a duplicate
+            await asyncio.to_thread(upload.temp_path.unlink, missing_ok=True)
+    finally:
+        reservation.release()  # no-op once committed
 
-    # Write Document
-    doc = Document(
-        filename=file.filename,
-        mime_type=file.content_type or "application/octet-stream",
-        size_bytes=size_bytes,
-        storage_url=storage_url,
-        sha256=sha256_hex,
-        status="uploaded",
-    )
-    db.add(doc)
-    await db.flush()  # need doc.id
 
-    # Associate to the current user as owner
-    db.add(UserDocument(user_id=current_user.id, document_id=doc.id, permission="owner"))
+async def _store_upload(db: AsyncSession, current_user: User, upload: ReceivedFile) -> DocumentUploadResponse:
+    conversation_id = None
+    if upload.fields.get("conversation_id"):
+        try:
+            conversation_id = UUID(upload.fields["conversation_id"])
+        except ValueError:
+            raise HTTPException(status_code=422, detail="Invalid conversation_id")
 
-    # Optional: associate to a conversation as context
+    # Before the blob store is touched: a refusal here leaves the received file where it is
     if conversation_id is not None:
         conv = (await db.execute(
-            select(Conversation)
+            select(Conversation.id)
             .where(
                 Conversation.id == conversation_id,
                 Conversation.user_id == current_user.id
@@ -144,9 +203,53 @@ async def upload_file(
         )).scalar_one_or_none()
         if conv is None:
             raise HTTPException(status_code=404, detail="Conversation not found")
-        db.add(ConversationDocument(conversation_id=conversation_id, document_id=doc.id, scope="context"))
 
-    await db.commit()
+    # Check quota with the real size (pass this size as incoming_size to DB)
+    size_bytes = upload.size_bytes
+    check = await can_accept_size(db, current_user.id, size_bytes)
+    if not check.allowed:
+        released = await maybe_autorelease(db, current_user.id)
+        if released:
+            check = await can_accept_size(db, current_user.id, size_bytes)
+
+    if not check.allowed:
+        # Exceeded quota: the caller removes the temp file
+        raise _quota_exceeded(check)
+
+    # Same content already stored: only the rows are new (the row lock keeps the blob from the GC)
+    await claim_blob(db, upload.sha256, size_bytes)
+    wrote_blob = await asyncio.to_thread(store_blob, upload.temp_path, upload.sha256)
+    try:
+        # Write Document
+        doc = Document(
+            filename=upload.filename,
+            mime_type=upload.content_type or "application/octet-stream",
+            size_bytes=size_bytes,
+            storage_url=str(blob_path(upload.sha256)),
+            sha256=upload.sha256,
+            blob_sha256=upload.sha256,
+            status="uploaded",
+        )
+        db.add(doc)
+        await db.flush()  # need doc.id
+
+        # Associate to the current user as owner
+        db.add(UserDocument(user_id=current_user.id, document_id=doc.id, permission="owner"))
+
+        # Optional: associate to a conversation as context
+        if conversation_id is not None:
+            db.add(ConversationDocument(conversation_id=conversation_id, document_id=doc.id, scope="context"))
+
+        await db.commit()
+    except BaseException:
+        # Nothing references a file written by this upload until the commit; the claimed row rolls back
+        if wrote_blob:
+            await asyncio.to_thread(unstore_blob, upload.sha256, upload.temp_path)
+        raise
+    metrics.incr("uploads.blob_written" if wrote_blob else "uploads.deduplicated")
+    quota_ledger.invalidate(current_user.id)
+    if check.limit_bytes > 0 and check.would_total >= check.limit_bytes * settings.QUOTA_AUTORELEASE_HIGH_WATER:
+        quota_auto_releaser.nudge(current_user.id)
     await db.refresh(doc)
 
     # Include quota warning info on success
@@ -161,6 +264,286 @@ async def upload_file(
     )
 
 
+def _session_out(session: UploadSession, ranges: list[tuple[int, int]]) -> UploadSessionOut:
+    return UploadSessionOut(
+        id=session.id,
+        filename=session.filename,
+        size_bytes=session.size_bytes,
+        sha256=session.sha256,
+        status=session.status,
+        received=[ByteRange(start=start, end=end) for start, end in ranges],
+        received_bytes=sum(end - start for start, end in ranges),
+        expires_at=session.expires_at,
+    )
+
+
+@router.post("/uploads", response_model=UploadSessionOut, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+        payload: UploadSessionCreate,
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(get_current_user)],
+):
+    """
+    Start a resumable upload: the file (size, sha256) is announced and preallocated on disk.
+    Its size must fit the quota together with the user's other open sessions.
+    """
+    count, pending_bytes = await upload_sessions.open_sessions(db, current_user.id)
+    if count >= settings.UPLOAD_SESSION_MAX_PER_USER:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="too_many_upload_sessions")
+    check = await can_accept_size(db, current_user.id, pending_bytes + payload.size_bytes)
+    if not check.allowed:
+        raise _quota_exceeded(check)
+
+    session = await upload_sessions.create_session(
+        db, current_user.id, payload.filename, payload.mime_type, payload.size_bytes, payload.sha256,
+        payload.conversation_id,
+    )
+    path = upload_session_path(current_user.id, session.id)
+    try:
+        await asyncio.to_thread(preallocate, path, payload.size_bytes)
+    except OSError as e:
+        if e.errno == errno.ENOSPC:
+            raise HTTPException(status_code=status.HTTP_507_INSUFFICIENT_STORAGE, detail="insufficient_storage")
+        raise
+    try:
+        await db.commit()
+    except BaseException:
+        await asyncio.to_thread(path.unlink, missing_ok=True)
+        raise
+    return _session_out(session, [])
+
+
+@router.get("/uploads/{session_id}", response_model=UploadSessionOut)
+async def get_upload_session(
+        session_id: UUID,
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(get_current_user)],
+):
+    """The byte ranges received so far: a client resuming after a dropped connection sends the rest."""
+    session = await upload_sessions.get_session(db, current_user.id, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return _session_out(session, await upload_sessions.received_ranges(db, session_id))
+
+
+@router.put("/uploads/{session_id}", response_model=UploadSessionOut)
+async def put_upload_chunk(
+        session_id: UUID,
+        request: Request,
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(get_current_user)],
+        offset: int = Query(..., ge=0),
+):
+    """
+    Write the raw request body at `offset` of the session's file (pwrite, off the event loop).
+    Chunks may come in any order and in parallel; a chunk that was cut off is sent again.
+    A chunk is recorded only once all of it is written.
+    """
+    try:
+        writer = await asyncio.to_thread(ChunkWriter, upload_session_path(current_user.id, session_id), offset)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    try:
+        session = await upload_sessions.get_session(db, current_user.id, session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        if session.status != "open":
+            raise HTTPException(status_code=409, detail="upload_session_finalizing")
+        size_bytes = session.size_bytes
+        declared = _declared_length(request)
+        if offset > size_bytes or (declared is not None and offset + declared > size_bytes):
+            raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                                detail="chunk_out_of_range")
+        # Don't hold a pooled connection while the body is in transfer
+        await db.rollback()
+
+        pending = bytearray()
+        try:
+            async for data in request.stream():
+                pending += data
+                if offset + writer.written + len(pending) > size_bytes:
+                    raise HTTPException(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                                        detail="chunk_out_of_range")
+                if len(pending) >= CHUNK:
+                    block = bytes(pending)
+                    pending.clear()
+                    await asyncio.to_thread(writer.write, block)
+        except ClientDisconnect:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="upload_interrupted")
+        if pending:
+            await asyncio.to_thread(writer.write, bytes(pending))
+
+        # Recorded while the shared lock is held: a finalize either sees this chunk or refuses it
+        if writer.written and not await upload_sessions.record_chunk(
+                db, session_id, offset, offset + writer.written):
+            raise HTTPException(status_code=409, detail="upload_session_closed")
+        await db.commit()
+    finally:
+        await asyncio.to_thread(writer.close)
+
+    await db.refresh(session)
+    return _session_out(session, await upload_sessions.received_ranges(db, session_id))
+
+
+@router.post("/uploads/{session_id}/complete", response_model=DocumentUploadResponse,
+             status_code=status.HTTP_201_CREATED)
+async def complete_upload_session(
+        session_id: UUID,
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(get_current_user)],
+):
+    """
+    Finalize a resumable upload once every byte has arrived:
+    1) The session stops taking chunks, and chunk writes in flight are waited for
+    2) The received ranges must cover the file, and its sha256 must match the announced one
+    3) The file then takes the same path as a multipart upload (quota check, blob store,
+       Document); it is renamed into place, not copied
+    A failed finalize reopens the session; after a hash mismatch its ranges are cleared.
+    """
+    session = await upload_sessions.begin_finalize(db, current_user.id, session_id)
+    if session is None:
+        if await upload_sessions.get_session(db, current_user.id, session_id) is None:
+            raise HTTPException(status_code=404, detail="Upload session not found")
+        raise HTTPException(status_code=409, detail="upload_session_finalizing")
+    await db.commit()
+
+    path = upload_session_path(current_user.id, session_id)
+    fd = await asyncio.to_thread(lock_part, path)
+    try:
+        ranges = await upload_sessions.received_ranges(db, session_id)
+        if session.size_bytes and ranges != [(0, session.size_bytes)]:
+            await upload_sessions.reopen(db, session_id)
+            await db.commit()
+            raise HTTPException(status_code=409, detail={
+                "error": "upload_incomplete",
+                "received": [{"start": start, "end": end} for start, end in ranges],
+            })
+        digest = await asyncio.to_thread(hash_fd, fd)
+        if digest != session.sha256:
+            await upload_sessions.clear_ranges(db, session_id)
+            await upload_sessions.reopen(db, session_id)
+            await db.commit()
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                                detail={"error": "sha256_mismatch", "sha256": digest})
+
+        upload = ReceivedFile(
+            filename=session.filename,
+            content_type=session.mime_type,
+            temp_path=path,
+            size_bytes=session.size_bytes,
+            sha256=digest,
+            fields={"conversation_id": str(session.conversation_id)} if session.conversation_id else {},
+        )
+        # Deleted in the transaction that writes the Document. A failure there puts the file back
+        # (see _store_upload), so the session is reopened; it is only dropped if the file is gone
+        await upload_sessions.delete_session(db, session_id)
+        try:
+            response = await _store_upload(db, current_user, upload)
+        except BaseException:
+            await db.rollback()
+            if await asyncio.to_thread(path.exists):
+                await upload_sessions.reopen(db, session_id)
+            else:
+                await upload_sessions.delete_session(db, session_id)
+            await db.commit()
+            raise
+    finally:
+        await asyncio.to_thread(os.close, fd)
+
+    # Still here when that content was already in the blob store
+    await asyncio.to_thread(path.unlink, missing_ok=True)
+    return response
+
+
+@router.delete("/uploads/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload_session(
+        session_id: UUID,
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(get_current_user)],
+):
+    """Abandon a resumable upload and remove its file."""
+    session = await upload_sessions.get_session(db, current_user.id, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if session.status != "open":
+        raise HTTPException(status_code=409, detail="upload_session_finalizing")
+    await upload_sessions.delete_session(db, session_id)
+    await db.commit()
+    await asyncio.to_thread(upload_session_path(current_user.id, session_id).unlink, missing_ok=True)
+
+
+def _not_modified(request: Request, etag: str | None, modified_at: datetime.datetime) -> bool:
+    """Conditional GET (RFC 9110): If-None-Match wins over If-Modified-Since when both are sent."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    # HTTP dates have whole seconds
+    return modified_at.replace(microsecond=0) <= since
+
+
+@router.get("/{document_id}/content", response_class=FileResponse)
+async def download_file(
+        document_id: UUID,
+        request: Request,
+        db: Annotated[AsyncSession, Depends(get_db)],
+        current_user: Annotated[User, Depends(get_current_user)],
+):
+    """
+    The stored file of a document linked to the user (UserDocument).
+    - ETag is the content sha256 and Last-Modified the upload time (stored files never change),
+      so If-None-Match / If-Modified-Since are answered 304 without opening the file
+    - Range requests (one or several ranges, If-Range) are answered 206 by FileResponse
+    - FileResponse hands the file to the server (ASGI pathsend, sendfile) where the server supports it
+    """
+    doc = (await db.execute(
+        select(Document)
+        .join(UserDocument, UserDocument.document_id == Document.id)
+        .where(
+            UserDocument.user_id == current_user.id,
+            Document.id == document_id,
+            Document.status != "deleted",
+        )
+    )).scalar_one_or_none()
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    path = blob_path(doc.blob_sha256) if doc.blob_sha256 else Path(doc.storage_url)
+    filename, mime_type, sha256_hex = doc.filename, doc.mime_type, doc.sha256
+    created_at = doc.created_at if doc.created_at.tzinfo else doc.created_at.replace(tzinfo=datetime.timezone.utc)
+    # Don't hold a pooled connection while the file is sent
+    await db.rollback()
+
+    etag = f'"{sha256_hex}"' if sha256_hex else None
+    headers = {
+        "last-modified": formatdate(created_at.timestamp(), usegmt=True),
+        # Cached by the browser only, and revalidated before every use
+        "cache-control": "private, no-cache",
+    }
+    if etag is not None:
+        headers["etag"] = etag
+    if _not_modified(request, etag, created_at):
+        metrics.incr("downloads.not_modified")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    try:
+        stat_result = await asyncio.to_thread(os.stat, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="File content no longer available")
+    metrics.incr("downloads.served")
+    return FileResponse(path, headers=headers, media_type=mime_type, filename=filename, stat_result=stat_result)
+
+
 @router.delete("/{document_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def soft_delete_file(
         document_id: UUID,
@@ -182,3 +565,4 @@ async def soft_delete_file(
     if doc.status != "deleted":
         doc.status = "deleted"
         await db.commit()
+        quota_ledger.invalidate(current_user.id)
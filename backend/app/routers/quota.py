@@ -25,4 +25,10 @@ async def quota_info(
         "used_doc_bytes": s.used_doc_bytes,
         "used_total_bytes": s.used_total_bytes,
         "used_ratio": s.used_ratio,
+        # The organization's pooled allowance, when it has one
+        "organization": {
+            "organization_id": s.organization_id,
+            "limit_bytes": s.org_limit_bytes,
+            "used_bytes": s.org_used_bytes,
+        } if s.organization_id is not None else None,
     }
@@ -22,11 +22,14 @@ class ConversationOut(BaseModel):
     created_at: datetime
     updated_at: datetime
     storage_size: int | None = None
+    message_count: int = 0
+    last_message_at: Optional[datetime] = None
+    last_message_preview: Optional[str] = None
 
     class Config:
         from_attributes = True
 
-    @field_serializer("created_at", "updated_at")
+    @field_serializer("created_at", "updated_at", "last_message_at")
     def serialize_dt(self, dt: datetime, _info):
         if dt is None:
             return None
@@ -43,7 +46,7 @@ class ConversationRename(BaseModel):
 class MessageCreate(BaseModel):
     content: str = Field(min_length=1, max_length=18000)
     document_ids: List[UUID] = Field(default_factory=list)
-    model_size: Literal["default", "small", "medium", "large"] = "default"
+    model_size: Literal["default", "small", "medium", "large", "auto"] = "default"
 
 
 class MessageOut(BaseModel):
@@ -3,7 +3,7 @@ from datetime import datetime, timezone
 from uuid import UUID
 from zoneinfo import ZoneInfo
 
-from pydantic import BaseModel, field_serializer
+from pydantic import BaseModel, Field, field_serializer
 
 SYDNEY_TZ = ZoneInfo("Australia/Sydney")
 
@@ -46,3 +46,27 @@ class UsageOut(BaseModel):
 class DocumentUploadResponse(BaseModel):
     document: DocumentOut
     quota: dict
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str = Field(min_length=1, max_length=255)
+    mime_type: str = Field(default="application/octet-stream", max_length=255)
+    size_bytes: int = Field(ge=0)
+    sha256: str = Field(pattern=r"^[0-9a-fA-F]{64}$", description="sha256 of the whole file, verified on finalize")
+    conversation_id: UUID | None = None
+
+
+class ByteRange(BaseModel):
+    start: int
+    end: int  # exclusive
+
+
+class UploadSessionOut(BaseModel):
+    id: UUID
+    filename: str
+    size_bytes: int
+    sha256: str
+    status: str
+    received: list[ByteRange]
+    received_bytes: int
+    expires_at: datetime
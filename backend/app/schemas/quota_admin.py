@@ -0,0 +1,57 @@
+# backend/app/schemas/quota_admin.py
+from __future__ import annotations
+
+import uuid
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from app.schemas.user_admin import OrganizationMini
+
+
+class QuotaConsumerOut(BaseModel):
+    user_id: uuid.UUID
+    display_name: Optional[str] = None
+    email: str
+    limit_bytes: int
+    used_conv_bytes: int
+    used_doc_bytes: int
+    used_bytes: int
+    # Share of the organization's usage
+    share: float
+
+
+class OrgQuotaOut(BaseModel):
+    organization: OrganizationMini
+    # None: no pooled allowance, members only have their own limits
+    limit_bytes: Optional[int] = None
+    used_bytes: int
+    used_ratio: Optional[float] = None
+    members: int
+    top_consumers: List[QuotaConsumerOut]
+
+
+class OrgQuotaLimitIn(BaseModel):
+    # None removes the pool
+    limit_bytes: Optional[int] = Field(default=None, ge=0)
+
+
+class QuotaReportRowOut(BaseModel):
+    user_id: uuid.UUID
+    email: str
+    display_name: Optional[str] = None
+    organization: Optional[OrganizationMini] = None
+    limit_bytes: int
+    used_conv_bytes: int
+    used_doc_bytes: int
+    used_bytes: int
+    used_ratio: float
+    # Quota-archived bytes, not part of used_bytes
+    archived_bytes: int
+
+
+class QuotaReportPage(BaseModel):
+    items: List[QuotaReportRowOut]
+    total: int
+    limit: int
+    offset: int
@@ -0,0 +1,116 @@
+# backend/app/services/blobs.py
+"""Content-addressed blob store bookkeeping.
+
+Uploads are stored once per distinct content under blobs/ab/cd/<sha256>; `blob.ref_count`
+counts the documents (not deleted) that use each one and is kept by trg_blob_refs. An
+upload claims its blob row before inserting the Document, which locks the row, so the
+collector cannot remove a blob that is being referenced again: it only deletes rows with
+no references for BLOB_GC_GRACE_S, skipping locked ones, and removes the file before its
+delete commits. An upload that finds the row but not the file writes the file again.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.services import metrics
+from app.services.storage import remove_blob
+
+logger = logging.getLogger(__name__)
+
+# DO UPDATE rather than DO NOTHING: it row-locks an existing blob until the caller commits
+_CLAIM_SQL = text(
+    "INSERT INTO blob (sha256, size_bytes) VALUES (:sha, :size) "
+    "ON CONFLICT (sha256) DO UPDATE SET size_bytes = EXCLUDED.size_bytes"
+)
+_COLLECT_SQL = text(
+    "DELETE FROM blob WHERE sha256 IN ("
+    " SELECT sha256 FROM blob"
+    " WHERE ref_count = 0 AND zero_since < now() - make_interval(secs => :grace_s)"
+    " ORDER BY zero_since LIMIT :n FOR UPDATE SKIP LOCKED"
+    ") RETURNING sha256, size_bytes"
+)
+
+
+async def claim_blob(db: AsyncSession, sha256_hex: str, size_bytes: int) -> None:
+    """Register (or lock) the blob for `sha256_hex` in the caller's transaction, before a Document references it."""
+    await db.execute(_CLAIM_SQL, {"sha": sha256_hex, "size": size_bytes})
+
+
+class BlobCollector:
+    """
+    Garbage collection of the blob store: every BLOB_GC_INTERVAL_S, delete blobs that have had
+    no references for BLOB_GC_GRACE_S, BLOB_GC_BATCH_BLOBS per transaction, files first.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.blobs_removed = 0
+        self.bytes_freed = 0
+        self.last_run_at: float | None = None
+
+    def start(self) -> None:
+        if settings.BLOB_GC_INTERVAL_S > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.BLOB_GC_INTERVAL_S)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("blob garbage collection failed")
+
+    async def run_once(self) -> int:
+        """Remove every unreferenced blob past the grace period; returns how many."""
+        batch = max(1, settings.BLOB_GC_BATCH_BLOBS)
+        removed = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(_COLLECT_SQL, {"grace_s": settings.BLOB_GC_GRACE_S, "n": batch})).fetchall()
+                # Files go before the rows: a crash in between leaves a row without a file,
+                # which the next upload of that content repairs, never a referenced row without one
+                for sha256_hex, _ in rows:
+                    await asyncio.to_thread(remove_blob, sha256_hex)
+                await db.commit()
+            removed += len(rows)
+            self.bytes_freed += sum(int(size) for _, size in rows)
+            if len(rows) < batch:
+                break
+        self.runs += 1
+        self.blobs_removed += removed
+        self.last_run_at = time.time()
+        metrics.incr("blobs.gc_runs")
+        if removed:
+            metrics.incr("blobs.gc_removed", removed)
+        return removed
+
+    def snapshot(self) -> dict:
+        return {
+            "runs": self.runs,
+            "blobs_removed": self.blobs_removed,
+            "bytes_freed": self.bytes_freed,
+            "last_run_at": self.last_run_at,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+# Module-level singleton, started with the app
+blob_collector = BlobCollector()
@@ -0,0 +1,300 @@
+# backend/app/services/history.py
+"""Token-bounded conversation history for chat prompts.
+
+Each conversation keeps a rolling summary (`conversation.summary_md`) of the
+turns that no longer fit the prompt, plus its recent messages. The recent
+window is cached per process and extended in place as new turns are written,
+so a follow-up question neither reloads nor re-tokenizes the whole history.
+Token counts are stored in `message.meta["token_estimate"]` at write time.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import json
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from uuid import UUID
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.conversation import Conversation
+from app.models.message import Message, MessageRole
+from app.services.llm_client import LLMClient, get_client_for
+from app.services.tokens import token_estimator
+
+logger = logging.getLogger(__name__)
+
+_HISTORY_ROLES = (MessageRole.user.value, MessageRole.assistant.value)
+
+
+@dataclass
+class Turn:
+    role: str
+    content: str
+    tokens: int
+    created_at: datetime.datetime
+
+
+@dataclass
+class HistoryWindow:
+    # (conversation.storage_size, conversation.summary_upto) when the window was last in sync
+    version: tuple[int, datetime.datetime | None]
+    summary: str | None
+    summary_upto: datetime.datetime | None
+    # Unsummarized turns, oldest to newest
+    turns: list[Turn] = field(default_factory=list)
+
+
+@dataclass
+class PromptHistory:
+    summary: str | None
+    turns: list[Turn]
+    # Unsummarized tokens that did not fit the budget; > 0 means a summary refresh is due
+    overflow_tokens: int = 0
+
+    def as_messages(self) -> list[dict[str, str]]:
+        messages: list[dict[str, str]] = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"此前对话摘要：\n{self.summary}"})
+        messages.extend({"role": t.role, "content": t.content} for t in self.turns)
+        return messages
+
+
+# Module-level LRU of history windows keyed by conversation id
+_windows: OrderedDict[UUID, HistoryWindow] = OrderedDict()
+# Conversations with a summary refresh in flight, and strong refs to their tasks
+_summarizing: set[UUID] = set()
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _parse_budgets(raw: str | None) -> dict[str, int]:
+    if not raw:
+        return {}
+    try:
+        parsed = json.loads(raw)
+        return {str(k): int(v) for k, v in parsed.items()} if isinstance(parsed, dict) else {}
+    except Exception:
+        return {}
+
+
+def history_budget_for(model_size: str) -> int:
+    budgets = _parse_budgets(settings.CHAT_HISTORY_BUDGETS_JSON)
+    return budgets.get(model_size, budgets.get("default", 1024))
+
+
+def message_token_estimate(content: str, model: str | None = None) -> int:
+    """
+    Token count stored with each message. Estimated from the text rather than taken
+    from usage.output_tokens, which also counts reasoning that is never replayed.
+    """
+    return token_estimator.estimate(content, model)
+
+
+def _conv_version(conv: Conversation) -> tuple[int, datetime.datetime | None]:
+    # storage_size grows by exactly the message bytes on every insert (trg_msg_conv_bytes)
+    return int(conv.storage_size or 0), conv.summary_upto
+
+
+def _cache_put(conversation_id: UUID, window: HistoryWindow) -> None:
+    _windows[conversation_id] = window
+    _windows.move_to_end(conversation_id)
+    while len(_windows) > settings.CHAT_HISTORY_CACHE_SIZE:
+        _windows.popitem(last=False)
+
+
+async def _load_window(db: AsyncSession, conv: Conversation, model: str | None = None) -> HistoryWindow:
+    stmt = (
+        select(Message.role, Message.content_md, Message.meta["token_estimate"].astext, Message.created_at)
+        .where(
+            Message.conversation_id == conv.id,
+            Message.role.in_(_HISTORY_ROLES),
+        )
+        .order_by(Message.created_at.desc())
+        .limit(settings.CHAT_HISTORY_MAX_MESSAGES)
+    )
+    if conv.summary_upto is not None:
+        stmt = stmt.where(Message.created_at > conv.summary_upto)
+
+    rows = list(reversed((await db.execute(stmt)).all()))
+    # Rows written before token estimates were stored are estimated in one batch
+    missing = [i for i, row in enumerate(rows) if not row[2]]
+    estimated = dict(zip(missing, token_estimator.estimate_batch([rows[i][1] for i in missing], model)))
+    turns = [
+        Turn(
+            role=role,
+            content=content,
+            tokens=int(tokens) if tokens else estimated[i],
+            created_at=created_at,
+        )
+        for i, (role, content, tokens, created_at) in enumerate(rows)
+    ]
+    return HistoryWindow(
+        version=_conv_version(conv),
+        summary=conv.summary_md,
+        summary_upto=conv.summary_upto,
+        turns=turns,
+    )
+
+
+async def load_history(
+        db: AsyncSession,
+        conv: Conversation,
+        budget_tokens: int,
+        model: str | None = None,
+) -> PromptHistory:
+    """
+    Prior turns for the prompt: the rolling summary plus the newest messages that
+    fit `budget_tokens`. Call before the current user message is written.
+    """
+    window = _windows.get(conv.id)
+    if window is None or window.version != _conv_version(conv):
+        window = await _load_window(db, conv, model)
+    _cache_put(conv.id, window)
+
+    remaining = budget_tokens - token_estimator.estimate(window.summary, model)
+    picked: list[Turn] = []
+    for turn in reversed(window.turns):
+        if turn.tokens > remaining:
+            break
+        picked.append(turn)
+        remaining -= turn.tokens
+    overflow = sum(t.tokens for t in window.turns[:len(window.turns) - len(picked)])
+    return PromptHistory(summary=window.summary, turns=list(reversed(picked)), overflow_tokens=overflow)
+
+
+def remember_messages(conv: Conversation, messages: list[Message]) -> None:
+    """
+    Extend the cached window after `messages` were committed. Their size_bytes keep
+    the cached version in step with conversation.storage_size.
+    """
+    window = _windows.get(conv.id)
+    if window is None:
+        return
+    if window.version != _conv_version(conv):
+        # Someone else wrote to this conversation meanwhile; reload next time
+        _windows.pop(conv.id, None)
+        return
+    for m in messages:
+        window.turns.append(Turn(
+            role=m.role,
+            content=m.content_md,
+            tokens=int((m.meta or {}).get("token_estimate") or token_estimator.estimate(m.content_md)),
+            created_at=m.created_at,
+        ))
+    del window.turns[:-settings.CHAT_HISTORY_MAX_MESSAGES]
+    added_bytes = sum(int(m.size_bytes or 0) for m in messages)
+    window.version = (window.version[0] + added_bytes, window.version[1])
+
+
+def schedule_summary_refresh(conversation_id: UUID, budget_tokens: int) -> None:
+    """Fold overflowing turns into the rolling summary in the background (at most one per conversation)."""
+    if conversation_id in _summarizing:
+        return
+    _summarizing.add(conversation_id)
+    task = asyncio.create_task(_refresh_summary(conversation_id, budget_tokens))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _unsummarized_pages(
+        db: AsyncSession,
+        conversation_id: UUID,
+        after: datetime.datetime | None,
+        before: datetime.datetime | None,
+):
+    """
+    Messages with after < created_at < before (either bound optional), oldest first, in pages of
+    CHAT_HISTORY_MAX_MESSAGES. The transaction is committed after each page, so no connection
+    is held while the caller summarizes it.
+    """
+    while True:
+        stmt = (
+            select(Message.role, Message.content_md, Message.created_at)
+            .where(
+                Message.conversation_id == conversation_id,
+                Message.role.in_(_HISTORY_ROLES),
+            )
+            .order_by(Message.created_at)
+            .limit(settings.CHAT_HISTORY_MAX_MESSAGES)
+        )
+        if after is not None:
+            stmt = stmt.where(Message.created_at > after)
+        if before is not None:
+            stmt = stmt.where(Message.created_at < before)
+        rows = (await db.execute(stmt)).all()
+        await db.commit()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][2]
+
+
+async def _refresh_summary(conversation_id: UUID, budget_tokens: int) -> None:
+    try:
+        async with AsyncSessionLocal() as db:
+            conv = (await db.execute(
+                select(Conversation).where(Conversation.id == conversation_id)
+            )).scalar_one_or_none()
+            if conv is None:
+                return
+            window = await _load_window(db, conv)
+            await db.commit()  # release the connection while the model writes the summary
+
+            # Keep the newest turns that fit half the budget, so the next few turns don't
+            # immediately trigger another refresh; everything older is folded.
+            keep_tokens = 0
+            kept = 0
+            for turn in reversed(window.turns):
+                if keep_tokens + turn.tokens > budget_tokens // 2:
+                    break
+                keep_tokens += turn.tokens
+                kept += 1
+            if kept == len(window.turns):
+                return
+            # The window holds only the newest CHAT_HISTORY_MAX_MESSAGES: unsummarized turns
+            # older than it are folded too, so the fold is paged from summary_upto onwards
+            before = window.turns[len(window.turns) - kept].created_at if kept else None
+            last_folded = window.turns[len(window.turns) - kept - 1].created_at
+
+            client, _, _ = get_client_for(settings.CHAT_SUMMARY_MODEL_SIZE)
+            if not isinstance(client, LLMClient):
+                return
+            summary = window.summary
+            upto = window.summary_upto
+            async for rows in _unsummarized_pages(db, conversation_id, window.summary_upto, before):
+                folded = await client.summarize_turns(
+                    summary,
+                    [{"role": role, "content": content} for role, content, _ in rows],
+                )
+                if not folded:
+                    break
+                summary = folded
+                upto = rows[-1][2]
+                if upto >= last_folded:
+                    break
+            if upto == window.summary_upto:
+                return
+
+            result = await db.execute(
+                update(Conversation)
+                .where(
+                    Conversation.id == conversation_id,
+                    # Another worker may have folded these turns already
+                    Conversation.summary_upto.is_not_distinct_from(window.summary_upto),
+                )
+                .values(summary_md=summary, summary_upto=upto)
+            )
+            await db.commit()
+            if result.rowcount:
+                # Version changes with summary_upto, so every cached window reloads once
+                _windows.pop(conversation_id, None)
+    except Exception:
+        logger.exception("history summary refresh failed for conversation %s", conversation_id)
+    finally:
+        _summarizing.discard(conversation_id)
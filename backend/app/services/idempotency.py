@@ -0,0 +1,220 @@
+# backend/app/services/idempotency.py
+"""Idempotency-Key support for the message POST endpoints.
+
+Clients and proxies retry a send on timeout; without a key every retry runs a
+new generation and stores a second copy of the user message. A key is claimed
+in the same transaction that commits the user message, so a concurrent retry
+blocks on the row until the original is committed and then finds it. The
+writer marks the key completed in the transaction that saves the assistant
+message, and releases it whenever the turn is discarded, so a failed attempt
+can simply be retried. Keys are scoped per user and expire after
+IDEMPOTENCY_TTL_S; a background sweeper deletes expired ones.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import hashlib
+import logging
+import time
+from uuid import UUID
+
+from pydantic import BaseModel
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.idempotency import IdempotencyKey
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyKeyMismatch(Exception):
+    """The key was already used for a different request."""
+
+
+def request_fingerprint(endpoint: str, conversation_id: UUID, payload: BaseModel) -> str:
+    raw = f"{endpoint}|{conversation_id}|{payload.model_dump_json()}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def claim(
+        db: AsyncSession,
+        user_id: UUID,
+        key: str,
+        request_hash: str,
+        conversation_id: UUID,
+) -> IdempotencyKey | None:
+    """
+    Take `key` for this request inside the caller's (uncommitted) transaction.
+    Returns None when the caller now owns the key and must complete or release it,
+    otherwise the record of the original request. Expired keys, and in-progress keys
+    older than IDEMPOTENCY_IN_FLIGHT_TIMEOUT_S (their request died), are taken over.
+    """
+    ttl = datetime.timedelta(seconds=settings.IDEMPOTENCY_TTL_S)
+    stale = datetime.timedelta(seconds=settings.IDEMPOTENCY_IN_FLIGHT_TIMEOUT_S)
+    stmt = pg_insert(IdempotencyKey).values(
+        user_id=user_id,
+        key=key,
+        request_hash=request_hash,
+        conversation_id=conversation_id,
+        status="in_progress",
+        expires_at=func.now() + ttl,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[IdempotencyKey.user_id, IdempotencyKey.key],
+        set_={
+            "request_hash": stmt.excluded.request_hash,
+            "conversation_id": stmt.excluded.conversation_id,
+            "status": "in_progress",
+            "user_message_id": None,
+            "assistant_message_id": None,
+            "created_at": func.now(),
+            "expires_at": stmt.excluded.expires_at,
+        },
+        where=or_(
+            IdempotencyKey.expires_at < func.now(),
+            and_(IdempotencyKey.status == "in_progress", IdempotencyKey.created_at < func.now() - stale),
+        ),
+    ).returning(IdempotencyKey.key)
+    if (await db.execute(stmt)).first() is not None:
+        metrics.incr("idempotency.claimed")
+        return None
+
+    original = (
+        await db.execute(
+            select(IdempotencyKey).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        )
+    ).scalar_one()
+    if original.request_hash != request_hash:
+        metrics.incr("idempotency.mismatched")
+        raise IdempotencyKeyMismatch()
+    metrics.incr("idempotency.retried")
+    return original
+
+
+async def complete(
+        db: AsyncSession,
+        user_id: UUID,
+        key: str,
+        user_message_id: UUID,
+        assistant_message_id: UUID,
+) -> None:
+    """Record the turn a key produced; committed together with the assistant message."""
+    await db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        .values(
+            status="completed",
+            user_message_id=user_message_id,
+            assistant_message_id=assistant_message_id,
+            expires_at=func.now() + datetime.timedelta(seconds=settings.IDEMPOTENCY_TTL_S),
+        )
+    )
+
+
+async def release(db: AsyncSession, user_id: UUID, key: str) -> None:
+    """Forget an in-progress key whose turn was discarded, so a retry runs it again."""
+    await db.execute(
+        delete(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id,
+               IdempotencyKey.key == key,
+               IdempotencyKey.status == "in_progress")
+    )
+
+
+class IdempotencyKeySweeper:
+    """Every IDEMPOTENCY_PURGE_INTERVAL_S, delete expired keys off the request path."""
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.keys_purged = 0
+        self.last_run_at: float | None = None
+
+    def start(self) -> None:
+        if settings.IDEMPOTENCY_PURGE_INTERVAL_S > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.IDEMPOTENCY_PURGE_INTERVAL_S)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("idempotency key sweep failed")
+
+    async def run_once(self) -> int:
+        """Delete every expired key; returns how many. claim() takes over expired keys it meets first."""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < func.now()))
+            await db.commit()
+        purged = result.rowcount or 0
+        self.runs += 1
+        self.keys_purged += purged
+        self.last_run_at = time.time()
+        if purged:
+            metrics.incr("idempotency.purged", purged)
+        return purged
+
+    def snapshot(self) -> dict:
+        return {
+            "runs": self.runs,
+            "keys_purged": self.keys_purged,
+            "last_run_at": self.last_run_at,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+class InFlightRequests:
+    """
+    Non-stream requests running in this process, by (user, key): a retry arriving
+    while the original still waits for the model awaits the same result. (Streams
+    attach through the stream registry instead.)
+    """
+
+    def __init__(self):
+        self._futures: dict[tuple[UUID, str], asyncio.Future] = {}
+
+    def start(self, user_id: UUID, key: str) -> None:
+        future = asyncio.get_running_loop().create_future()
+        # Nobody may be waiting on a failed request; don't log its exception as unretrieved
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._futures[(user_id, key)] = future
+
+    def finish(self, user_id: UUID, key: str, result=None, error: BaseException | None = None) -> None:
+        future = self._futures.pop((user_id, key), None)
+        if future is None or future.done():
+            return
+        if isinstance(error, asyncio.CancelledError):
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def get(self, user_id: UUID, key: str) -> asyncio.Future | None:
+        return self._futures.get((user_id, key))
+
+    def snapshot(self) -> dict:
+        return {"in_flight": len(self._futures)}
+
+
+# Module-level singletons: in_flight is shared by the message routes, the sweeper is started with the app
+in_flight = InFlightRequests()
+idempotency_sweeper = IdempotencyKeySweeper()
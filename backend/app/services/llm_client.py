@@ -8,16 +8,28 @@ from typing import Any, Tuple, AsyncGenerator, Optional, Dict
 import httpx
 
 from app.core.config import settings
+from app.services.llm_load import load_tracker
+from app.services.tokens import token_estimator
 
 
 class LLMClient:
     """Simple Ollama client used by chat routes."""
 
-    def __init__(self, base_url: str, model: str, timeout: float = 60.0, options: dict | None = None):
+    def __init__(
+            self,
+            base_url: str,
+            model: str,
+            timeout: float = 60.0,
+            options: dict | None = None,
+            num_ctx_ladder: list[int] | None = None,
+            output_reserve_tokens: int = 1024,
+    ):
         self.base_url = base_url.rstrip("/")
         self.model = model
         self.timeout = timeout
         self.options = options or {}
+        self.num_ctx_ladder = sorted(num_ctx_ladder or [])
+        self.output_reserve_tokens = output_reserve_tokens
 
     # === Helper Methods ===
     def _build_payload(
@@ -28,6 +40,7 @@ class LLMClient:
             *,
             stream: bool,
             context: str | None = None,
+            history: list[dict[str, str]] | None = None,
     ) -> Dict[str, Any]:
         system_msg = (
             "你是一名晶科能源中文助理，优先使用提供的检索上下文回答。"
@@ -49,6 +62,10 @@ class LLMClient:
                 ),
             })
 
+        # Earlier turns (rolling summary first, then recent messages), oldest to newest
+        if history:
+            messages.extend(history)
+
         messages.append({"role": "user", "content": user_message})
 
         payload = {
@@ -57,11 +74,41 @@ class LLMClient:
             "messages": messages,
         }
 
-        if self.options:
-            payload["options"] = self.options
+        options = dict(self.options)
+        num_ctx = self._pick_num_ctx(messages)
+        if num_ctx:
+            options["num_ctx"] = num_ctx
+        if options:
+            payload["options"] = options
 
         return payload
 
+    def _pick_num_ctx(self, messages: list[dict[str, Any]]) -> int | None:
+        """
+        Smallest bucket from the configured ladder that fits the estimated prompt
+        plus the expected output (`num_predict` if set, else the configured reserve).
+        Falls back to the largest bucket; None keeps the static options untouched, which
+        includes an explicit `num_ctx` in OLLAMA_OPTIONS_JSON (it always wins over the ladder).
+        """
+        if not self.num_ctx_ladder or self.options.get("num_ctx"):
+            return None
+        expected_output = int(self.options.get("num_predict") or 0)
+        if expected_output <= 0:
+            expected_output = self.output_reserve_tokens
+        needed = token_estimator.estimate_messages(messages, self.model) + expected_output
+        for bucket in self.num_ctx_ladder:
+            if bucket >= needed:
+                return bucket
+        return self.num_ctx_ladder[-1]
+
+    @staticmethod
+    def _record_num_ctx(usage: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+        # Keep the chosen context window next to the token counts it produced
+        num_ctx = (payload.get("options") or {}).get("num_ctx")
+        if num_ctx:
+            usage["num_ctx"] = int(num_ctx)
+        return usage
+
     @staticmethod
     def _extract_message_content(data: Dict[str, Any]) -> str:
         message = data.get("message")
@@ -94,6 +141,16 @@ class LLMClient:
         total_duration_ns = float(data.get("total_duration") or 0.0)
         return total_duration_ns / 1_000_000.0 if total_duration_ns else 0.0
 
+    @staticmethod
+    def _extract_decode_ms(data: Dict[str, Any]) -> float:
+        # Prefer the pure decode time; fall back to the whole request duration
+        eval_duration_ns = float(data.get("eval_duration") or data.get("total_duration") or 0.0)
+        return eval_duration_ns / 1_000_000.0
+
+    @staticmethod
+    def _extract_prompt_ms(data: Dict[str, Any]) -> float:
+        return float(data.get("prompt_eval_duration") or 0.0) / 1_000_000.0
+
     @staticmethod
     def _extract_reasoning_content(data: Dict[str, Any]) -> str:
         message = data.get("message")
@@ -118,23 +175,35 @@ class LLMClient:
             organization_name: str | None,
             *,
             context: str | None = None,
+            history: list[dict[str, str]] | None = None,
     ) -> Tuple[str, Dict[str, Any], float | None, str]:
         """
         Call Ollama /api/chat with stream disabled.
         return (llm_answer, usage_dict, latency_ms, reasoning)
         """
         url = f"{self.base_url}/api/chat"
-        payload = self._build_payload(user_message, user_name, organization_name, stream=False, context=context)
+        payload = self._build_payload(
+            user_message, user_name, organization_name, stream=False, context=context, history=history
+        )
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
-            res = await client.post(url, json=payload)
-            res.raise_for_status()
-            data = res.json()
-            answer = self._extract_message_content(data)
-            usage = self._build_usage(data)
-            latency_ms = self._extract_latency_ms(data)
-            reasoning = self._extract_reasoning_content(data)
-            return answer, usage, latency_ms, reasoning
+        output_tokens, decode_ms, prompt_tokens, prompt_ms = 0, 0.0, 0, 0.0
+        load_tracker.started(self.model)
+        try:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                res = await client.post(url, json=payload)
+                res.raise_for_status()
+                data = res.json()
+                answer = self._extract_message_content(data)
+                usage = self._record_num_ctx(self._build_usage(data), payload)
+                latency_ms = self._extract_latency_ms(data)
+                reasoning = self._extract_reasoning_content(data)
+                output_tokens, decode_ms = usage["output_tokens"], self._extract_decode_ms(data)
+                prompt_tokens, prompt_ms = usage["input_tokens"], self._extract_prompt_ms(data)
+                token_estimator.observe_prompt(self.model, payload["messages"], prompt_tokens)
+                token_estimator.observe_output(self.model, reasoning + answer, output_tokens)
+                return answer, usage, latency_ms, reasoning
+        finally:
+            load_tracker.finished(self.model, output_tokens, decode_ms, prompt_tokens, prompt_ms)
 
     # === Streaming reply ===
     async def assist_stream_reply(
@@ -144,14 +213,20 @@ class LLMClient:
             organization_name: str | None,
             *,
             context: str | None = None,
+            history: list[dict[str, str]] | None = None,
     ) -> AsyncGenerator[dict, None]:
         """
         Connect to Ollama /api/chat with streaming enabled and normalize events
         to delta/complete/error for the chat router.
         """
         url = f"{self.base_url}/api/chat"
-        payload = self._build_payload(user_message, user_name, organization_name, stream=True, context=context)
+        payload = self._build_payload(
+            user_message, user_name, organization_name, stream=True, context=context, history=history
+        )
 
+        output_tokens, decode_ms, prompt_tokens, prompt_ms = 0, 0.0, 0, 0.0
+        generated: list[str] = []
+        load_tracker.started(self.model)
         try:
             async with httpx.AsyncClient(timeout=None) as client:
                 async with client.stream("POST", url, json=payload, timeout=self.timeout) as res:
@@ -175,10 +250,16 @@ class LLMClient:
                             return
 
                         if raw_event.get("done"):
-                            usage = self._build_usage(raw_event)
+                            usage = self._record_num_ctx(self._build_usage(raw_event), payload)
                             latency_ms = self._extract_latency_ms(raw_event)
                             final_answer = self._extract_message_content(raw_event)
                             reasoning = self._extract_reasoning_content(raw_event)
+                            output_tokens, decode_ms = usage["output_tokens"], self._extract_decode_ms(raw_event)
+                            prompt_tokens, prompt_ms = usage["input_tokens"], self._extract_prompt_ms(raw_event)
+                            token_estimator.observe_prompt(self.model, payload["messages"], prompt_tokens)
+                            token_estimator.observe_output(
+                                self.model, "".join(generated) + reasoning + final_answer, output_tokens
+                            )
                             complete_event: Dict[str, Any] = {
                                 "type": "complete",
                                 "usage": usage,
@@ -193,16 +274,52 @@ class LLMClient:
 
                         delta = self._extract_message_content(raw_event)
                         if delta:
+                            generated.append(delta)
                             yield {"type": "delta", "delta": delta}
 
                         reasoning_delta = self._extract_reasoning_content(raw_event)
                         if reasoning_delta:
+                            generated.append(reasoning_delta)
                             yield {"type": "thinking", "delta": reasoning_delta}
 
         except httpx.HTTPError as e:
             yield {"type": "error", "error": f"http_error: {str(e)}"}
         except Exception as e:
             yield {"type": "error", "error": f"stream_error: {str(e)}"}
+        finally:
+            load_tracker.finished(self.model, output_tokens, decode_ms, prompt_tokens, prompt_ms)
+
+    # === Rolling conversation summary ===
+    async def summarize_turns(self, previous_summary: str | None, turns: list[dict[str, str]]) -> str:
+        """
+        Fold `turns` into the previous summary with one non-stream call.
+        return the new summary text
+        """
+        transcript = "\n".join(f"{t['role']}: {t['content']}" for t in turns)
+        payload = {
+            "model": self.model,
+            "stream": False,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": (
+                        "你负责压缩对话历史。请把已有摘要和新增对话合并成一份简体中文摘要，"
+                        "保留用户的目标、关键事实、数字和已给出的结论，不超过 300 字，只输出摘要本身。"
+                    ),
+                },
+                {
+                    "role": "user",
+                    "content": f"已有摘要：\n{previous_summary or '（无）'}\n\n新增对话：\n{transcript}",
+                },
+            ],
+        }
+        if self.options:
+            payload["options"] = dict(self.options)
+
+        async with httpx.AsyncClient(timeout=self.timeout) as client:
+            res = await client.post(f"{self.base_url}/api/chat", json=payload)
+            res.raise_for_status()
+            return self._extract_message_content(res.json()).strip()
 
 
 class MockLLMClient:
@@ -229,7 +346,11 @@ class MockLLMClient:
             user_message: str,
             user_name: str | None,
             organization_name: str | None,
+            *,
+            context: str | None = None,
+            history: list[dict[str, str]] | None = None,
     ) -> Tuple[str, Dict[str, Any], float | None, str]:
+        # The mock answers from the question alone; context/history are accepted for interface parity
         url = f"{self.base_url}/chat_no_stream"
         payload = {
             "question": user_message,
@@ -252,6 +373,9 @@ class MockLLMClient:
             user_message: str,
             user_name: str | None,
             organization_name: str | None,
+            *,
+            context: str | None = None,
+            history: list[dict[str, str]] | None = None,
     ) -> AsyncGenerator[dict, None]:
         url = f"{self.base_url}/chat"
         payload = {
@@ -313,6 +437,20 @@ def _parse_ollama_options(raw: str | None) -> dict:
         return {}
 
 
+def _parse_num_ctx_ladder(raw: str | None) -> list[int]:
+    if not raw:
+        return []
+    ladder: list[int] = []
+    for part in raw.split(","):
+        try:
+            value = int(part.strip())
+        except ValueError:
+            continue
+        if value > 0:
+            ladder.append(value)
+    return sorted(set(ladder))
+
+
 def _get_ollama_client(model: str) -> LLMClient:
     key = f"ollama:{model}"
     if key not in _clients:
@@ -321,6 +459,8 @@ def _get_ollama_client(model: str) -> LLMClient:
             model,
             settings.OLLAMA_TIMEOUT,
             _parse_ollama_options(settings.OLLAMA_OPTIONS_JSON),
+            _parse_num_ctx_ladder(settings.OLLAMA_NUM_CTX_LADDER),
+            settings.OLLAMA_NUM_CTX_OUTPUT_RESERVE,
         )
     return _clients[key]  # type: ignore[return-value]
 
@@ -332,9 +472,49 @@ def _get_mock_client() -> MockLLMClient:
     return _clients[key]  # type: ignore[return-value]
 
 
-def get_client_for(model_size: str | None) -> tuple[LLMClient | MockLLMClient, str, str]:
+def _ollama_model_map() -> dict[str, str]:
+    # Ordered from largest to smallest; "auto" walks it top-down
+    return {
+        "large": settings.OLLAMA_MODEL_LARGE or settings.OLLAMA_MODEL,
+        "medium": settings.OLLAMA_MODEL_MEDIUM or settings.OLLAMA_MODEL,
+        "small": settings.OLLAMA_MODEL_SMALL or settings.OLLAMA_MODEL,
+    }
+
+
+def _pick_auto_size(model_map: dict[str, str], prompt_text: str | None = None) -> str:
+    """
+    Pick the largest preset whose estimated wait (live queue depth x recent tokens/sec,
+    plus prompt evaluation of `prompt_text`) fits OLLAMA_AUTO_LATENCY_SLO_MS. Models
+    without a throughput sample yet count as fitting only while idle. If nothing fits,
+    fall back to the shortest estimated wait.
+    """
+    best_size, best_wait = "small", float("inf")
+    for size, model in model_map.items():
+        wait_ms = load_tracker.estimate_wait_ms(
+            model,
+            settings.OLLAMA_AUTO_EXPECTED_OUTPUT_TOKENS,
+            settings.OLLAMA_NUM_PARALLEL,
+            prompt_tokens=token_estimator.estimate(prompt_text, model),
+        )
+        if wait_ms is None:
+            if load_tracker.in_flight(model) == 0:
+                return size
+            continue
+        if wait_ms <= settings.OLLAMA_AUTO_LATENCY_SLO_MS:
+            return size
+        if wait_ms < best_wait:
+            best_size, best_wait = size, wait_ms
+    return best_size
+
+
+def get_client_for(
+        model_size: str | None,
+        prompt_text: str | None = None,
+) -> tuple[LLMClient | MockLLMClient, str, str]:
     """
     Resolve the requested model preset to a concrete client and model label.
+    "auto" resolves to the concrete preset chosen by load (see `_pick_auto_size`);
+    `prompt_text` lets it account for prompt evaluation time.
 
     Returns (client, resolved_model_name, resolved_size)
     """
@@ -343,11 +523,9 @@ def get_client_for(model_size: str | None) -> tuple[LLMClient | MockLLMClient, s
     if normalized_size == "default":
         return _get_mock_client(), "mock_llm", "default"
 
-    model_map = {
-        "small": settings.OLLAMA_MODEL_SMALL or settings.OLLAMA_MODEL,
-        "medium": settings.OLLAMA_MODEL_MEDIUM or settings.OLLAMA_MODEL,
-        "large": settings.OLLAMA_MODEL_LARGE or settings.OLLAMA_MODEL,
-    }
+    model_map = _ollama_model_map()
+    if normalized_size == "auto":
+        normalized_size = _pick_auto_size(model_map, prompt_text)
 
     resolved_model = model_map.get(normalized_size, settings.OLLAMA_MODEL)
     return _get_ollama_client(resolved_model), resolved_model, normalized_size
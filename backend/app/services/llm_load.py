@@ -0,0 +1,94 @@
+# backend/app/services/llm_load.py
+"""In-process load tracking for Ollama-backed models.
+
+Keeps a per-model count of in-flight requests and an EWMA of the recent
+decode throughput (tokens/sec) so that `get_client_for("auto")` can
+estimate how long a new request would wait for its answer.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+
+@dataclass
+class ModelLoad:
+    in_flight: int = 0
+    completed: int = 0
+    tokens_per_sec: float | None = None
+    prompt_tokens_per_sec: float | None = None
+
+
+class LoadTracker:
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self._models: dict[str, ModelLoad] = {}
+
+    def _get(self, model: str) -> ModelLoad:
+        load = self._models.get(model)
+        if load is None:
+            load = self._models[model] = ModelLoad()
+        return load
+
+    def started(self, model: str) -> None:
+        self._get(model).in_flight += 1
+
+    def _ewma(self, current: float | None, tokens: int, ms: float) -> float | None:
+        if tokens <= 0 or ms <= 0:
+            return current
+        sample = tokens / (ms / 1000.0)
+        return sample if current is None else self.alpha * sample + (1 - self.alpha) * current
+
+    def finished(
+            self,
+            model: str,
+            output_tokens: int = 0,
+            decode_ms: float = 0.0,
+            prompt_tokens: int = 0,
+            prompt_ms: float = 0.0,
+    ) -> None:
+        load = self._get(model)
+        load.in_flight = max(0, load.in_flight - 1)
+        if output_tokens > 0 and decode_ms > 0:
+            load.completed += 1
+        load.tokens_per_sec = self._ewma(load.tokens_per_sec, output_tokens, decode_ms)
+        load.prompt_tokens_per_sec = self._ewma(load.prompt_tokens_per_sec, prompt_tokens, prompt_ms)
+
+    def in_flight(self, model: str) -> int:
+        return self._get(model).in_flight
+
+    def estimate_wait_ms(
+            self,
+            model: str,
+            expected_tokens: int,
+            parallel: int = 1,
+            prompt_tokens: int = 0,
+    ) -> float | None:
+        """
+        Estimated time until a new request on `model` has produced `expected_tokens`.
+        Requests already in flight are assumed to need the same amount of decoding,
+        served `parallel` at a time; the new request also pays for evaluating its
+        `prompt_tokens`. Returns None when no throughput sample exists yet.
+        """
+        load = self._get(model)
+        if not load.tokens_per_sec:
+            return None
+        per_request_ms = expected_tokens / load.tokens_per_sec * 1000.0
+        queued_rounds = load.in_flight // max(1, parallel)
+        prompt_ms = prompt_tokens / load.prompt_tokens_per_sec * 1000.0 if load.prompt_tokens_per_sec else 0.0
+        return (queued_rounds + 1) * per_request_ms + prompt_ms
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            model: {
+                "in_flight": load.in_flight,
+                "completed": load.completed,
+                "tokens_per_sec": round(load.tokens_per_sec, 2) if load.tokens_per_sec else None,
+                "prompt_tokens_per_sec": round(load.prompt_tokens_per_sec, 2) if load.prompt_tokens_per_sec else None,
+            }
+            for model, load in self._models.items()
+        }
+
+
+# Module-level singleton shared by all LLM clients in this process
+load_tracker = LoadTracker()
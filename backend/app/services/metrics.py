@@ -0,0 +1,37 @@
+# backend/app/services/metrics.py
+"""Process-local runtime metrics served by GET /metrics.
+
+Counters are plain numbers bumped on the hot path; collectors are callables
+sampled only when the endpoint is read (pool occupancy, model load, ...).
+Each worker process reports its own numbers.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import Callable
+
+_counters: dict[str, float] = {}
+_collectors: dict[str, Callable[[], dict]] = {}
+_started_at = time.monotonic()
+
+
+def incr(name: str, value: float = 1) -> None:
+    _counters[name] = _counters.get(name, 0) + value
+
+
+def register_collector(name: str, fn: Callable[[], dict]) -> None:
+    _collectors[name] = fn
+
+
+def snapshot() -> dict:
+    out: dict = {
+        "uptime_s": round(time.monotonic() - _started_at, 1),
+        "counters": dict(_counters),
+    }
+    for name, fn in _collectors.items():
+        try:
+            out[name] = fn()
+        except Exception as e:
+            out[name] = {"error": str(e)}
+    return out
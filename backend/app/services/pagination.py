@@ -0,0 +1,51 @@
+# backend/app/services/pagination.py
+"""Keyset (cursor) pagination helpers.
+
+Pages are ordered on (timestamp, id) and the cursor encodes the last row of
+the previous page, so fetching page N costs the same as page 1 and rows
+inserted meanwhile neither shift nor duplicate entries.
+"""
+
+from __future__ import annotations
+
+import base64
+import datetime
+from uuid import UUID
+
+from sqlalchemy import and_, or_
+from sqlalchemy.sql.elements import ColumnElement
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(ts: datetime.datetime, row_id: UUID) -> str:
+    raw = f"{ts.isoformat()}|{row_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, UUID]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts_raw, id_raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.datetime.fromisoformat(ts_raw), UUID(id_raw)
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor("invalid cursor") from e
+
+
+def keyset_after(
+        ts_col,
+        id_col,
+        ts: datetime.datetime,
+        row_id: UUID,
+        descending: bool = True,
+) -> ColumnElement[bool]:
+    """
+    Rows strictly after (ts, row_id) in the page order. The plain `ts <=` / `ts >=`
+    bound is redundant but lets the planner turn it into an index range on
+    (…, ts) indexes; the OR only settles ties on the timestamp.
+    """
+    if descending:
+        return and_(ts_col <= ts, or_(ts_col < ts, and_(ts_col == ts, id_col < row_id)))
+    return and_(ts_col >= ts, or_(ts_col > ts, and_(ts_col == ts, id_col > row_id)))
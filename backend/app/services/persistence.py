@@ -0,0 +1,241 @@
+# backend/app/services/persistence.py
+"""Write-behind persistence for streamed chat turns.
+
+The SSE relay hands each finished answer to `write_behind` and returns to the
+client right away. A single background writer drains the queue in batches:
+one session and one transaction per batch, a savepoint per turn for its quota
+check and insert, and a future per turn that resolves to the saved message id
+(or an error code) for the relay's `saved` event. Transient DB errors retry the
+whole batch; the backlog is bounded, so a stalled database slows new streams
+down at submit time instead of growing memory without limit.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Callable
+from uuid import UUID
+
+from sqlalchemy import delete
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.message import Message
+from app.services import idempotency, metrics
+from app.services.quotas import QuotaReservation, ensure_quota_for, ensure_reserved
+
+logger = logging.getLogger(__name__)
+
+# serialization_failure, deadlock_detected, lock_not_available, admin_shutdown, connection_* classes
+_TRANSIENT_SQLSTATES = {"40001", "40P01", "55P03", "57P01", "08000", "08003", "08006"}
+_RETRY_BASE_DELAY_S = 0.05
+
+
+class PersistenceBacklogFull(Exception):
+    """The writer is too far behind; the turn was not queued."""
+
+
+@dataclass
+class SaveResult:
+    message_id: UUID | None = None
+    error: str | None = None
+
+
+@dataclass
+class PendingTurn:
+    user_id: UUID
+    # Already committed user message of this turn; removed again if the turn cannot be saved
+    user_message_id: UUID
+    # None when generation failed and only the user message has to be discarded
+    assistant: Message | None
+    # Runs after the batch holding this turn committed (cache updates, follow-up jobs)
+    on_saved: Callable[[Message], None] | None = None
+    # Idempotency-Key of the request: completed with the insert, released with a discard
+    idempotency_key: str | None = None
+    # Quota held for this turn since before generation, and the turn's actual user + assistant bytes
+    reservation: QuotaReservation | None = None
+    turn_bytes: int = 0
+    future: asyncio.Future | None = field(default=None, repr=False)
+
+
+def _is_transient(exc: BaseException) -> bool:
+    if isinstance(exc, PoolTimeoutError):
+        return True
+    if isinstance(exc, DBAPIError):
+        if exc.connection_invalidated or isinstance(exc, (OperationalError, InterfaceError)):
+            return True
+        code = getattr(exc.orig, "sqlstate", None) or getattr(exc.orig, "pgcode", None)
+        return code in _TRANSIENT_SQLSTATES
+    return isinstance(exc, (ConnectionError, asyncio.TimeoutError))
+
+
+class WriteBehindQueue:
+    def __init__(self):
+        self._queue: asyncio.Queue[PendingTurn] | None = None
+        self._task: asyncio.Task | None = None
+        self._writing = 0
+
+    def _ensure_started(self) -> asyncio.Queue[PendingTurn]:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=max(1, settings.WRITE_BEHIND_MAX_BACKLOG))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._queue
+
+    async def submit(self, turn: PendingTurn) -> asyncio.Future:
+        """
+        Queue a finished turn and return a future resolving to its SaveResult.
+        Waits up to WRITE_BEHIND_SUBMIT_TIMEOUT for backlog space, then raises PersistenceBacklogFull.
+        """
+        queue = self._ensure_started()
+        turn.future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(queue.put(turn), timeout=settings.WRITE_BEHIND_SUBMIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            metrics.incr("write_behind.rejected")
+            raise PersistenceBacklogFull() from None
+        metrics.incr("write_behind.submitted")
+        return turn.future
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Flush what is queued (bounded by `timeout`), then stop the writer."""
+        if self._queue is not None and self._task is not None and not self._task.done():
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("write-behind queue not drained on shutdown: %d turns left", self._queue.qsize())
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> dict:
+        return {
+            "backlog": self._queue.qsize() if self._queue is not None else 0,
+            "max_backlog": settings.WRITE_BEHIND_MAX_BACKLOG,
+            "writing": self._writing,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+    # === Writer ===
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            if settings.WRITE_BEHIND_MAX_DELAY_MS > 0 and 0 < queue.qsize() < settings.WRITE_BEHIND_BATCH_SIZE - 1:
+                # Turns are arriving together: give the rest a moment to share the transaction.
+                # A lone turn on an idle server is written right away.
+                await asyncio.sleep(settings.WRITE_BEHIND_MAX_DELAY_MS / 1000)
+            while len(batch) < settings.WRITE_BEHIND_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            self._writing = len(batch)
+            try:
+                await self._write_with_retry(batch)
+            finally:
+                self._writing = 0
+                for _ in batch:
+                    queue.task_done()
+
+    async def _write_with_retry(self, batch: list[PendingTurn]) -> None:
+        attempts = max(1, settings.WRITE_BEHIND_MAX_RETRIES)
+        results: list[SaveResult] = []
+        for attempt in range(1, attempts + 1):
+            try:
+                results = await self._write_batch(batch)
+                break
+            except Exception as e:
+                if attempt < attempts and _is_transient(e):
+                    metrics.incr("write_behind.retries")
+                    await asyncio.sleep(_RETRY_BASE_DELAY_S * 2 ** (attempt - 1))
+                    continue
+                logger.exception("write-behind batch of %d turns failed", len(batch))
+                metrics.incr("write_behind.failed", len(batch))
+                results = [SaveResult(error="persistence_failed") for _ in batch]
+                await self._discard_batch(batch)
+                break
+
+        for turn, result in zip(batch, results):
+            if turn.reservation is not None:
+                if result.message_id is not None:
+                    turn.reservation.commit()
+                else:
+                    turn.reservation.release()
+            if result.message_id is not None and turn.on_saved is not None:
+                try:
+                    turn.on_saved(turn.assistant)
+                except Exception:
+                    logger.exception("write-behind on_saved callback failed")
+            if turn.future is not None and not turn.future.done():
+                turn.future.set_result(result)
+
+    async def _write_batch(self, batch: list[PendingTurn]) -> list[SaveResult]:
+        async with AsyncSessionLocal() as db:
+            results = [await self._write_turn(db, turn) for turn in batch]
+            await db.commit()
+        metrics.incr("write_behind.batches")
+        metrics.incr("write_behind.rows", sum(1 for r in results if r.message_id is not None))
+        return results
+
+    async def _write_turn(self, db: AsyncSession, turn: PendingTurn) -> SaveResult:
+        try:
+            async with db.begin_nested():
+                if turn.assistant is None:
+                    await self._discard_turn(db, turn)
+                    return SaveResult()
+                new_bytes = int(turn.assistant.size_bytes or 0)
+                allowed = (
+                    await ensure_reserved(db, turn.reservation, turn.turn_bytes, new_bytes)
+                    if turn.reservation is not None
+                    else await ensure_quota_for(db, turn.user_id, new_bytes)
+                )
+                if not allowed:
+                    await self._discard_turn(db, turn)
+                    return SaveResult(error="quota_exceeded_on_assistant_message")
+                db.add(turn.assistant)
+                await db.flush()
+                if turn.idempotency_key is not None:
+                    await idempotency.complete(
+                        db, turn.user_id, turn.idempotency_key, turn.user_message_id, turn.assistant.id
+                    )
+                return SaveResult(message_id=turn.assistant.id)
+        except Exception as e:
+            if _is_transient(e):
+                raise
+            # Only this turn's savepoint rolled back; the rest of the batch still commits
+            logger.exception("write-behind turn for message %s failed", turn.user_message_id)
+            metrics.incr("write_behind.failed")
+            try:
+                async with db.begin_nested():
+                    await self._discard_turn(db, turn)
+            except Exception:
+                logger.exception("write-behind discard for message %s failed", turn.user_message_id)
+            return SaveResult(error="persistence_failed")
+
+    async def _discard_batch(self, batch: list[PendingTurn]) -> None:
+        """A batch that could not be written: remove its user messages, as for a failed generation."""
+        try:
+            async with AsyncSessionLocal() as db:
+                for turn in batch:
+                    await self._discard_turn(db, turn)
+                await db.commit()
+        except Exception:
+            logger.exception("write-behind discard of %d turns failed", len(batch))
+
+    @staticmethod
+    async def _discard_turn(db: AsyncSession, turn: PendingTurn) -> None:
+        await db.execute(delete(Message).where(Message.id == turn.user_message_id))
+        if turn.idempotency_key is not None:
+            await idempotency.release(db, turn.user_id, turn.idempotency_key)
+
+
+# Module-level singleton; the writer task starts with the first submitted turn
+write_behind = WriteBehindQueue()
@@ -1,18 +1,24 @@
 # backend/app/services/quotas.py
 from __future__ import annotations
 
+import asyncio
+import logging
+import time
+from collections import deque
 from dataclasses import dataclass
-from typing import Any, Sequence, List, Dict
+from typing import Sequence, List, Dict
 from uuid import UUID as _UUID
 
-from sqlalchemy import select, func, bindparam
+from sqlalchemy import bindparam
 from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import UUID as PGUUID
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
-from app.models.conversation import Conversation
-from app.models.document import Document, UserDocument
+from app.core.database import AsyncSessionLocal, engine
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
 
 EXCLUDED_STATUSES = ("deleted", "archived_quota")
 
@@ -25,6 +31,10 @@ class QuotaState:
     used_doc_bytes: int
     used_total_bytes: int
     used_ratio: float
+    # The member's organization pool, when it has one
+    organization_id: str | None = None
+    org_limit_bytes: int | None = None
+    org_used_bytes: int | None = None
 
 
 @dataclass
@@ -33,60 +43,80 @@ class UploadCheck:
     limit_bytes: int
     would_total: int
     deficit: int
+    # Which limit the figures describe: "user", or "organization" when the pool is what refuses
+    scope: str = "user"
 
 
 def compute_text_bytes(s: str) -> int:
     return len((s or "").encode("utf-8"))
 
 
-def _row_to_quota_state(row: Sequence[Any]) -> QuotaState:
-    return QuotaState(
-        user_id=str(row[0]),
-        limit_bytes=int(row[1]),
-        used_conv_bytes=int(row[2]),
-        used_doc_bytes=int(row[3]),
-        used_total_bytes=int(row[4]),
-        used_ratio=float(row[5]),
+# Primary-key reads: user_storage_quota and organization_storage_quota carry trigger-maintained
+# usage counters, so the user limit and the org pool are checked together in one query. The pool
+# adds its deltas not folded yet (fn_org_quota_used), so admission never waits for the folder
+_QUOTA_ROW_SQL = (
+    text(
+        "SELECT q.limit_bytes, q.used_conv_bytes, q.used_doc_bytes, "
+        "o.organization_id, o.limit_bytes, fn_org_quota_used(o.organization_id) "
+        "FROM user_storage_quota q "
+        "JOIN user_profile u ON u.id = q.user_id "
+        "LEFT JOIN organization_storage_quota o ON o.organization_id = u.organization_id "
+        "WHERE q.user_id = :uid"
     )
+    .bindparams(bindparam("uid", type_=PGUUID(as_uuid=True)))
+)
+_RECONCILE_SQL = text("SELECT * FROM fn_quota_reconcile(CAST(:uids AS uuid[]))")
+_NEXT_USERS_SQL = text("SELECT id FROM user_profile WHERE id > CAST(:after AS uuid) ORDER BY id LIMIT :n")
+_ORG_RECONCILE_SQL = text(
+    "SELECT * FROM fn_org_quota_reconcile(ARRAY(SELECT organization_id FROM organization_storage_quota))"
+)
+# Pool row when there is one; otherwise the members' counters summed (still no asset scan)
+_ORG_USAGE_SQL = text(
+    "SELECT o.limit_bytes, "
+    "COALESCE(fn_org_quota_used(o.organization_id), (SELECT COALESCE(SUM(q.used_bytes), 0) FROM user_profile u "
+    "JOIN user_storage_quota q ON q.user_id = u.id WHERE u.organization_id = CAST(:org AS uuid))), "
+    "(SELECT count(*) FROM user_profile u WHERE u.organization_id = CAST(:org AS uuid)) "
+    "FROM (SELECT 1) one "
+    "LEFT JOIN organization_storage_quota o ON o.organization_id = CAST(:org AS uuid)"
+)
+_ORG_TOP_CONSUMERS_SQL = text(
+    "SELECT u.id, u.display_name, u.email, q.limit_bytes, q.used_conv_bytes, q.used_doc_bytes, q.used_bytes "
+    "FROM user_profile u JOIN user_storage_quota q ON q.user_id = u.id "
+    "WHERE u.organization_id = CAST(:org AS uuid) "
+    "ORDER BY q.used_bytes DESC, u.id LIMIT :n"
+)
+_ORG_POOL_UPSERT_SQL = text(
+    "INSERT INTO organization_storage_quota (organization_id, limit_bytes) VALUES (CAST(:org AS uuid), :limit) "
+    "ON CONFLICT (organization_id) DO UPDATE SET limit_bytes = EXCLUDED.limit_bytes, updated_at = now()"
+)
+_ORG_POOL_DELETE_SQL = text("DELETE FROM organization_storage_quota WHERE organization_id = CAST(:org AS uuid)")
+_ORG_POOL_RECONCILE_SQL = text("SELECT * FROM fn_org_quota_reconcile(ARRAY[CAST(:org AS uuid)])")
+_ORG_FOLD_SQL = text("SELECT fn_org_quota_fold(:n)")
+# Only one worker reconciles at a time: session-level, held on one connection for the whole pass
+_RECONCILE_LOCK_SQL = text("SELECT pg_try_advisory_lock(hashtext('fn_quota_reconcile'))")
+_RECONCILE_UNLOCK_SQL = text("SELECT pg_advisory_unlock(hashtext('fn_quota_reconcile'))")
+# Users at or above a fraction of their limit, in keyset pages
+_HIGH_WATER_USERS_SQL = text(
+    "SELECT user_id FROM user_storage_quota "
+    "WHERE user_id > CAST(:after AS uuid) AND limit_bytes > 0 "
+    "AND used_bytes >= limit_bytes * CAST(:ratio AS numeric) "
+    "ORDER BY user_id LIMIT :n"
+)
+_AUTORELEASE_BATCH_SQL = text(
+    "SELECT * FROM fn_quota_autorelease_batch(CAST(:uids AS uuid[]), CAST(:ratio AS numeric))"
+)
 
 
-async def _sum_deleted_conv_bytes(db: AsyncSession, user_id: _UUID) -> int:
-    """
-    Count the storage size of conversations that have been soft-deleted for the current user (conversation.storage_size).
-    """
-    q = (
-        select(func.coalesce(func.sum(Conversation.storage_size), 0))
-        .where(Conversation.user_id == user_id, Conversation.status == "deleted")
-    )
-    return int((await db.execute(q)).scalar_one())
-
-
-async def _sum_deleted_doc_bytes(db: AsyncSession, user_id: _UUID) -> int:
+async def get_quota_state(db: AsyncSession, user_id: _UUID) -> QuotaState:
     """
-    Count the storage size of documents that have been soft-deleted for the current user (size_bytes + processed_text_bytes).
+    Usage from the user_storage_quota counters (deleted and archived_quota rows excluded).
+    A user without a counter row gets one built from the tables on first use.
     """
-    doc_bytes = func.coalesce(
-        func.sum(Document.size_bytes + func.coalesce(Document.processed_text_bytes, 0)),
-        0,
-    )
-    q = (
-        select(doc_bytes)
-        .join(UserDocument, UserDocument.document_id == Document.id)
-        .where(UserDocument.user_id == user_id, Document.status == "deleted")
-    )
-    return int((await db.execute(q)).scalar_one())
-
-
-async def get_quota_state(db: AsyncSession, user_id: _UUID) -> QuotaState:
-    stmt = (
-        text("SELECT * FROM fn_user_quota_state(:uid, :include_archived)")
-        .bindparams(
-            bindparam("uid", type_=PGUUID(as_uuid=True)),
-            bindparam("include_archived"),
-        )
-    )
-    base_row = (await db.execute(stmt, {"uid": user_id, "include_archived": False})).first()
-    if not base_row:
+    row = (await db.execute(_QUOTA_ROW_SQL, {"uid": user_id})).first()
+    if row is None:
+        await reconcile_usage(db, [user_id])
+        row = (await db.execute(_QUOTA_ROW_SQL, {"uid": user_id})).first()
+    if row is None:
         return QuotaState(
             user_id=str(user_id),
             limit_bytes=int(settings.QUOTA_DEFAULT_LIMIT_BYTES),
@@ -95,32 +125,46 @@ async def get_quota_state(db: AsyncSession, user_id: _UUID) -> QuotaState:
             used_total_bytes=0,
             used_ratio=0.0,
         )
-    base = _row_to_quota_state(base_row)
-    # Minus "deleted" conversations and documents
-    del_conv = await _sum_deleted_conv_bytes(db, user_id)
-    del_doc = await _sum_deleted_doc_bytes(db, user_id)
-
-    used_conv = max(0, base.used_conv_bytes - del_conv)
-    used_doc = max(0, base.used_doc_bytes - del_doc)
+    limit_bytes, used_conv, used_doc = int(row[0]), int(row[1]), int(row[2])
     used_total = used_conv + used_doc
-    ratio = (used_total / base.limit_bytes) if base.limit_bytes > 0 else 0.0
-
     return QuotaState(
-        user_id=base.user_id,
-        limit_bytes=base.limit_bytes,
+        user_id=str(user_id),
+        limit_bytes=limit_bytes,
         used_conv_bytes=used_conv,
         used_doc_bytes=used_doc,
         used_total_bytes=used_total,
-        used_ratio=ratio,
+        used_ratio=(used_total / limit_bytes) if limit_bytes > 0 else 0.0,
+        organization_id=str(row[3]) if row[3] is not None else None,
+        org_limit_bytes=int(row[4]) if row[3] is not None else None,
+        org_used_bytes=int(row[5]) if row[3] is not None else None,
     )
 
 
+async def reconcile_usage(db: AsyncSession, user_ids: Sequence[_UUID]) -> List[Dict]:
+    """
+    Recompute the usage counters of `user_ids` from the tables (fn_quota_reconcile) and
+    repair drift in the caller's transaction. Returns the users whose counters were off.
+    """
+    rows = (await db.execute(_RECONCILE_SQL, {"uids": [str(u) for u in user_ids]})).fetchall()
+    return [{"user_id": str(r[0]), "conv_drift": int(r[1]), "doc_drift": int(r[2])} for r in rows]
+
+
 async def can_accept_size(db: AsyncSession, user_id: _UUID, incoming_size: int) -> UploadCheck:
     s = await get_quota_state(db, user_id)
     inc = int(max(0, incoming_size))
     would_total = s.used_total_bytes + inc
     allowed = (s.limit_bytes <= 0) or (would_total <= s.limit_bytes)
     deficit = max(0, would_total - s.limit_bytes)
+    if allowed and s.org_limit_bytes:
+        org_would_total = s.org_used_bytes + inc
+        if org_would_total > s.org_limit_bytes:
+            return UploadCheck(
+                allowed=False,
+                limit_bytes=int(s.org_limit_bytes),
+                would_total=int(org_would_total),
+                deficit=int(org_would_total - s.org_limit_bytes),
+                scope="organization",
+            )
     return UploadCheck(
         allowed=bool(allowed),
         limit_bytes=int(s.limit_bytes),
@@ -144,5 +188,698 @@ async def maybe_autorelease(db: AsyncSession, user_id: _UUID) -> List[Dict]:
     return [{"kind": r[0], "id": str(r[1]), "bytes": int(r[2])} for r in rows]
 
 
+async def ensure_quota_for(db: AsyncSession, user_id: _UUID, incoming_size: int) -> bool:
+    """
+    Wraps "quota check + maybe autorelease and recheck" logic. Returns whether allowed.
+    """
+    check = await can_accept_size(db, user_id, incoming_size)
+    if check.allowed:
+        return True
+    released = await maybe_autorelease(db, user_id)
+    if released:
+        check = await can_accept_size(db, user_id, incoming_size)
+        return check.allowed
+    return False
+
+
+class _Usage:
+    """A user's (or an organization pool's) quota as the ledger sees it."""
+    __slots__ = ("limit_bytes", "used_bytes", "loaded_at", "settled", "reserved", "open_reservations",
+                 "refreshing", "pool")
+
+    def __init__(self):
+        self.limit_bytes = int(settings.QUOTA_DEFAULT_LIMIT_BYTES)
+        # Counters as of the last load
+        self.used_bytes = 0
+        # Monotonic time the last load started; None = load before trusting used_bytes
+        self.loaded_at: float | None = None
+        # (monotonic time, bytes) committed in this process since that load started
+        self.settled: deque[tuple[float, int]] = deque()
+        # Bytes held by open reservations, and how many are open (a reservation may hold 0 bytes)
+        self.reserved = 0
+        self.open_reservations = 0
+        self.refreshing = False
+        # The user's organization pool, also charged by their reservations
+        self.pool: _Usage | None = None
+
+    def total(self) -> int:
+        return self.used_bytes + sum(b for _, b in self.settled) + self.reserved
+
+    def fits(self, extra: int) -> bool:
+        # Never admit against counters that were not loaded (new entry, or invalidated)
+        if self.loaded_at is None:
+            return False
+        if self.pool is not None and not self.pool.fits(extra):
+            return False
+        return self.limit_bytes <= 0 or self.total() + extra <= self.limit_bytes
+
+    def hold(self, nbytes: int) -> None:
+        self.reserved += nbytes
+        if self.pool is not None:
+            self.pool.reserved += nbytes
+
+    def settle(self, nbytes: int) -> None:
+        now = time.monotonic()
+        for usage in (self, self.pool):
+            if usage is not None:
+                usage.reserved -= nbytes
+                usage.settled.append((now, nbytes))
+
+    def loaded(self, limit_bytes: int, used_bytes: int, started: float) -> None:
+        self.limit_bytes = limit_bytes
+        self.used_bytes = used_bytes
+        self.loaded_at = started
+        # Turns committed before this load started are in the counters now
+        while self.settled and self.settled[0][0] < started:
+            self.settled.popleft()
+
+
+class QuotaReservation:
+    """Bytes held against a user's quota (and their organization pool) while a chat turn is generated."""
+
+    def __init__(self, ledger: QuotaLedger, user_id: _UUID, nbytes: int):
+        self._ledger = ledger
+        self.user_id = user_id
+        self.bytes = nbytes
+        self.open = True
+
+    def resize(self, actual: int) -> bool:
+        """
+        Hold `actual` bytes instead, if the cached usage has room for the difference. Growing
+        is refused while the usage is not loaded; the caller then checks the counters.
+        """
+        if not self.open:
+            return False
+        usage = self._ledger.usage(self.user_id)
+        if actual > self.bytes and not usage.fits(actual - self.bytes):
+            return False
+        usage.hold(actual - self.bytes)
+        self.bytes = actual
+        return True
+
+    def commit(self) -> None:
+        """The turn was written: its bytes stay counted until the next snapshot load includes them."""
+        if self.open:
+            self.open = False
+            usage = self._ledger.usage(self.user_id)
+            usage.open_reservations -= 1
+            usage.settle(self.bytes)
+            if usage.limit_bytes > 0 and usage.total() >= usage.limit_bytes * settings.QUOTA_AUTORELEASE_HIGH_WATER:
+                quota_auto_releaser.nudge(self.user_id)
+
+    def release(self) -> None:
+        """The turn was cancelled or discarded. No-op after commit."""
+        if self.open:
+            self.open = False
+            usage = self._ledger.usage(self.user_id)
+            usage.open_reservations -= 1
+            usage.hold(-self.bytes)
+
+
+class QuotaLedger:
+    """
+    Per-process view of each user's quota: a snapshot of the DB usage counters plus the
+    bytes of in-flight chat turns. `reserve` checks and takes room in one synchronous step,
+    so concurrent messages of a user cannot both pass on the same headroom. The snapshot is
+    reloaded in the background once older than QUOTA_SNAPSHOT_TTL_S, so the common case runs
+    no quota SQL; only a reservation the snapshot cannot fit goes to the database (fresh
+    counters, then auto-archive) before being refused. Other workers' turns show up at the
+    next reload, which bounds cross-process overshoot.
+    """
+
+    def __init__(self):
+        # Entries stay while a reservation is open or a refresh runs: commit/release find them again
+        self._users: dict[_UUID, _Usage] = {}
+        # Organization pools by org id, shared by the members' entries
+        self._pools: dict[str, _Usage] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def usage(self, user_id: _UUID) -> _Usage:
+        usage = self._users.get(user_id)
+        if usage is None:
+            self._prune()
+            usage = self._users[user_id] = _Usage()
+        return usage
+
+    async def reserve(self, db: AsyncSession, user_id: _UUID, nbytes: int) -> QuotaReservation | None:
+        """Hold `nbytes` for a turn; None when the user's quota cannot take it (even after auto-archive)."""
+        nbytes = max(0, int(nbytes))
+        usage = self.usage(user_id)
+        if usage.loaded_at is None:
+            usage = await self._load(db, user_id)
+        elif time.monotonic() - usage.loaded_at > settings.QUOTA_SNAPSHOT_TTL_S:
+            self._refresh_later(user_id)
+        if usage.fits(nbytes):
+            metrics.incr("quota.reserve_cached")
+            return self._hold(usage, user_id, nbytes)
+
+        # The cached view says no: confirm against the counters, then try releasing space
+        metrics.incr("quota.reserve_checked")
+        usage = await self._load(db, user_id)
+        if not usage.fits(nbytes) and await maybe_autorelease(db, user_id):
+            usage = await self._load(db, user_id)
+        if usage.fits(nbytes):
+            return self._hold(usage, user_id, nbytes)
+        metrics.incr("quota.reserve_rejected")
+        return None
+
+    def invalidate(self, user_id: _UUID) -> None:
+        """Usage changed outside chat turns (uploads, deletes): reload before the next reservation."""
+        usage = self._users.get(user_id)
+        if usage is not None:
+            usage.loaded_at = None
+
+    def _hold(self, usage: _Usage, user_id: _UUID, nbytes: int) -> QuotaReservation:
+        usage.hold(nbytes)
+        usage.open_reservations += 1
+        return QuotaReservation(self, user_id, nbytes)
+
+    async def _load(self, db: AsyncSession, user_id: _UUID) -> _Usage:
+        started = time.monotonic()
+        state = await get_quota_state(db, user_id)
+        usage = self.usage(user_id)
+        usage.loaded(state.limit_bytes, state.used_total_bytes, started)
+        pool = None
+        if state.organization_id is not None:
+            pool = self._pools.get(state.organization_id)
+            if pool is None:
+                pool = self._pools[state.organization_id] = _Usage()
+            pool.loaded(state.org_limit_bytes, state.org_used_bytes, started)
+        if usage.pool is not pool:
+            # New pool, or the user changed organization: their open reservations move along
+            if usage.pool is not None:
+                usage.pool.reserved -= usage.reserved
+            if pool is not None:
+                pool.reserved += usage.reserved
+            usage.pool = pool
+        metrics.incr("quota.snapshot_loads")
+        return usage
+
+    def _refresh_later(self, user_id: _UUID) -> None:
+        usage = self.usage(user_id)
+        if usage.refreshing:
+            return
+        usage.refreshing = True
+        task = asyncio.create_task(self._refresh(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, user_id: _UUID) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await self._load(db, user_id)
+        except Exception:
+            logger.exception("quota snapshot refresh for user %s failed", user_id)
+        finally:
+            self.usage(user_id).refreshing = False
+
+    def _prune(self) -> None:
+        if len(self._users) < settings.QUOTA_LEDGER_MAX_USERS:
+            return
+        for uid in [uid for uid, u in self._users.items() if not u.open_reservations and not u.refreshing]:
+            del self._users[uid]
+        in_use = {id(u.pool) for u in self._users.values() if u.pool is not None}
+        self._pools = {oid: p for oid, p in self._pools.items() if id(p) in in_use or p.reserved}
+
+    def snapshot(self) -> dict:
+        return {
+            "users": len(self._users),
+            "pools": len(self._pools),
+            "reserved_bytes": sum(u.reserved for u in self._users.values()),
+            "refreshing": len(self._tasks),
+        }
+
+
+# Module-level singleton shared by the chat routes and the write-behind writer
+quota_ledger = QuotaLedger()
+
+
+async def ensure_reserved(db: AsyncSession, reservation: QuotaReservation, turn_bytes: int, new_bytes: int) -> bool:
+    """
+    Before writing a turn: resize its reservation to the actual `turn_bytes`. Only an answer
+    the cached view cannot cover checks the counters (ensure_quota_for on the `new_bytes`
+    not yet written), and a pass there means the cached view was out of date.
+    """
+    if reservation.resize(turn_bytes):
+        return True
+    if not await ensure_quota_for(db, reservation.user_id, new_bytes):
+        return False
+    quota_ledger.invalidate(reservation.user_id)
+    return True
+
+
 def warn_needed(limit_bytes: int, would_total: int) -> bool:
     return (limit_bytes > 0) and ((would_total / limit_bytes) >= settings.QUOTA_WARN_RATIO)
+
+
+@dataclass
+class OrgQuotaState:
+    organization_id: str
+    limit_bytes: int | None  # None: no pool, members only have their own limits
+    used_bytes: int
+    members: int
+
+
+@dataclass
+class QuotaConsumer:
+    user_id: str
+    display_name: str | None
+    email: str
+    limit_bytes: int
+    used_conv_bytes: int
+    used_doc_bytes: int
+    used_bytes: int
+
+
+async def get_org_quota(db: AsyncSession, organization_id: _UUID, top: int) -> tuple[OrgQuotaState, List[QuotaConsumer]]:
+    """An organization's pool usage and its `top` members by usage, read from the counters."""
+    params = {"org": str(organization_id), "n": max(0, int(top))}
+    limit_bytes, used_bytes, members = (await db.execute(_ORG_USAGE_SQL, params)).one()
+    consumers = [
+        QuotaConsumer(
+            user_id=str(r[0]),
+            display_name=r[1],
+            email=r[2],
+            limit_bytes=int(r[3]),
+            used_conv_bytes=int(r[4]),
+            used_doc_bytes=int(r[5]),
+            used_bytes=int(r[6]),
+        )
+        for r in await db.execute(_ORG_TOP_CONSUMERS_SQL, params)
+    ] if params["n"] else []
+    state = OrgQuotaState(
+        organization_id=str(organization_id),
+        limit_bytes=int(limit_bytes) if limit_bytes is not None else None,
+        used_bytes=int(used_bytes),
+        members=int(members),
+    )
+    return state, consumers
+
+
+async def set_org_quota_limit(db: AsyncSession, organization_id: _UUID, limit_bytes: int | None) -> None:
+    """Create or resize an organization's pool (filled from the member counters), or drop it with None."""
+    params = {"org": str(organization_id), "limit": limit_bytes}
+    if limit_bytes is None:
+        await db.execute(_ORG_POOL_DELETE_SQL, params)
+        return
+    await db.execute(_ORG_POOL_UPSERT_SQL, params)
+    await db.execute(_ORG_POOL_RECONCILE_SQL, params)
+
+
+# Admin usage report: one query over the counters; ORDER BY keys are whitelisted
+REPORT_SORT_KEYS = {
+    "used_bytes": "q.used_bytes",
+    "used_ratio": "CASE WHEN q.limit_bytes > 0 THEN q.used_bytes::float8 / q.limit_bytes END",
+    "conv_bytes": "q.used_conv_bytes",
+    "doc_bytes": "q.used_doc_bytes",
+    "archived_bytes": "q.archived_bytes",
+    "email": "u.email",
+}
+_REPORT_SELECT = (
+    "SELECT u.id, u.email, u.display_name, u.organization_id, org.name, q.limit_bytes, "
+    "q.used_conv_bytes, q.used_doc_bytes, q.used_bytes, q.archived_bytes, {total} "
+    "FROM user_profile u "
+    "JOIN user_storage_quota q ON q.user_id = u.id "
+    "LEFT JOIN organization org ON org.id = u.organization_id "
+    "WHERE (CAST(:org AS uuid) IS NULL OR u.organization_id = CAST(:org AS uuid)) "
+    "ORDER BY {sort} {direction} NULLS LAST, u.id {direction}"
+)
+
+
+@dataclass
+class QuotaReportRow:
+    user_id: str
+    email: str
+    display_name: str | None
+    organization_id: str | None
+    organization_name: str | None
+    limit_bytes: int
+    used_conv_bytes: int
+    used_doc_bytes: int
+    used_bytes: int
+    used_ratio: float
+    archived_bytes: int
+
+
+def _report_sql(sort: str, descending: bool, paged: bool):
+    if sort not in REPORT_SORT_KEYS:
+        raise ValueError(f"unknown sort key: {sort}")
+    sql = _REPORT_SELECT.format(
+        total="count(*) OVER ()" if paged else "NULL",
+        sort=REPORT_SORT_KEYS[sort],
+        direction="DESC" if descending else "ASC",
+    )
+    return text(sql + " LIMIT :limit OFFSET :offset" if paged else sql)
+
+
+def _report_row(r) -> QuotaReportRow:
+    limit_bytes, used_bytes = int(r[5]), int(r[8])
+    return QuotaReportRow(
+        user_id=str(r[0]),
+        email=r[1],
+        display_name=r[2],
+        organization_id=str(r[3]) if r[3] is not None else None,
+        organization_name=r[4],
+        limit_bytes=limit_bytes,
+        used_conv_bytes=int(r[6]),
+        used_doc_bytes=int(r[7]),
+        used_bytes=used_bytes,
+        used_ratio=(used_bytes / limit_bytes) if limit_bytes > 0 else 0.0,
+        archived_bytes=int(r[9]),
+    )
+
+
+async def quota_report_page(
+        db: AsyncSession,
+        organization_id: _UUID | None,
+        sort: str,
+        descending: bool,
+        limit: int,
+        offset: int,
+) -> tuple[List[QuotaReportRow], int]:
+    """One page of per-user usage (all organizations when `organization_id` is None) and the total row count."""
+    rows = (await db.execute(_report_sql(sort, descending, paged=True), {
+        "org": str(organization_id) if organization_id else None, "limit": limit, "offset": offset,
+    })).fetchall()
+    total = int(rows[0][10]) if rows else 0
+    if not rows and offset:
+        total = int((await db.execute(
+            text("SELECT count(*) FROM user_profile u JOIN user_storage_quota q ON q.user_id = u.id "
+                 "WHERE (CAST(:org AS uuid) IS NULL OR u.organization_id = CAST(:org AS uuid))"),
+            {"org": str(organization_id) if organization_id else None},
+        )).scalar_one())
+    return [_report_row(r) for r in rows], total
+
+
+async def iter_quota_report(organization_id: _UUID | None, sort: str, descending: bool):
+    """
+    Every row of the report, streamed from a server-side cursor in its own session so a
+    large organization is never held in memory.
+    """
+    stmt = _report_sql(sort, descending, paged=False)
+    params = {"org": str(organization_id) if organization_id else None}
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt, params)
+        async for partition in result.partitions(settings.QUOTA_REPORT_FETCH_ROWS):
+            yield [_report_row(r) for r in partition]
+
+
+class QuotaReconciler:
+    """
+    Periodic drift check of the usage counters: every QUOTA_RECONCILE_INTERVAL_S, walk all
+    users in batches of QUOTA_RECONCILE_BATCH_USERS, one short transaction per batch, then
+    re-sum the organization pools from the member counters.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.users_checked = 0
+        self.users_repaired = 0
+        self.pools_repaired = 0
+        self.last_run_at: float | None = None
+
+    def start(self) -> None:
+        if settings.QUOTA_RECONCILE_INTERVAL_S > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.QUOTA_RECONCILE_INTERVAL_S)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("quota reconciliation failed")
+
+    async def run_once(self) -> int:
+        """One pass over every user; returns how many had drifted. Skipped while another worker runs one."""
+        async with engine.connect() as conn:
+            # Autocommit: the lock connection sits idle between batches, never idle in a transaction
+            lock_conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            if not (await lock_conn.execute(_RECONCILE_LOCK_SQL)).scalar_one():
+                logger.info("quota reconciliation already running elsewhere; skipped")
+                return 0
+            try:
+                return await self._reconcile_all()
+            finally:
+                try:
+                    await lock_conn.execute(_RECONCILE_UNLOCK_SQL)
+                except Exception:
+                    # Never hand a connection that may still hold the lock back to the pool
+                    logger.exception("quota reconciliation unlock failed; dropping the connection")
+                    await lock_conn.invalidate()
+
+    async def _reconcile_all(self) -> int:
+        after = "00000000-0000-0000-0000-000000000000"
+        repaired = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                ids = [str(r[0]) for r in await db.execute(
+                    _NEXT_USERS_SQL, {"after": after, "n": max(1, settings.QUOTA_RECONCILE_BATCH_USERS)}
+                )]
+                if not ids:
+                    break
+                drifted = await reconcile_usage(db, ids)
+                await db.commit()
+            for d in drifted:
+                logger.warning("quota counters drifted for user %s: conv %+d, doc %+d",
+                               d["user_id"], d["conv_drift"], d["doc_drift"])
+            self.users_checked += len(ids)
+            repaired += len(drifted)
+            after = ids[-1]
+        # Organization pools, from the member counters just checked
+        async with AsyncSessionLocal() as db:
+            pools_drifted = (await db.execute(_ORG_RECONCILE_SQL)).fetchall()
+            await db.commit()
+        for org_id, drift in pools_drifted:
+            logger.warning("quota pool drifted for organization %s: %+d", org_id, drift)
+        self.runs += 1
+        self.users_repaired += repaired
+        self.pools_repaired += len(pools_drifted)
+        self.last_run_at = time.time()
+        metrics.incr("quota.reconcile_runs")
+        if repaired:
+            metrics.incr("quota.reconcile_repaired", repaired)
+        return repaired
+
+    def snapshot(self) -> dict:
+        return {
+            "runs": self.runs,
+            "users_checked": self.users_checked,
+            "users_repaired": self.users_repaired,
+            "pools_repaired": self.pools_repaired,
+            "last_run_at": self.last_run_at,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+# Module-level singleton, started with the app
+quota_reconciler = QuotaReconciler()
+
+
+class OrgQuotaFolder:
+    """
+    Members' usage changes reach their organization pool as rows appended to
+    organization_quota_delta, so chat writes never queue on the org's single pool row. Every
+    QUOTA_ORG_FOLD_INTERVAL_S this worker folds them into the pool, QUOTA_ORG_FOLD_BATCH per
+    transaction. Quota checks add the pending rows, so a slow fold does not loosen the limit.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.deltas_folded = 0
+        self.last_run_at: float | None = None
+
+    def start(self) -> None:
+        if settings.QUOTA_ORG_FOLD_INTERVAL_S > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.QUOTA_ORG_FOLD_INTERVAL_S)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("organization quota fold failed")
+
+    async def run_once(self) -> int:
+        """Fold every pending delta; returns how many."""
+        batch = max(1, settings.QUOTA_ORG_FOLD_BATCH)
+        folded = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                n = int((await db.execute(_ORG_FOLD_SQL, {"n": batch})).scalar_one())
+                await db.commit()
+            folded += n
+            if n < batch:
+                break
+        self.runs += 1
+        self.deltas_folded += folded
+        self.last_run_at = time.time()
+        if folded:
+            metrics.incr("quota.org_deltas_folded", folded)
+        return folded
+
+    def snapshot(self) -> dict:
+        return {
+            "runs": self.runs,
+            "deltas_folded": self.deltas_folded,
+            "last_run_at": self.last_run_at,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+# Module-level singleton, started with the app
+org_quota_folder = OrgQuotaFolder()
+
+
+class QuotaAutoReleaser:
+    """
+    Releases space ahead of the limit: users at QUOTA_AUTORELEASE_HIGH_WATER of their quota
+    get their oldest 20% archived here, in batches of QUOTA_AUTORELEASE_BATCH_USERS per
+    transaction, so a request only releases inline when the user is really at 100%.
+    Candidates come from a scan of the usage counters every QUOTA_AUTORELEASE_INTERVAL_S
+    and from this process's chat turns and uploads, which nudge a user as they cross the
+    mark. Lag is measured from the nudge to the release.
+    """
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self._wake: asyncio.Event | None = None
+        # user id -> monotonic time of the first nudge not yet handled
+        self._pending: dict[_UUID, float] = {}
+        self.runs = 0
+        self.users_released = 0
+        self.rows_released = 0
+        self.bytes_released = 0
+        self.last_lag_s: float | None = None
+        self.max_lag_s = 0.0
+        self.last_run_at: float | None = None
+        self.last_run_s: float | None = None
+
+    def start(self) -> None:
+        if not (settings.QUOTA_AUTO_ARCHIVE_ON_LIMIT and settings.QUOTA_AUTORELEASE_INTERVAL_S > 0):
+            return
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def nudge(self, user_id: _UUID) -> None:
+        """`user_id` crossed the high-water mark; release for them without waiting for the next scan."""
+        if self._task is None or self._task.done():
+            return
+        self._pending.setdefault(user_id, time.monotonic())
+        self._wake.set()
+
+    async def _run(self) -> None:
+        next_scan = time.monotonic() + settings.QUOTA_AUTORELEASE_INTERVAL_S
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(0.0, next_scan - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            scan = time.monotonic() >= next_scan
+            if scan:
+                next_scan = time.monotonic() + settings.QUOTA_AUTORELEASE_INTERVAL_S
+            try:
+                await self.run_once(scan=scan)
+            except Exception:
+                logger.exception("quota auto-release failed")
+
+    async def run_once(self, scan: bool = True) -> int:
+        """Release for the nudged users, then (with `scan`) for every user at the mark. Returns users released."""
+        started = time.monotonic()
+        batch_size = max(1, settings.QUOTA_AUTORELEASE_BATCH_USERS)
+        nudged, self._pending = self._pending, {}
+        ids = list(nudged)
+        released = 0
+        for i in range(0, len(ids), batch_size):
+            released += await self._release_batch(ids[i:i + batch_size])
+        now = time.monotonic()
+        for first_seen in nudged.values():
+            self.last_lag_s = now - first_seen
+            self.max_lag_s = max(self.max_lag_s, self.last_lag_s)
+
+        if scan:
+            after = "00000000-0000-0000-0000-000000000000"
+            while True:
+                async with AsyncSessionLocal() as db:
+                    page = [r[0] for r in await db.execute(_HIGH_WATER_USERS_SQL, {
+                        "after": after, "ratio": settings.QUOTA_AUTORELEASE_HIGH_WATER, "n": batch_size,
+                    })]
+                if not page:
+                    break
+                released += await self._release_batch([u for u in page if u not in nudged])
+                after = str(page[-1])
+
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_run_s = time.monotonic() - started
+        metrics.incr("quota.autorelease_runs")
+        return released
+
+    async def _release_batch(self, user_ids: list[_UUID]) -> int:
+        if not user_ids:
+            return 0
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(_AUTORELEASE_BATCH_SQL, {
+                "uids": [str(u) for u in user_ids], "ratio": settings.QUOTA_AUTORELEASE_HIGH_WATER,
+            })).fetchall()
+            await db.commit()
+        for user_id, nrows, nbytes in rows:
+            quota_ledger.invalidate(user_id)
+            self.rows_released += int(nrows)
+            self.bytes_released += int(nbytes)
+        self.users_released += len(rows)
+        metrics.incr("quota.autorelease_users", len(rows))
+        metrics.incr("quota.autorelease_bytes", sum(int(r[2]) for r in rows))
+        return len(rows)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            "runs": self.runs,
+            "users_released": self.users_released,
+            "rows_released": self.rows_released,
+            "bytes_released": self.bytes_released,
+            "pending": len(self._pending),
+            "oldest_pending_s": max((now - t for t in self._pending.values()), default=0.0),
+            "last_lag_s": self.last_lag_s,
+            "max_lag_s": self.max_lag_s,
+            "last_run_at": self.last_run_at,
+            "last_run_s": self.last_run_s,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+# Module-level singleton, started with the app
+quota_auto_releaser = QuotaAutoReleaser()
@@ -0,0 +1,82 @@
+# backend/app/services/sessions.py
+"""Client sessions shared by the conversations a client opens.
+
+A session used to be inserted for every conversation, so the table grew as
+fast as `conversation`. Now a client, identified by a fingerprint of its IP
+address and user agent, keeps its session until it has been idle for
+SESSION_REUSE_IDLE_S. Reuse and the conversation insert happen in one
+statement, so creating a conversation is a single round-trip.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+# reused: bump the client's newest live session; created: only when there is none
+_CREATE_CONVERSATION_SQL = text(
+    """
+    WITH reused AS (
+        UPDATE session
+        SET last_seen_at = now()
+        WHERE id = (SELECT id
+                    FROM session
+                    WHERE user_id = CAST(:user_id AS uuid)
+                      AND fingerprint = :fingerprint
+                      AND state = 'active'
+                      AND last_seen_at > now() - make_interval(secs => :idle_s)
+                    ORDER BY last_seen_at DESC
+                    LIMIT 1)
+        RETURNING id
+    ), created AS (
+        INSERT INTO session (user_id, ip_address, user_agent, state, fingerprint, last_seen_at)
+        SELECT CAST(:user_id AS uuid), :ip, :user_agent, 'active', :fingerprint, now()
+        WHERE NOT EXISTS (SELECT 1 FROM reused)
+        RETURNING id
+    )
+    INSERT INTO conversation (user_id, session_id, title)
+    SELECT CAST(:user_id AS uuid), sess.id, :title
+    FROM (SELECT id FROM reused UNION ALL SELECT id FROM created) AS sess
+    RETURNING id, title, status, storage_size, message_count, last_message_at, last_message_preview,
+              created_at, updated_at
+    """
+)
+
+
+def client_fingerprint(ip: str | None, user_agent: str | None) -> str:
+    """Same value as fn_session_fingerprint(ip_address, user_agent) in console.sql."""
+    return hashlib.sha256(f"{ip or ''}|{user_agent or ''}".encode("utf-8")).hexdigest()
+
+
+async def create_conversation_in_session(
+        db: AsyncSession,
+        user_id: UUID,
+        ip: str | None,
+        user_agent: str | None,
+        title: str,
+) -> dict[str, Any]:
+    """
+    Insert a conversation in the client's current session (or a new one) and return
+    its columns. Runs in the caller's transaction; the caller commits.
+    """
+    row = (
+        await db.execute(
+            _CREATE_CONVERSATION_SQL,
+            {
+                "user_id": str(user_id),
+                "fingerprint": client_fingerprint(ip, user_agent),
+                # A negative window matches no session: reuse disabled
+                "idle_s": float(settings.SESSION_REUSE_IDLE_S) if settings.SESSION_REUSE_IDLE_S > 0 else -1.0,
+                "ip": ip,
+                "user_agent": user_agent,
+                "title": title,
+            },
+        )
+    ).one()
+    return dict(row._mapping)
@@ -0,0 +1,213 @@
+# backend/app/services/sse.py
+"""Server-sent event framing for the chat relay.
+
+Ollama emits one event per token. Relaying each one as its own frame means
+one JSON dump, one encode and one ASGI write per token, so `coalesce_deltas`
+merges consecutive delta/thinking events and flushes them every
+SSE_COALESCE_MS or SSE_COALESCE_MAX_BYTES, whichever comes first. Frames are
+serialized with orjson when it is installed (compact json otherwise).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import deque
+from typing import AsyncIterator
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+_FRAME_PREFIX = b"data: "
+_FRAME_SUFFIX = b"\n\n"
+_MERGEABLE = ("delta", "thinking")
+# Seconds of history behind the frames/sec figure
+_RATE_WINDOW_S = 60
+
+
+def encode_json(obj: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class _FrameStats:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.upstream_events = 0
+        # (second, frames) buckets for the recent rate
+        self._buckets: deque[list[int]] = deque()
+
+    def record(self, size: int) -> None:
+        self.frames += 1
+        self.bytes += size
+        now = int(time.monotonic())
+        if self._buckets and self._buckets[-1][0] == now:
+            self._buckets[-1][1] += 1
+        else:
+            self._buckets.append([now, 1])
+        while self._buckets and self._buckets[0][0] <= now - _RATE_WINDOW_S:
+            self._buckets.popleft()
+
+    def snapshot(self) -> dict:
+        now = int(time.monotonic())
+        recent = sum(n for sec, n in self._buckets if sec > now - _RATE_WINDOW_S)
+        return {
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "upstream_events": self.upstream_events,
+            "bytes_per_frame": round(self.bytes / self.frames, 1) if self.frames else 0.0,
+            "events_per_frame": round(self.upstream_events / self.frames, 2) if self.frames else 0.0,
+            "frames_per_sec": round(recent / _RATE_WINDOW_S, 2),
+        }
+
+
+# Module-level singleton shared by all streams of this process
+frame_stats = _FrameStats()
+
+
+def encode_frame(event: dict, event_id: int | None = None) -> bytes:
+    """One `[id: N\\n]data: {...}\\n\\n` frame, ready to hand to StreamingResponse."""
+    frame = _FRAME_PREFIX + encode_json(event) + _FRAME_SUFFIX
+    if event_id is not None:
+        frame = b"id: %d\n" % event_id + frame
+    frame_stats.record(len(frame))
+    return frame
+
+
+async def iter_frames(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int | None, bytes]]:
+    """
+    Split an SSE byte stream back into (event id, JSON payload) pairs. Chunks may hold
+    several frames or cut one in half (drained queues, spill file reads).
+    """
+    buf = b""
+    async for chunk in chunks:
+        buf += chunk
+        *complete, buf = buf.split(_FRAME_SUFFIX)
+        for raw in complete:
+            event_id: int | None = None
+            data = b""
+            for line in raw.split(b"\n"):
+                if line.startswith(b"id: "):
+                    event_id = int(line[4:])
+                elif line.startswith(_FRAME_PREFIX):
+                    data = line[len(_FRAME_PREFIX):]
+            if data:
+                yield event_id, data
+
+
+def _delta_text(ev: dict) -> str:
+    return ev.get("delta") or (ev.get("reasoning") if ev.get("type") == "thinking" else "") or ""
+
+
+class _Coalescer:
+    """
+    Buffer filled by a pump task reading upstream. The relay sleeps until a frame is
+    ready (size cap, flush timer or a pass-through event), so it wakes per frame, not per token.
+    """
+
+    def __init__(self, interval_ms: float, max_bytes: int):
+        self.interval_s = interval_ms / 1000
+        self.max_bytes = max_bytes
+        self.ready: deque[dict] = deque()
+        self.kind: str | None = None
+        self.parts: list[str] = []
+        self.size = 0
+        self.done = False
+        self.error: BaseException | None = None
+        self.wake = asyncio.Event()
+        self._timer: asyncio.TimerHandle | None = None
+
+    def take(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.parts:
+            self.ready.append({"type": self.kind, "delta": "".join(self.parts)})
+            self.kind, self.parts, self.size = None, [], 0
+            self.wake.set()
+
+    def push(self, ev: dict) -> None:
+        frame_stats.upstream_events += 1
+        mtype = ev.get("type")
+        if mtype not in _MERGEABLE:
+            self.take()
+            self.ready.append(ev)
+            self.wake.set()
+            return
+        text = _delta_text(ev)
+        if not text:
+            return
+        if self.parts and self.kind != mtype:
+            self.take()
+        if not self.parts:
+            self.kind = mtype
+            if self.interval_s > 0:
+                self._timer = asyncio.get_running_loop().call_later(self.interval_s, self.take)
+        self.parts.append(text)
+        self.size += len(text.encode("utf-8"))
+        if 0 < self.max_bytes <= self.size:
+            self.take()
+
+    async def pump(self, upstream: AsyncIterator[dict]) -> None:
+        try:
+            async for ev in upstream:
+                self.push(ev)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.take()
+            self.done = True
+            self.wake.set()
+            aclose = getattr(upstream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+async def coalesce_deltas(
+        events: AsyncIterator[dict],
+        interval_ms: float | None = None,
+        max_bytes: int | None = None,
+) -> AsyncIterator[dict]:
+    """
+    Merge runs of same-type delta/thinking events from `events`. A merged event is
+    flushed once its first piece is `interval_ms` old or it reaches `max_bytes`,
+    and always before an event of another type. Other events pass through unchanged.
+    """
+    interval_ms = settings.SSE_COALESCE_MS if interval_ms is None else interval_ms
+    max_bytes = settings.SSE_COALESCE_MAX_BYTES if max_bytes is None else max_bytes
+
+    if interval_ms <= 0 and max_bytes <= 0:
+        try:
+            async for ev in events:
+                frame_stats.upstream_events += 1
+                yield ev
+        finally:
+            # Closing this generator closes upstream too, as the pump does below
+            aclose = getattr(events, "aclose", None)
+            if aclose is not None:
+                await aclose()
+        return
+
+    state = _Coalescer(interval_ms, max_bytes)
+    pump = asyncio.create_task(state.pump(events))
+    try:
+        while True:
+            await state.wake.wait()
+            state.wake.clear()
+            while state.ready:
+                yield state.ready.popleft()
+            if state.done:
+                if state.error is not None:
+                    raise state.error
+                return
+    finally:
+        pump.cancel()
+        await asyncio.gather(pump, return_exceptions=True)
+        state.take()  # drop the flush timer
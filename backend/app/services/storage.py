@@ -1,10 +1,10 @@
 # backend/app/services/storage.py
+import errno
+import fcntl
 import hashlib
-import re
-import unicodedata
+import os
 from pathlib import Path
-from typing import Tuple
-from uuid import UUID
+from uuid import UUID, uuid4
 
 from app.core.config import settings
 
@@ -15,69 +15,153 @@ def ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
-def _sanitize_filename(name: str, maxlen: int = 120) -> str:
+def incoming_path(user_id: UUID) -> Path:
     """
-    Generate "safe filenames" (for disk storage), preserving the extension:
-    - Replace whitespace characters with underscores
-    - Remove problematic symbols: quotes, backticks, ?, *, <, >, |, %, #, &, +, :, ;, {}, etc.
-    - Limit total length to avoid excessively long filenames
-    - Allow common Chinese, Japanese, and Korean characters; disallow path separators
+    Temp file for an upload being received: {STORAGE_ROOT}/{user_id}/.incoming/{uuid_hex}.part
+    Same filesystem as the final location, so finishing it is an atomic rename.
     """
-    # Extract extension and normalize
-    name = name.replace("/", "_").replace("\\", "_")
-    name = unicodedata.normalize("NFKC", name)
-    # Split extension
-    if "." in name:
-        stem, ext = name.rsplit(".", 1)
-        ext = "." + ext
-    else:
-        stem, ext = name, ""
-
-    # Whitespace -> Underscore
-    stem = re.sub(r"\s+", "_", stem)
-    # Remove problematic symbols
-    stem = re.sub(r"[\"'`?*<>|%#&+:;{}^$@!~=$begin:math:display$$end:math:display$()`]", "", stem)
-    # Keep safety symbols（letter number ._-() CJK）
-    stem = re.sub(r"[^0-9A-Za-z._\-()\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7a3]", "_", stem)
-    # Restrict length
-    keep = maxlen - len(ext)
-    if keep < 1:
-        keep = maxlen
-        ext = ""
-    stem = stem[:keep] if len(stem) > keep else stem
-    # Avoid empty filename
-    if not stem:
-        stem = "file"
-
-    return stem + ext
-
-
-def save_upload_to_disk(user_id: UUID, filename: str, fileobj) -> Tuple[str, int, str]:
+    incoming_dir = Path(settings.STORAGE_ROOT) / str(user_id) / ".incoming"
+    ensure_dir(incoming_dir)
+    return incoming_dir / f"{uuid4().hex}.part"
+
+
+def upload_session_path(user_id: UUID, session_id: UUID) -> Path:
+    """File of a resumable upload session: {STORAGE_ROOT}/{user_id}/.incoming/{session_id}.part"""
+    return Path(settings.STORAGE_ROOT) / str(user_id) / ".incoming" / f"{session_id}.part"
+
+
+def preallocate(path: Path, size: int) -> None:
     """
-    Save uploaded file to disk storage.
-      - Dictory: {STORAGE_ROOT}/{user_id}/{uuid_hex}_{safe_filename}
-      - Return: (storage_url, size_bytes, sha256_hex)
+    Create `path` with `size` bytes allocated up front: chunk writes then never extend the
+    file, and a full disk is reported when the session is created rather than halfway.
     """
-    # Clean filename
-    safe_name = _sanitize_filename(filename)
-    user_dir = Path(settings.STORAGE_ROOT) / str(user_id)
-    ensure_dir(user_dir)
+    ensure_dir(path.parent)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        if size:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+                # Filesystem without fallocate: a sparse file of the final size
+                os.ftruncate(fd, size)
+    except BaseException:
+        os.close(fd)
+        path.unlink(missing_ok=True)
+        raise
+    os.close(fd)
+
+
+class ChunkWriter:
+    """
+    Positional writes (pwrite) into a preallocated upload file, starting at `offset`; chunks
+    of one session can be written concurrently. Holds a shared flock until closed, so
+    `lock_part` (exclusive) waits for writes in flight. Blocking: call off the event loop.
+    """
+
+    def __init__(self, path: Path, offset: int):
+        self.position = offset
+        self.written = 0
+        self._fd = os.open(path, os.O_WRONLY)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_SH)
+        except BaseException:
+            os.close(self._fd)
+            raise
 
-    # Use sha256 prefix to avoid too many files in one directory
-    prefix = hashlib.sha256(safe_name.encode("utf-8")).hexdigest()[:8]
-    target_path = user_dir / f"{prefix}_{safe_name}"
+    def write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            n = os.pwrite(self._fd, view, self.position)
+            view = view[n:]
+            self.position += n
+            self.written += n
 
+    def close(self) -> None:
+        os.close(self._fd)  # also drops the flock
+
+
+def lock_part(path: Path) -> int:
+    """Open an upload file with an exclusive flock (no chunk writes in flight); the caller closes the fd."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def hash_fd(fd: int) -> str:
     sha = hashlib.sha256()
-    size = 0
-    with open(target_path, "wb") as out:
-        while True:
-            chunk = fileobj.read(CHUNK)
-            if not chunk:
-                break
-            out.write(chunk)
-            size += len(chunk)
-            sha.update(chunk)
-
-    # Save storage URL (can be changed later)
-    storage_url = str(target_path)
-    return storage_url, size, sha.hexdigest()
+    position = 0
+    while block := os.pread(fd, CHUNK, position):
+        sha.update(block)
+        position += len(block)
+    return sha.hexdigest()
+
+
+def blob_path(sha256_hex: str) -> Path:
+    """
+    Content-addressed location of a file: {STORAGE_ROOT}/blobs/{sha[0:2]}/{sha[2:4]}/{sha256}
+    Two directory levels keep any one directory small.
+    """
+    return Path(settings.STORAGE_ROOT) / "blobs" / sha256_hex[:2] / sha256_hex[2:4] / sha256_hex
+
+
+class HashingFileWriter:
+    """
+    Writes a new file while hashing it (sha256). Blocking: call its methods off the event loop
+    (asyncio.to_thread); hashlib releases the GIL on large buffers, so hashing runs in parallel too.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.size = 0
+        self._sha = hashlib.sha256()
+        self._out = open(path, "xb")
+
+    def write(self, data: bytes) -> None:
+        self._out.write(data)
+        self._sha.update(data)
+        self.size += len(data)
+
+    def close(self) -> None:
+        self._out.close()
+
+    def discard(self) -> None:
+        self._out.close()
+        self.path.unlink(missing_ok=True)
+
+    def hexdigest(self) -> str:
+        return self._sha.hexdigest()
+
+
+def store_blob(src: Path, sha256_hex: str) -> bool:
+    """
+    Move a received file into the blob store, unless that content is already there (then
+    `src` is left for the caller to remove). Returns whether the file was moved. The move is
+    an atomic rename within STORAGE_ROOT: readers see either nothing or the complete file.
+    """
+    target = blob_path(sha256_hex)
+    if target.exists():
+        return False
+    ensure_dir(target.parent)
+    os.replace(src, target)
+    return True
+
+
+def remove_blob(sha256_hex: str) -> None:
+    blob_path(sha256_hex).unlink(missing_ok=True)
+
+
+def unstore_blob(sha256_hex: str, dest: Path) -> None:
+    """
+    Undo store_blob for an upload that failed before anything referenced the blob: the file
+    goes back to `dest` (a resumable upload can then be finalized again), or is removed.
+    """
+    try:
+        os.replace(blob_path(sha256_hex), dest)
+    except FileNotFoundError:
+        remove_blob(sha256_hex)
@@ -0,0 +1,356 @@
+# backend/app/services/streams.py
+"""In-process pub/sub hub of live chat generations, keyed by conversation id.
+
+A generation runs as a background task that publishes its events into a
+`LiveStream`; HTTP responses are only subscribers, any number per stream, each
+with its own bounded queue so a slow viewer cannot hold up the producer or the
+others. Every frame carries an `id:` line from one process-wide counter, so ids
+increase monotonically across streams and a reconnecting client can send
+`Last-Event-ID` to replay what it missed from the bounded buffer. Late joiners
+and subscribers whose queue overflowed get a `snapshot` event with the text
+accumulated so far instead. Finished streams stay replayable for
+STREAM_REPLAY_TTL_S; a generation nobody has listened to for
+STREAM_ABANDON_AFTER_S stops early (the partial answer is still saved).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import time
+from collections import deque
+import tempfile
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable
+from uuid import UUID
+
+from app.core.config import settings
+from app.services import metrics
+from app.services.sse import encode_frame
+
+logger = logging.getLogger(__name__)
+
+# Process-wide event ids: later streams always get larger ids
+_event_ids = itertools.count(1)
+_SPILL_READ_BYTES = 64 * 1024
+
+
+class GenerationInProgress(Exception):
+    """The conversation already has a live generation; a second one would orphan it."""
+
+
+class _Subscriber:
+    def __init__(self):
+        self.queue: deque[bytes] = deque()
+        self.queued_bytes = 0
+        # Frames were dropped for this subscriber; send a snapshot before anything else
+        self.resync = False
+        # Too far behind under the "drop" policy; ends this subscriber's stream
+        self.dropped = False
+        # Overflow file under the "spill" policy: frames after the in-memory queue, in order
+        self.spill: BinaryIO | None = None
+        self.spill_written = 0
+        self.spill_read = 0
+        self.wake = asyncio.Event()
+
+    def enqueue(self, frame: bytes) -> None:
+        self.queue.append(frame)
+        self.queued_bytes += len(frame)
+
+    def drain(self) -> bytes:
+        """Everything queued in memory as one chunk: one ASGI write per wake-up, not per frame."""
+        chunk = b"".join(self.queue)
+        self.queue.clear()
+        self.queued_bytes = 0
+        return chunk
+
+    def spill_frame(self, frame: bytes) -> None:
+        if self.spill is None:
+            self.spill = tempfile.TemporaryFile(dir=settings.STREAM_SPILL_DIR or None)
+            metrics.incr("streams.spills")
+        self.spill.seek(self.spill_written)
+        self.spill.write(frame)
+        self.spill_written += len(frame)
+        metrics.incr("streams.spilled_bytes", len(frame))
+
+    def read_spill(self) -> bytes:
+        self.spill.flush()
+        self.spill.seek(self.spill_read)
+        chunk = self.spill.read(_SPILL_READ_BYTES)
+        self.spill_read += len(chunk)
+        if self.spill_read >= self.spill_written:
+            # Caught up: back to the in-memory queue
+            self.close_spill()
+        return chunk
+
+    @property
+    def spilling(self) -> bool:
+        return self.spill is not None
+
+    def close_spill(self) -> None:
+        if self.spill is not None:
+            self.spill.close()
+            self.spill = None
+            self.spill_written = self.spill_read = 0
+
+
+class LiveStream:
+    def __init__(self, conversation_id: UUID, user_id: UUID, idempotency_key: str | None = None):
+        self.conversation_id = conversation_id
+        self.user_id = user_id
+        # Idempotency-Key of the request that started this generation; its retries attach here
+        self.idempotency_key = idempotency_key
+        # (event id, encoded frame), oldest first
+        self.frames: deque[tuple[int, bytes]] = deque()
+        self.last_id = 0
+        # Id of the newest frame dropped from the replay buffer (0 = nothing dropped yet)
+        self.trimmed_upto = 0
+        self.done = False
+        self.finished_at: float | None = None
+        self.task: asyncio.Task | None = None
+        # A client asked to stop generating; the partial answer is still saved
+        self.stop_requested = False
+        self._subscribers: set[_Subscriber] = set()
+        self._detached_at = time.monotonic()
+        # Accumulated state for snapshots sent to late joiners and lagging subscribers
+        self._state: dict = {}
+        self._answer: list[str] = []
+        self._reasoning: list[str] = []
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    # === Producer side ===
+    def publish(self, event: dict) -> None:
+        event_id = next(_event_ids)
+        frame = encode_frame(event, event_id=event_id)
+        self.frames.append((event_id, frame))
+        self.last_id = event_id
+        while len(self.frames) > settings.STREAM_BUFFER_MAX_FRAMES:
+            self.trimmed_upto = self.frames.popleft()[0]
+        self._accumulate(event)
+        for sub in self._subscribers:
+            self._offer(sub, frame)
+
+    def close(self) -> None:
+        if not self.done:
+            self.done = True
+            self.finished_at = time.monotonic()
+            for sub in self._subscribers:
+                sub.wake.set()
+
+    def request_stop(self) -> None:
+        self.stop_requested = True
+
+    def should_stop(self) -> bool:
+        """The producer should wind down: stop requested, or abandoned by every client."""
+        return self.stop_requested or self.abandoned()
+
+    def abandoned(self) -> bool:
+        """No client has been attached for STREAM_ABANDON_AFTER_S."""
+        return (
+            not self._subscribers
+            and settings.STREAM_ABANDON_AFTER_S > 0
+            and time.monotonic() - self._detached_at > settings.STREAM_ABANDON_AFTER_S
+        )
+
+    def _accumulate(self, event: dict) -> None:
+        mtype = event.get("type")
+        if mtype == "delta":
+            self._answer.append(event.get("delta") or "")
+        elif mtype == "thinking":
+            self._reasoning.append(event.get("delta") or "")
+        elif mtype == "model":
+            self._state["model"] = event.get("model")
+            self._state["model_size"] = event.get("model_size")
+        elif mtype == "complete":
+            if event.get("answer") and not self._answer:
+                self._answer.append(event["answer"])
+            if event.get("reasoning"):
+                self._reasoning = [event["reasoning"]]
+            self._state["usage"] = event.get("usage")
+            self._state["latency_ms"] = event.get("latency_ms")
+            self._state["completed"] = True
+        elif mtype == "saved":
+            self._state["message_id"] = event.get("message_id")
+        elif mtype == "error":
+            self._state["error"] = event.get("error")
+
+    def snapshot_frame(self) -> bytes:
+        """Everything generated so far as one event, tagged with the latest event id."""
+        event = {
+            "type": "snapshot",
+            **self._state,
+            "answer": "".join(self._answer),
+            "reasoning": "".join(self._reasoning),
+            "done": self.done,
+        }
+        return encode_frame(event, event_id=self.last_id or None)
+
+    # === Subscriber side ===
+    def _offer(self, sub: _Subscriber, frame: bytes) -> None:
+        if sub.resync or sub.dropped:
+            # A pending snapshot already covers this frame / the subscriber is going away
+            metrics.incr("streams.dropped_frames")
+        elif sub.spilling:
+            # Keep order: once spilling, everything goes to the file until the reader catches up
+            self._spill_or_drop(sub, frame)
+        elif sub.queued_bytes + len(frame) > settings.STREAM_SUBSCRIBER_QUEUE_BYTES:
+            self._overflow(sub, frame)
+        else:
+            sub.enqueue(frame)
+        sub.wake.set()
+
+    def _overflow(self, sub: _Subscriber, frame: bytes) -> None:
+        """A subscriber fell more than STREAM_SUBSCRIBER_QUEUE_BYTES behind the producer."""
+        policy = settings.STREAM_SLOW_CONSUMER_POLICY
+        if policy == "spill":
+            self._spill_or_drop(sub, frame)
+        elif policy == "drop":
+            metrics.incr("streams.dropped_frames", len(sub.queue) + 1)
+            metrics.incr("streams.dropped_clients")
+            sub.drain()
+            sub.dropped = True
+        else:
+            # resync: drop its backlog rather than hold up the producer or other viewers
+            metrics.incr("streams.dropped_frames", len(sub.queue) + 1)
+            metrics.incr("streams.resyncs")
+            sub.drain()
+            sub.resync = True
+
+    def _spill_or_drop(self, sub: _Subscriber, frame: bytes) -> None:
+        if sub.spill_written - sub.spill_read + len(frame) > settings.STREAM_SPILL_MAX_BYTES:
+            metrics.incr("streams.dropped_frames")
+            metrics.incr("streams.dropped_clients")
+            sub.close_spill()
+            sub.drain()
+            sub.dropped = True
+            return
+        try:
+            sub.spill_frame(frame)
+        except OSError:
+            logger.exception("stream spill failed; resyncing subscriber")
+            sub.close_spill()
+            sub.drain()
+            sub.resync = True
+
+    def _prefill(self, sub: _Subscriber, last_event_id: int | None) -> None:
+        if last_event_id is None:
+            # Joining viewer: current state in one frame, then live deltas
+            sub.resync = self.last_id > 0
+            return
+        if self.trimmed_upto > last_event_id:
+            # Part of what the client missed has already left the replay buffer
+            sub.resync = True
+            return
+        # Ids are process-wide, so other streams' ids interleave with ours: filter, don't index
+        backlog = [frame for event_id, frame in self.frames if event_id > last_event_id]
+        if sum(len(f) for f in backlog) > settings.STREAM_SUBSCRIBER_QUEUE_BYTES:
+            sub.resync = True
+        else:
+            for frame in backlog:
+                sub.enqueue(frame)
+
+    async def follow(self, last_event_id: int | None = None) -> AsyncIterator[bytes]:
+        """
+        Frames after `last_event_id` from the replay buffer, then the live tail. With no
+        id, or when the gap is no longer buffered, a snapshot event stands in for the replay.
+        """
+        sub = _Subscriber()
+        self._prefill(sub, last_event_id)
+        self._subscribers.add(sub)
+        metrics.incr("streams.subscribed")
+        try:
+            while True:
+                if sub.dropped:
+                    # The client can reconnect with Last-Event-ID and resume from what it has
+                    yield encode_frame({"type": "error", "error": "slow_consumer"})
+                    return
+                if sub.resync:
+                    sub.resync = False
+                    yield self.snapshot_frame()
+                    continue
+                if sub.queue:
+                    yield sub.drain()
+                    continue
+                if sub.spilling:
+                    yield sub.read_spill()
+                    continue
+                if self.done:
+                    return
+                sub.wake.clear()
+                await sub.wake.wait()
+        finally:
+            sub.close_spill()
+            self._subscribers.discard(sub)
+            if not self._subscribers:
+                self._detached_at = time.monotonic()
+
+    def expired(self, now: float) -> bool:
+        return self.done and self.finished_at is not None and now - self.finished_at > settings.STREAM_REPLAY_TTL_S
+
+
+class StreamRegistry:
+    def __init__(self):
+        # Newest generation per conversation
+        self._streams: dict[UUID, LiveStream] = {}
+
+    def start(
+            self,
+            conversation_id: UUID,
+            user_id: UUID,
+            produce: Callable[[LiveStream], Awaitable[None]],
+            idempotency_key: str | None = None,
+    ) -> LiveStream:
+        """
+        Run `produce(stream)` as a background task that outlives the request which started it.
+        Raises GenerationInProgress while the conversation's previous generation is still live.
+        """
+        self._purge()
+        if self.busy(conversation_id):
+            raise GenerationInProgress()
+        stream = LiveStream(conversation_id, user_id, idempotency_key)
+        self._streams[conversation_id] = stream
+        stream.task = asyncio.create_task(self._run(stream, produce))
+        metrics.incr("streams.started")
+        return stream
+
+    def busy(self, conversation_id: UUID) -> bool:
+        existing = self._streams.get(conversation_id)
+        return existing is not None and not existing.done
+
+    def get(self, conversation_id: UUID, user_id: UUID) -> LiveStream | None:
+        self._purge()
+        stream = self._streams.get(conversation_id)
+        if stream is None or stream.user_id != user_id:
+            return None
+        return stream
+
+    async def _run(self, stream: LiveStream, produce: Callable[[LiveStream], Awaitable[None]]) -> None:
+        try:
+            await produce(stream)
+        except Exception:
+            logger.exception("stream producer for conversation %s failed", stream.conversation_id)
+        finally:
+            stream.close()
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for cid in [cid for cid, s in self._streams.items() if s.expired(now)]:
+            del self._streams[cid]
+
+    def snapshot(self) -> dict:
+        self._purge()
+        live = [s for s in self._streams.values() if not s.done]
+        return {
+            "live": len(live),
+            "replayable": len(self._streams) - len(live),
+            "subscribers": sum(s.subscribers for s in self._streams.values()),
+            "max_subscribers_per_stream": max((s.subscribers for s in self._streams.values()), default=0),
+            "buffered_frames": sum(len(s.frames) for s in self._streams.values()),
+        }
+
+
+# Module-level singleton shared by the stream and resume routes
+stream_registry = StreamRegistry()
@@ -0,0 +1,169 @@
+# backend/app/services/tokens.py
+"""Fast local token estimator shared by chat routing, prompt budgeting and analytics.
+
+Token counts are modelled per model family as a linear function of three
+cheap character counts (CJK, ASCII, other). The coefficients start from
+per-family priors and are calibrated online with recursive least squares
+against the `prompt_eval_count` / `eval_count` Ollama reports back, so the
+estimate tracks each tokenizer without shipping the tokenizers themselves.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, Sequence
+
+# Runs, not single chars: one match per CJK stretch instead of one per character
+_CJK_RE = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7a3\uff00-\uffef]+")
+_FAMILY_RE = re.compile(r"^[a-z]+")
+# Joins a batch for one pass; ASCII, so it survives both the CJK strip and the ASCII encode.
+# Postgres text cannot hold NUL, so stored messages never contain it
+_BATCH_SEP = "\x00"
+
+# Chat-template tokens added around every message
+PER_MESSAGE_OVERHEAD_TOKENS = 4
+
+# Tokens per (CJK char, ASCII char, other char)
+_PRIORS: dict[str, tuple[float, float, float]] = {
+    "qwen": (0.75, 0.25, 0.5),
+    "gemma": (0.9, 0.25, 0.5),
+    "default": (1.0, 0.25, 0.5),
+}
+
+# Forgetting factor: older samples weigh less so the fit follows model swaps
+_RLS_LAMBDA = 0.995
+# Initial covariance; small enough that one sample nudges the priors rather than
+# replacing them, large enough to converge within a few dozen ~500-char samples
+_RLS_P0 = 1e-5
+# Prompt samples far below the estimate are prefix-cache hits, not tokenizer signal
+_MIN_PROMPT_SAMPLE_RATIO = 0.5
+
+Features = tuple[int, int, int]
+
+
+def text_features(text: str | None) -> Features:
+    s = text or ""
+    if s.isascii():
+        return 0, len(s), 0
+    cjk = len(s) - len(_CJK_RE.sub("", s))
+    ascii_chars = len(s.encode("ascii", "ignore"))
+    return cjk, ascii_chars, len(s) - cjk - ascii_chars
+
+
+def batch_features(texts: Sequence[str | None]) -> list[Features]:
+    """
+    text_features for many strings. ASCII-only texts (the common case) cost no scan;
+    the rest are joined so the CJK strip and the ASCII encode each run once per batch.
+    """
+    items = [t or "" for t in texts]
+    out: list[Features] = [(0, len(t), 0) for t in items]
+    rest = [i for i, t in enumerate(items) if not t.isascii()]
+    if not rest:
+        return out
+    joined = _BATCH_SEP.join(items[i] for i in rest)
+    if joined.count(_BATCH_SEP) != len(rest) - 1:
+        for i in rest:
+            out[i] = text_features(items[i])
+        return out
+    # Per-text lengths of the non-CJK remainder and of the ASCII-only encoding
+    non_cjk = _CJK_RE.sub("", joined).split(_BATCH_SEP)
+    ascii_only = joined.encode("ascii", "ignore").split(_BATCH_SEP.encode())
+    for i, kept, asc in zip(rest, non_cjk, ascii_only):
+        out[i] = (len(items[i]) - len(kept), len(asc), len(kept) - len(asc))
+    return out
+
+
+def _sum_features(items: Iterable[Features]) -> Features:
+    c = a = o = 0
+    for fc, fa, fo in items:
+        c += fc
+        a += fa
+        o += fo
+    return c, a, o
+
+
+def model_family(model: str | None) -> str:
+    """'qwen3:4b' -> 'qwen', 'gemma3:1b' -> 'gemma'; unknown models share 'default'."""
+    m = _FAMILY_RE.match((model or "").lower())
+    family = m.group(0) if m else ""
+    return family if family in _PRIORS else "default"
+
+
+@dataclass
+class _FamilyModel:
+    coef: list[float]
+    p: list[list[float]] = field(default_factory=lambda: [[_RLS_P0 if i == j else 0.0 for j in range(3)] for i in range(3)])
+    samples: int = 0
+
+    def predict(self, x: Features) -> float:
+        return self.coef[0] * x[0] + self.coef[1] * x[1] + self.coef[2] * x[2]
+
+    def update(self, x: Features, observed: float) -> None:
+        # Recursive least squares: k = Px / (lambda + x'Px); coef += k * err; P = (P - k x'P) / lambda
+        px = [sum(self.p[i][j] * x[j] for j in range(3)) for i in range(3)]
+        denom = _RLS_LAMBDA + sum(x[i] * px[i] for i in range(3))
+        if denom <= 0:
+            return
+        k = [v / denom for v in px]
+        err = observed - self.predict(x)
+        self.coef = [max(0.0, self.coef[i] + k[i] * err) for i in range(3)]
+        self.p = [[(self.p[i][j] - k[i] * px[j]) / _RLS_LAMBDA for j in range(3)] for i in range(3)]
+        self.samples += 1
+
+
+class TokenEstimator:
+    def __init__(self):
+        self._families: dict[str, _FamilyModel] = {}
+
+    def _get(self, family: str) -> _FamilyModel:
+        fm = self._families.get(family)
+        if fm is None:
+            fm = self._families[family] = _FamilyModel(coef=list(_PRIORS.get(family, _PRIORS["default"])))
+        return fm
+
+    # === Estimation ===
+    def estimate(self, text: str | None, model: str | None = None) -> int:
+        if not text:
+            return 0
+        return max(1, round(self._get(model_family(model)).predict(text_features(text))))
+
+    def estimate_batch(self, texts: Sequence[str | None], model: str | None = None) -> list[int]:
+        """Estimate many strings at once: one feature pass over the batch, one coefficient lookup."""
+        c0, c1, c2 = self._get(model_family(model)).coef
+        return [
+            max(1, round(c0 * c + c1 * a + c2 * o)) if text else 0
+            for text, (c, a, o) in zip(texts, batch_features(texts))
+        ]
+
+    def estimate_messages(self, messages: Sequence[dict], model: str | None = None) -> int:
+        contents = [str(m.get("content") or "") for m in messages]
+        return sum(self.estimate_batch(contents, model)) + PER_MESSAGE_OVERHEAD_TOKENS * len(messages)
+
+    # === Calibration ===
+    def observe_prompt(self, model: str | None, messages: Sequence[dict], prompt_eval_count: int) -> None:
+        """Calibrate against Ollama's prompt_eval_count for the messages that were sent."""
+        if prompt_eval_count <= 0 or not messages:
+            return
+        fm = self._get(model_family(model))
+        x = _sum_features(batch_features([str(m.get("content") or "") for m in messages]))
+        observed = prompt_eval_count - PER_MESSAGE_OVERHEAD_TOKENS * len(messages)
+        if observed <= 0 or observed < _MIN_PROMPT_SAMPLE_RATIO * fm.predict(x):
+            return
+        fm.update(x, observed)
+
+    def observe_output(self, model: str | None, text: str, eval_count: int) -> None:
+        """Calibrate against Ollama's eval_count for everything generated (answer + reasoning)."""
+        if eval_count <= 0 or not text:
+            return
+        self._get(model_family(model)).update(text_features(text), eval_count)
+
+    def snapshot(self) -> dict[str, dict]:
+        return {
+            family: {"coef": [round(c, 4) for c in fm.coef], "samples": fm.samples}
+            for family, fm in self._families.items()
+        }
+
+
+# Module-level singleton shared across routes and clients
+token_estimator = TokenEstimator()
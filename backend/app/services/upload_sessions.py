@@ -0,0 +1,229 @@
+# backend/app/services/upload_sessions.py
+"""Resumable upload sessions.
+
+A session announces a file (name, size, sha256) and gets a file preallocated at its full
+size under the user's .incoming directory. Chunks are PUT by offset, in any order and in
+parallel, and written in place with pwrite; each completed chunk is recorded as a byte
+range, so a client that lost its connection asks which ranges arrived and sends the rest.
+Finalize checks that the ranges cover the file, verifies the sha256 and hands the file
+to the normal upload path, which renames it into the blob store (no copy). Sessions with
+no chunk for UPLOAD_SESSION_TTL_S are swept together with their file.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime
+import logging
+import time
+from typing import Iterable
+from uuid import UUID
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.document import UploadChunk, UploadSession
+from app.services import metrics
+from app.services.storage import upload_session_path
+
+logger = logging.getLogger(__name__)
+
+
+def _expires_at():
+    return func.now() + datetime.timedelta(seconds=settings.UPLOAD_SESSION_TTL_S)
+
+
+async def open_sessions(db: AsyncSession, user_id: UUID) -> tuple[int, int]:
+    """(count, total size) of the user's unexpired sessions: space a new session must leave them."""
+    count, size = (await db.execute(
+        select(func.count(), func.coalesce(func.sum(UploadSession.size_bytes), 0))
+        .where(UploadSession.user_id == user_id, UploadSession.expires_at > func.now())
+    )).one()
+    return int(count), int(size)
+
+
+async def create_session(
+        db: AsyncSession,
+        user_id: UUID,
+        filename: str,
+        mime_type: str,
+        size_bytes: int,
+        sha256_hex: str,
+        conversation_id: UUID | None,
+) -> UploadSession:
+    """Insert the session row in the caller's transaction; the caller preallocates its file before committing."""
+    session = UploadSession(
+        user_id=user_id,
+        filename=filename,
+        mime_type=mime_type,
+        size_bytes=size_bytes,
+        sha256=sha256_hex.lower(),
+        conversation_id=conversation_id,
+        expires_at=_expires_at(),
+    )
+    db.add(session)
+    await db.flush()
+    await db.refresh(session)
+    metrics.incr("uploads.sessions_created")
+    return session
+
+
+async def get_session(db: AsyncSession, user_id: UUID, session_id: UUID) -> UploadSession | None:
+    return (await db.execute(
+        select(UploadSession).where(
+            UploadSession.id == session_id,
+            UploadSession.user_id == user_id,
+            UploadSession.expires_at > func.now(),
+        )
+    )).scalar_one_or_none()
+
+
+async def record_chunk(db: AsyncSession, session_id: UUID, start: int, end: int) -> bool:
+    """
+    Record [start, end) as written and move the expiry on. False when the session is no longer
+    open (finalized, expired or aborted while the chunk was in transfer).
+    """
+    renewed = (await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == session_id, UploadSession.status == "open")
+        .values(expires_at=_expires_at())
+        .returning(UploadSession.id)
+    )).first()
+    if renewed is None:
+        return False
+    stmt = pg_insert(UploadChunk).values(session_id=session_id, start_byte=start, end_byte=end)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UploadChunk.session_id, UploadChunk.start_byte],
+        set_={"end_byte": func.greatest(UploadChunk.end_byte, stmt.excluded.end_byte)},
+    )
+    await db.execute(stmt)
+    metrics.incr("uploads.chunks")
+    return True
+
+
+def merge_ranges(ranges: Iterable[tuple[int, int]]) -> list[tuple[int, int]]:
+    """Overlapping or adjacent [start, end) ranges joined: [(start, end), ...] sorted by start."""
+    merged: list[tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+async def received_ranges(db: AsyncSession, session_id: UUID) -> list[tuple[int, int]]:
+    """Written byte ranges, merged: [(start, end), ...] sorted, end exclusive."""
+    rows = (await db.execute(
+        select(UploadChunk.start_byte, UploadChunk.end_byte)
+        .where(UploadChunk.session_id == session_id)
+        .order_by(UploadChunk.start_byte)
+    )).all()
+    return merge_ranges((start, end) for start, end in rows)
+
+
+async def begin_finalize(db: AsyncSession, user_id: UUID, session_id: UUID) -> UploadSession | None:
+    """Move an open session to 'finalizing' (chunks are refused from then on); None if it is not open."""
+    session_id = (await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.user_id == user_id,
+            UploadSession.status == "open",
+            UploadSession.expires_at > func.now(),
+        )
+        .values(status="finalizing", expires_at=_expires_at())  # not swept while being finalized
+        .returning(UploadSession.id)
+    )).scalar_one_or_none()
+    if session_id is None:
+        return None
+    return await db.get(UploadSession, session_id, populate_existing=True)
+
+
+async def reopen(db: AsyncSession, session_id: UUID) -> None:
+    """A finalize that failed (incomplete, hash mismatch, quota): the client may send chunks again."""
+    await db.execute(
+        update(UploadSession)
+        .where(UploadSession.id == session_id, UploadSession.status == "finalizing")
+        .values(status="open", expires_at=_expires_at())
+    )
+
+
+async def clear_ranges(db: AsyncSession, session_id: UUID) -> None:
+    """After a hash mismatch nothing received can be trusted: the client sends the file again."""
+    await db.execute(delete(UploadChunk).where(UploadChunk.session_id == session_id))
+
+
+async def delete_session(db: AsyncSession, session_id: UUID) -> None:
+    await db.execute(delete(UploadSession).where(UploadSession.id == session_id))
+
+
+class UploadSessionSweeper:
+    """Every UPLOAD_SESSION_SWEEP_INTERVAL_S, delete expired upload sessions and their files."""
+
+    def __init__(self):
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.sessions_expired = 0
+        self.last_run_at: float | None = None
+
+    def start(self) -> None:
+        if settings.UPLOAD_SESSION_SWEEP_INTERVAL_S > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.UPLOAD_SESSION_SWEEP_INTERVAL_S)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("upload session sweep failed")
+
+    async def run_once(self) -> int:
+        """Delete every expired session; returns how many."""
+        async with AsyncSessionLocal() as db:
+            expired = (
+                select(UploadSession.id)
+                .where(UploadSession.expires_at < func.now())
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            rows = (await db.execute(
+                delete(UploadSession)
+                .where(UploadSession.id.in_(expired))
+                .returning(UploadSession.id, UploadSession.user_id)
+            )).all()
+            await db.commit()
+        # A chunk still in transfer writes into the unlinked file and is then refused by record_chunk
+        for session_id, user_id in rows:
+            await asyncio.to_thread(upload_session_path(user_id, session_id).unlink, missing_ok=True)
+        self.runs += 1
+        self.sessions_expired += len(rows)
+        self.last_run_at = time.time()
+        if rows:
+            metrics.incr("uploads.sessions_expired", len(rows))
+        return len(rows)
+
+    def snapshot(self) -> dict:
+        return {
+            "runs": self.runs,
+            "sessions_expired": self.sessions_expired,
+            "last_run_at": self.last_run_at,
+            "running": self._task is not None and not self._task.done(),
+        }
+
+
+# Module-level singleton, started with the app
+upload_session_sweeper = UploadSessionSweeper()
@@ -0,0 +1,182 @@
+# backend/app/services/uploads.py
+"""Streaming multipart upload receiver.
+
+Starlette's form parsing spools the whole body before the handler runs. Here the request
+body is parsed as it arrives: the file part goes to a temp file in 1 MB writes off the
+event loop (hashed on the way), and an `admit(received_bytes)` callback is asked after
+every network chunk, so an upload that outgrows the user's remaining quota is cut off
+at that point instead of after it has been written in full.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.requests import Request
+
+from app.services.storage import CHUNK, HashingFileWriter
+
+# Non-file form fields are small (ids, flags)
+MAX_FIELD_BYTES = 64 * 1024
+
+
+class UploadError(Exception):
+    """The request is not a well-formed single-file multipart upload."""
+
+
+class UploadQuotaExceeded(Exception):
+    """`admit` refused the upload after `received` bytes of the file."""
+
+    def __init__(self, received: int):
+        super().__init__(received)
+        self.received = received
+
+
+@dataclass
+class ReceivedFile:
+    filename: str
+    content_type: str | None
+    temp_path: Path
+    size_bytes: int
+    sha256: str
+    fields: dict[str, str] = field(default_factory=dict)
+
+
+class _MultipartSink:
+    """python-multipart callbacks: collects form fields and buffers the file part's bytes."""
+
+    def __init__(self, file_field: str):
+        self.file_field = file_field
+        self.fields: dict[str, str] = {}
+        self.filename: str | None = None
+        self.content_type: str | None = None
+        self.pending = bytearray()
+        self.received = 0
+        self.ended = False
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._headers: dict[bytes, bytes] = {}
+        self._part: str | None = None  # "file", "field" or None (ignored)
+        self._field_name = ""
+        self._field_value = bytearray()
+        self._field_bytes = 0
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_end": self._on_end,
+        }
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._part = None
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" in options:
+            if name != self.file_field:
+                raise UploadError(f"unexpected file field: {name}")
+            if self.filename is not None:
+                raise UploadError("only one file per upload")
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            content_type = self._headers.get(b"content-type")
+            self.content_type = content_type.decode("latin-1") if content_type else None
+            self._part = "file"
+        else:
+            self._part = "field"
+            self._field_name = name
+            self._field_value.clear()
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._part == "file":
+            self.pending += data[start:end]
+            self.received += end - start
+        elif self._part == "field":
+            self._field_bytes += end - start
+            if self._field_bytes > MAX_FIELD_BYTES:
+                raise UploadError("form fields too large")
+            self._field_value += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if self._part == "field":
+            self.fields[self._field_name] = self._field_value.decode("utf-8", "replace")
+        self._part = None
+
+    def _on_end(self) -> None:
+        self.ended = True
+
+
+async def receive_multipart_file(
+        request: Request,
+        temp_path: Path,
+        admit: Callable[[int], bool] | None = None,
+        file_field: str = "file",
+) -> ReceivedFile:
+    """
+    Parse a multipart/form-data body with one file part (`file_field`) into `temp_path`.
+    Raises UploadError for malformed bodies and UploadQuotaExceeded when `admit` says no;
+    the temp file is removed on any failure, and left for the caller to move on success.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise UploadError("expected multipart/form-data")
+    sink = _MultipartSink(file_field)
+    parser = MultipartParser(params[b"boundary"], sink.callbacks())
+
+    writer = await asyncio.to_thread(HashingFileWriter, temp_path)
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except UploadError:
+                raise
+            except Exception as e:
+                raise UploadError(f"malformed multipart body: {e}") from e
+            if admit is not None and sink.pending and not admit(sink.received):
+                raise UploadQuotaExceeded(sink.received)
+            if len(sink.pending) >= CHUNK:
+                data = bytes(sink.pending)
+                sink.pending.clear()
+                await asyncio.to_thread(writer.write, data)
+        if not sink.ended:
+            raise UploadError("incomplete multipart body")
+        if sink.filename is None:
+            raise UploadError(f"missing file field: {file_field}")
+        if sink.pending:
+            await asyncio.to_thread(writer.write, bytes(sink.pending))
+            sink.pending.clear()
+        await asyncio.to_thread(writer.close)
+    except BaseException:
+        await asyncio.shield(asyncio.to_thread(writer.discard))
+        raise
+
+    return ReceivedFile(
+        filename=sink.filename,
+        content_type=sink.content_type,
+        temp_path=temp_path,
+        size_bytes=writer.size,
+        sha256=writer.hexdigest(),
+        fields=sink.fields,
+    )
@@ -0,0 +1,102 @@
+# benchmarks/bench_autorelease.py
+"""
+Time the quota auto-release (fn_quota_tag_oldest_20_percent) for one heavy user.
+
+Seeds a throwaway organization/user with CONVERSATIONS conversations and DOCUMENTS
+documents spread over the last year, pushes the user over their limit, then runs the
+release ROUNDS times (each round archives the next oldest 20%). Every round runs in
+its own transaction and the seed data is removed at the end.
+
+Usage (from backend/):
+    python benchmarks/bench_autorelease.py
+    CONVERSATIONS=50000 DOCUMENTS=2000 ROUNDS=5 EXPLAIN=1 python benchmarks/bench_autorelease.py
+"""
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+
+from app.core.database import AsyncSessionLocal  # noqa: E402
+
+CONVERSATIONS = int(os.getenv("CONVERSATIONS", "10000"))
+DOCUMENTS = int(os.getenv("DOCUMENTS", "500"))
+ROUNDS = int(os.getenv("ROUNDS", "3"))
+EXPLAIN = os.getenv("EXPLAIN", "0") == "1"
+
+_SEED = [
+    "INSERT INTO organization (id, name) VALUES (CAST(:org AS uuid), 'bench_autorelease')",
+    """INSERT INTO user_profile (id, organization_id, email, password_hash, display_name)
+       VALUES (CAST(:uid AS uuid), CAST(:org AS uuid), :email, 'x', 'bench')""",
+    "INSERT INTO session (id, user_id) VALUES (CAST(:sid AS uuid), CAST(:uid AS uuid))",
+    """INSERT INTO conversation (user_id, session_id, title, storage_size, created_at)
+       SELECT CAST(:uid AS uuid), CAST(:sid AS uuid), 'c' || g, 1000 + g % 5000,
+              now() - make_interval(mins => g)
+       FROM generate_series(1, :convs) g""",
+    """WITH docs AS (
+           INSERT INTO document (filename, mime_type, size_bytes, storage_url, created_at)
+           SELECT 'd' || g, 'text/plain', 20000 + g % 50000, 'bench://' || g,
+                  now() - make_interval(mins => g * 7)
+           FROM generate_series(1, :docs) g
+           RETURNING id, created_at)
+       INSERT INTO user_document (user_id, document_id, linked_at)
+       SELECT CAST(:uid AS uuid), id, created_at FROM docs""",
+    # Over the limit, so every round has something to release
+    "UPDATE user_storage_quota SET limit_bytes = 1 WHERE user_id = CAST(:uid AS uuid)",
+]
+_RELEASE = text("SELECT count(*), COALESCE(sum(tagged_bytes), 0) "
+                "FROM fn_quota_tag_oldest_20_percent(CAST(:uid AS uuid))")
+_EXPLAIN = text("EXPLAIN (ANALYZE, BUFFERS) SELECT * FROM fn_quota_tag_oldest_20_percent(CAST(:uid AS uuid))")
+_CLEANUP = [
+    """DELETE FROM document WHERE id IN
+           (SELECT document_id FROM user_document WHERE user_id = CAST(:uid AS uuid))""",
+    "DELETE FROM user_profile WHERE id = CAST(:uid AS uuid)",
+    "DELETE FROM organization WHERE id = CAST(:org AS uuid)",
+]
+
+
+async def main():
+    params = {
+        "org": str(uuid.uuid4()),
+        "uid": str(uuid.uuid4()),
+        "sid": str(uuid.uuid4()),
+        "email": f"bench-{uuid.uuid4().hex[:8]}@example.invalid",
+        "convs": CONVERSATIONS,
+        "docs": DOCUMENTS,
+    }
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        for sql in _SEED:
+            await db.execute(text(sql), params)
+        await db.commit()
+        for table in ("conversation", "user_document", "document"):
+            await db.execute(text(f"ANALYZE {table}"))
+        await db.commit()
+    print(f"seeded {CONVERSATIONS} conversations, {DOCUMENTS} documents "
+          f"in {time.perf_counter() - started:.1f}s")
+
+    try:
+        for n in range(1, ROUNDS + 1):
+            async with AsyncSessionLocal() as db:
+                if EXPLAIN and n == 1:
+                    plan = (await db.execute(_EXPLAIN, params)).scalars().all()
+                    print("\n".join(plan))
+                    await db.rollback()
+                t0 = time.perf_counter()
+                rows, released = (await db.execute(_RELEASE, params)).one()
+                await db.commit()
+                print(f"round {n}: released {rows:6d} rows / {released / 1e6:8.1f} MB "
+                      f"in {(time.perf_counter() - t0) * 1000:8.1f} ms")
+    finally:
+        async with AsyncSessionLocal() as db:
+            for sql in _CLEANUP:
+                await db.execute(text(sql), params)
+            await db.commit()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+# benchmarks/load_chat_no_stream.py
+"""
+Load test for POST /chat/conversations/{id}/messages (non-stream).
+
+Fires CONCURRENCY simultaneous senders against a running backend and samples
+GET /metrics while they run, so DB pool occupancy can be compared with the
+number of in-flight generations. With the connection released during
+generation, peak_checked_out should stay far below CONCURRENCY.
+
+The account must be a super-admin (GET /metrics is restricted to them).
+
+Usage (backend + LLM running):
+    API_BASE_URL=http://localhost:8000 LOAD_EMAIL=test@test.com LOAD_PASSWORD=123456 \
+    CONCURRENCY=50 ROUNDS=3 MODEL_SIZE=default python benchmarks/load_chat_no_stream.py
+"""
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+
+BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000").rstrip("/")
+EMAIL = os.getenv("LOAD_EMAIL", os.getenv("ADMIN_EMAIL", "test@test.com"))
+PASSWORD = os.getenv("LOAD_PASSWORD", os.getenv("ADMIN_PASSWORD", "123456"))
+CONCURRENCY = int(os.getenv("CONCURRENCY", "50"))
+ROUNDS = int(os.getenv("ROUNDS", "3"))
+MODEL_SIZE = os.getenv("MODEL_SIZE", "default")
+
+
+async def _login(client: httpx.AsyncClient) -> dict:
+    res = await client.post(f"{BASE_URL}/api/v1/auth/login", json={"email": EMAIL, "password": PASSWORD})
+    res.raise_for_status()
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+async def _sender(client: httpx.AsyncClient, headers: dict, latencies: list[float], errors: list[str]) -> None:
+    res = await client.post(f"{BASE_URL}/api/v1/chat/conversations", headers=headers, json={"title": "load test"})
+    res.raise_for_status()
+    conv_id = res.json()["id"]
+    for i in range(ROUNDS):
+        started = time.perf_counter()
+        res = await client.post(
+            f"{BASE_URL}/api/v1/chat/conversations/{conv_id}/messages",
+            headers=headers,
+            json={"content": f"load test message {i}", "model_size": MODEL_SIZE},
+        )
+        latencies.append((time.perf_counter() - started) * 1000)
+        if res.status_code != 201:
+            errors.append(f"{res.status_code} {res.text[:120]}")
+
+
+async def _sample_pool(client: httpx.AsyncClient, headers: dict, samples: list[int], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            res = await client.get(f"{BASE_URL}/metrics", headers=headers)
+            samples.append(int(res.json()["db_pool"]["checked_out"]))
+        except Exception:
+            pass
+        await asyncio.sleep(0.05)
+
+
+async def main() -> None:
+    limits = httpx.Limits(max_connections=CONCURRENCY + 5)
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        headers = await _login(client)
+        (await client.post(f"{BASE_URL}/metrics/reset_peaks", headers=headers)).raise_for_status()
+
+        latencies: list[float] = []
+        errors: list[str] = []
+        samples: list[int] = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(_sample_pool(client, headers, samples, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(_sender(client, headers, latencies, errors) for _ in range(CONCURRENCY)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await sampler
+
+        pool = (await client.get(f"{BASE_URL}/metrics", headers=headers)).json()["db_pool"]
+
+    latencies.sort()
+    print(f"requests: {len(latencies)} in {elapsed:.1f}s ({len(latencies) / elapsed:.1f} req/s), errors: {len(errors)}")
+    if latencies:
+        print(f"latency ms: p50={statistics.median(latencies):.0f} "
+              f"p95={latencies[int(len(latencies) * 0.95) - 1]:.0f} max={latencies[-1]:.0f}")
+    if samples:
+        print(f"pool checked_out (sampled): mean={statistics.mean(samples):.1f} max={max(samples)}")
+    print(f"pool peak_checked_out={pool['peak_checked_out']} of max_connections={pool['max_connections']}")
+    for e in errors[:5]:
+        print("  error:", e)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
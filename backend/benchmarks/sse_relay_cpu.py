@@ -0,0 +1,112 @@
+# benchmarks/sse_relay_cpu.py
+"""
+CPU per streamed token: per-token SSE frames vs coalesced frames.
+
+Drives a Starlette StreamingResponse directly through ASGI (no network, no LLM)
+with a synthetic upstream that emits TOKENS delta events at TOKENS_PER_SEC, and
+reports process CPU time per token, frames and bytes for:
+  - upstream:  the synthetic upstream alone (baseline to subtract)
+  - legacy:    json.dumps + encode + asyncio.sleep(0) per upstream delta
+  - coalesced: app.services.sse.coalesce_deltas + encode_frame
+
+Usage (from backend/):
+    TOKENS=2000 TOKENS_PER_SEC=400 STREAMS=20 python benchmarks/sse_relay_cpu.py
+    SSE_COALESCE_MS=50 SSE_COALESCE_MAX_BYTES=4096 python benchmarks/sse_relay_cpu.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from starlette.responses import StreamingResponse  # noqa: E402
+
+from app.services.sse import coalesce_deltas, encode_frame  # noqa: E402
+
+TOKENS = int(os.getenv("TOKENS", "2000"))
+TOKENS_PER_SEC = float(os.getenv("TOKENS_PER_SEC", "400"))
+STREAMS = int(os.getenv("STREAMS", "20"))
+TOKEN_TEXT = os.getenv("TOKEN_TEXT", "词 ")
+
+
+async def _upstream():
+    interval = 1.0 / TOKENS_PER_SEC if TOKENS_PER_SEC > 0 else 0.0
+    started = time.perf_counter()
+    for i in range(TOKENS):
+        # Pace against the wall clock so sleep granularity does not slow the stream down
+        wait = started + i * interval - time.perf_counter()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        yield {"type": "delta", "delta": TOKEN_TEXT}
+    yield {"type": "complete", "usage": {"output_tokens": TOKENS}, "latency_ms": 0.0}
+
+
+async def _upstream_only():
+    # Baseline: pacing the synthetic upstream costs CPU too; subtract it from the rows below
+    async for ev in _upstream():
+        if ev["type"] == "complete":
+            yield b"data: {}\n\n"
+
+
+async def _legacy():
+    async for ev in _upstream():
+        if ev["type"] == "delta":
+            yield f'data: {json.dumps({"type": "delta", "delta": ev["delta"]})}\n\n'.encode("utf-8")
+        else:
+            yield f"data: {json.dumps(ev)}\n\n".encode("utf-8")
+            break
+        await asyncio.sleep(0)
+
+
+async def _coalesced():
+    async for ev in coalesce_deltas(_upstream()):
+        yield encode_frame(ev)
+        if ev["type"] == "complete":
+            break
+
+
+async def _drive(body_factory) -> tuple[int, int]:
+    """Run one StreamingResponse through ASGI; returns (writes, bytes)."""
+    writes = 0
+    size = 0
+
+    async def receive():
+        await asyncio.Event().wait()  # never disconnects
+
+    async def send(message):
+        nonlocal writes, size
+        if message["type"] == "http.response.body" and message.get("body"):
+            writes += 1
+            size += len(message["body"])
+
+    response = StreamingResponse(body_factory(), media_type="text/event-stream")
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "method": "POST", "headers": []}
+    await response(scope, receive, send)
+    return writes, size
+
+
+async def _run(name: str, body_factory) -> None:
+    cpu0, wall0 = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(_drive(body_factory) for _ in range(STREAMS)))
+    cpu, wall = time.process_time() - cpu0, time.perf_counter() - wall0
+    writes = sum(w for w, _ in results)
+    size = sum(b for _, b in results)
+    tokens = TOKENS * STREAMS
+    print(
+        f"{name:<10} cpu/token={cpu / tokens * 1e6:8.2f}us  frames={writes:7d}  "
+        f"bytes/frame={size / max(1, writes):7.1f}  frames/s={writes / wall:9.1f}  wall={wall:.2f}s"
+    )
+
+
+async def main():
+    print(f"{STREAMS} streams x {TOKENS} tokens at {TOKENS_PER_SEC:g} tokens/s")
+    await _run("upstream", _upstream_only)
+    await _run("legacy", _legacy)
+    await _run("coalesced", _coalesced)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -48,10 +48,14 @@ CREATE TABLE session
     user_id    uuid        NOT NULL REFERENCES user_profile (id) ON DELETE CASCADE,
     ip_address text,
     user_agent text,
-    state      text,
+    state      text                 DEFAULT 'active',  -- only active sessions are reused
+    fingerprint  text,                                  -- fn_session_fingerprint(ip_address, user_agent)
+    last_seen_at timestamptz,                           -- last conversation opened in this session
     created_at timestamptz NOT NULL DEFAULT now()
 );
 CREATE INDEX idx_session_user_time ON session (user_id, created_at);
+-- Session reuse lookup on conversation create
+CREATE INDEX idx_session_user_fp_seen ON session (user_id, fingerprint, last_seen_at DESC);
 
 CREATE TABLE conversation
 (
@@ -61,10 +65,22 @@ CREATE TABLE conversation
     title        text,
     status       text        NOT NULL DEFAULT 'active', -- active/deleted
     storage_size bigint      NOT NULL DEFAULT 0 CHECK (storage_size >= 0),
+    summary_md   text,                                  -- rolling summary of older turns
+    summary_upto timestamptz,                           -- newest message folded into summary_md
+    -- Sidebar fields, maintained by trg_msg_conv_bytes
+    message_count        integer     NOT NULL DEFAULT 0 CHECK (message_count >= 0),
+    last_message_at      timestamptz,
+    last_message_preview text,
     created_at   timestamptz NOT NULL DEFAULT now(),
     updated_at   timestamptz NOT NULL DEFAULT now()
 );
 CREATE INDEX idx_conv_user_time ON conversation (user_id, created_at);
+-- Keyset pages of the conversation list (GET /chat/conversations)
+CREATE INDEX idx_conv_user_listed ON conversation (user_id, updated_at DESC, id DESC)
+    WHERE status NOT IN ('deleted', 'archived_quota');
+-- Oldest-first walk of fn_quota_tag_oldest_20_percent
+CREATE INDEX idx_conv_user_releasable ON conversation (user_id, created_at, id)
+    WHERE status NOT IN ('deleted', 'archived_quota');
 
 CREATE TABLE message
 (
@@ -79,6 +95,35 @@ CREATE TABLE message
 );
 CREATE INDEX idx_msg_conv_time ON message (conversation_id, created_at);
 
+-- Idempotency-Key of message POSTs: a retried request replays the original turn instead of generating again
+CREATE TABLE idempotency_key
+(
+    user_id              uuid        NOT NULL REFERENCES user_profile (id) ON DELETE CASCADE,
+    key                  text        NOT NULL,
+    request_hash         text        NOT NULL,                  -- sha256 of endpoint + conversation + body
+    conversation_id      uuid        NOT NULL REFERENCES conversation (id) ON DELETE CASCADE,
+    status               text        NOT NULL DEFAULT 'in_progress', -- in_progress/completed
+    user_message_id      uuid,
+    assistant_message_id uuid,
+    created_at           timestamptz NOT NULL DEFAULT now(),
+    expires_at           timestamptz NOT NULL,
+    PRIMARY KEY (user_id, key)
+);
+CREATE INDEX idx_idem_expires ON idempotency_key (expires_at);
+
+-- Content-addressed file store: one file per distinct content at {STORAGE_ROOT}/blobs/ab/cd/<sha256>
+CREATE TABLE blob
+(
+    sha256     text PRIMARY KEY,
+    size_bytes bigint      NOT NULL CHECK (size_bytes >= 0),
+    -- Documents (not deleted) stored in this blob, kept by trg_blob_refs
+    ref_count  integer     NOT NULL DEFAULT 0 CHECK (ref_count >= 0),
+    -- Since when ref_count is 0; the blob GC removes it after BLOB_GC_GRACE_S
+    zero_since timestamptz,
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX idx_blob_unreferenced ON blob (zero_since) WHERE ref_count = 0;
+
 CREATE TABLE document
 (
     id                   uuid PRIMARY KEY     DEFAULT gen_random_uuid(),
@@ -89,6 +134,8 @@ CREATE TABLE document
     processed_text       text,
     processed_text_bytes bigint CHECK (processed_text_bytes IS NULL OR processed_text_bytes >= 0),
     sha256               text,
+    -- Set when the file lives in the blob store (NULL: file at storage_url from before it)
+    blob_sha256          text REFERENCES blob (sha256) ON DELETE SET NULL,
     status               text        NOT NULL DEFAULT 'uploaded', -- uploaded/processing/ready/archived_quota
     created_at           timestamptz NOT NULL DEFAULT now()
 );
@@ -102,6 +149,8 @@ CREATE TABLE user_document
     linked_at   timestamptz NOT NULL DEFAULT now(),
     PRIMARY KEY (user_id, document_id)
 );
+-- Oldest-first walk of fn_quota_tag_oldest_20_percent
+CREATE INDEX idx_user_doc_user_linked ON user_document (user_id, linked_at, document_id);
 
 CREATE TABLE conversation_document
 (
@@ -112,6 +161,33 @@ CREATE TABLE conversation_document
     PRIMARY KEY (conversation_id, document_id)
 );
 
+-- Resumable uploads: chunks are written by offset into {STORAGE_ROOT}/{user_id}/.incoming/<id>.part,
+-- preallocated at size_bytes; finalize turns the file into a document
+CREATE TABLE upload_session
+(
+    id              uuid PRIMARY KEY     DEFAULT gen_random_uuid(),
+    user_id         uuid        NOT NULL REFERENCES user_profile (id) ON DELETE CASCADE,
+    filename        text        NOT NULL,
+    mime_type       text        NOT NULL,
+    size_bytes      bigint      NOT NULL CHECK (size_bytes >= 0),
+    sha256          text        NOT NULL,                  -- announced by the client, verified on finalize
+    conversation_id uuid,                                  -- checked on finalize, like the multipart field
+    status          text        NOT NULL DEFAULT 'open',   -- open/finalizing
+    created_at      timestamptz NOT NULL DEFAULT now(),
+    expires_at      timestamptz NOT NULL                   -- moved on by every chunk
+);
+CREATE INDEX idx_upload_session_user ON upload_session (user_id);
+CREATE INDEX idx_upload_session_expires ON upload_session (expires_at);
+
+-- Byte ranges [start_byte, end_byte) written into an upload session's file
+CREATE TABLE upload_chunk
+(
+    session_id uuid   NOT NULL REFERENCES upload_session (id) ON DELETE CASCADE,
+    start_byte bigint NOT NULL CHECK (start_byte >= 0),
+    end_byte   bigint NOT NULL CHECK (end_byte > start_byte),
+    PRIMARY KEY (session_id, start_byte)
+);
+
 CREATE TABLE telemetry_event
 (
     id              uuid PRIMARY KEY     DEFAULT gen_random_uuid(),
@@ -135,6 +211,8 @@ CREATE TABLE safety_event
     data            jsonb       NOT NULL DEFAULT '{}'::jsonb,
     created_at      timestamptz NOT NULL DEFAULT now()
 );
+-- fn_merge_redundant_sessions repoints rows by session_id; also serves the ON DELETE CASCADE
+CREATE INDEX idx_safety_session ON safety_event (session_id);
 
 CREATE TABLE api_call_log
 (
@@ -149,15 +227,45 @@ CREATE TABLE api_call_log
     response_meta   jsonb       NOT NULL DEFAULT '{}'::jsonb,
     created_at      timestamptz NOT NULL DEFAULT now()
 );
+CREATE INDEX idx_api_call_session ON api_call_log (session_id);
 
 CREATE TABLE user_storage_quota
 (
     user_id     uuid PRIMARY KEY REFERENCES user_profile (id) ON DELETE CASCADE,
     limit_bytes bigint      NOT NULL CHECK (limit_bytes >= 0),
-    used_bytes  bigint      NOT NULL DEFAULT 0 CHECK (used_bytes >= 0),
+    -- Usage counters kept current by the trg_quota_* triggers (deleted/archived_quota rows excluded);
+    -- fn_quota_reconcile repairs drift
+    used_bytes      bigint      NOT NULL DEFAULT 0 CHECK (used_bytes >= 0),
+    used_conv_bytes bigint      NOT NULL DEFAULT 0 CHECK (used_conv_bytes >= 0),
+    used_doc_bytes  bigint      NOT NULL DEFAULT 0 CHECK (used_doc_bytes >= 0),
+    -- Quota-archived conversation + document bytes (not part of used_bytes), same triggers
+    archived_bytes  bigint      NOT NULL DEFAULT 0 CHECK (archived_bytes >= 0),
     updated_at  timestamptz NOT NULL DEFAULT now()
 );
 
+-- Pooled allowance shared by an organization's members, on top of their own limits
+CREATE TABLE organization_storage_quota
+(
+    organization_id uuid PRIMARY KEY REFERENCES organization (id) ON DELETE CASCADE,
+    limit_bytes     bigint      NOT NULL CHECK (limit_bytes >= 0),
+    -- Sum of the members' user_storage_quota.used_bytes up to the last fold of
+    -- organization_quota_delta; fn_org_quota_reconcile repairs drift
+    used_bytes      bigint      NOT NULL DEFAULT 0 CHECK (used_bytes >= 0),
+    updated_at      timestamptz NOT NULL DEFAULT now()
+);
+
+-- Pool usage changes not yet folded into organization_storage_quota.used_bytes. The trg_org_quota_*
+-- triggers only append here, so members' writes never queue on the org's single pool row;
+-- fn_org_quota_fold applies them in the background and quota checks add the pending rows
+CREATE TABLE organization_quota_delta
+(
+    id              bigserial PRIMARY KEY,
+    organization_id uuid        NOT NULL REFERENCES organization_storage_quota (organization_id) ON DELETE CASCADE,
+    delta           bigint      NOT NULL,
+    created_at      timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX idx_org_quota_delta_org ON organization_quota_delta (organization_id);
+
 -- ================================
 -- Password reset codes
 -- ================================
@@ -207,7 +315,20 @@ FROM user_profile u
 -- ================================
 -- Functions: quota / upload / autorelease
 -- ================================
--- Soft delete (Default: include_archived=false)
+-- Bytes a conversation or document counts toward its user's quota: deleted and quota-archived count zero
+CREATE OR REPLACE FUNCTION fn_quota_counted(p_status text, p_bytes bigint) RETURNS bigint AS
+$$
+SELECT CASE WHEN p_status IN ('deleted', 'archived_quota') THEN 0 ELSE COALESCE(p_bytes, 0) END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Bytes a quota-archived conversation or document keeps on disk (user_storage_quota.archived_bytes)
+CREATE OR REPLACE FUNCTION fn_quota_archived(p_status text, p_bytes bigint) RETURNS bigint AS
+$$
+SELECT CASE WHEN p_status = 'archived_quota' THEN COALESCE(p_bytes, 0) ELSE 0 END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Quota state from the user_storage_quota counters: one primary-key read.
+-- include_archived=true adds quota-archived rows, summed from the tables (slow path).
 CREATE OR REPLACE FUNCTION fn_user_quota_state(p_user uuid, include_archived boolean DEFAULT false)
     RETURNS TABLE
             (
@@ -221,29 +342,110 @@ CREATE OR REPLACE FUNCTION fn_user_quota_state(p_user uuid, include_archived boo
     LANGUAGE sql
 AS
 $$
-WITH conv AS (SELECT COALESCE(SUM(c.storage_size), 0) AS bytes
-              FROM conversation c
-              WHERE c.user_id = p_user
-                AND (include_archived OR c.status <> 'archived_quota')),
-     doc AS (SELECT COALESCE(SUM(d.size_bytes + COALESCE(d.processed_text_bytes, 0)), 0) AS bytes
-             FROM user_document ud
-                      JOIN document d ON d.id = ud.document_id
-             WHERE ud.user_id = p_user
-               AND (include_archived OR d.status <> 'archived_quota')),
-     lim AS (SELECT limit_bytes
-             FROM user_storage_quota
-             WHERE user_id = p_user)
+WITH q AS (SELECT COALESCE(MAX(q.limit_bytes), 100 * 1024 * 1024) AS limit_bytes,
+                  COALESCE(MAX(q.used_conv_bytes), 0)             AS conv_bytes,
+                  COALESCE(MAX(q.used_doc_bytes), 0)              AS doc_bytes
+           FROM user_storage_quota q
+           WHERE q.user_id = p_user),
+     archived AS (SELECT (SELECT COALESCE(SUM(c.storage_size), 0)
+                          FROM conversation c
+                          WHERE c.user_id = p_user
+                            AND c.status = 'archived_quota') AS conv_bytes,
+                         (SELECT COALESCE(SUM(d.size_bytes + COALESCE(d.processed_text_bytes, 0)), 0)
+                          FROM user_document ud
+                                   JOIN document d ON d.id = ud.document_id
+                          WHERE ud.user_id = p_user
+                            AND d.status = 'archived_quota') AS doc_bytes
+                  WHERE include_archived),
+     used AS (SELECT q.limit_bytes,
+                     (q.conv_bytes + COALESCE(a.conv_bytes, 0))::bigint AS conv_bytes,
+                     (q.doc_bytes + COALESCE(a.doc_bytes, 0))::bigint   AS doc_bytes
+              FROM q
+                       LEFT JOIN archived a ON true)
 SELECT p_user,
-       COALESCE((SELECT limit_bytes FROM lim), 100 * 1024 * 1024)       AS limit_bytes,
-       (SELECT bytes FROM conv)                                         AS used_conv_bytes,
-       (SELECT bytes FROM doc)                                          AS used_doc_bytes,
-       (SELECT bytes FROM conv) + (SELECT bytes FROM doc)               AS used_total_bytes,
-       ((SELECT bytes FROM conv) + (SELECT bytes FROM doc))::numeric
-           / COALESCE((SELECT limit_bytes FROM lim), 100 * 1024 * 1024) AS used_ratio
-    ;
+       limit_bytes,
+       conv_bytes,
+       doc_bytes,
+       conv_bytes + doc_bytes,
+       CASE WHEN limit_bytes > 0 THEN (conv_bytes + doc_bytes)::numeric / limit_bytes ELSE 0 END
+FROM used;
+$$;
+
+-- Recompute the usage counters of `p_users` from the tables and repair any drift; returns the
+-- users whose counters were off. Counter rows are locked before summing, so a concurrent
+-- trigger update either commits first (and is counted) or waits and applies its delta after.
+CREATE OR REPLACE FUNCTION fn_quota_reconcile(p_users uuid[])
+    RETURNS TABLE
+            (
+                user_id    uuid,
+                conv_drift bigint,
+                doc_drift  bigint
+            )
+    LANGUAGE plpgsql
+AS
+$$
+#variable_conflict use_column
+BEGIN
+    INSERT INTO user_storage_quota (user_id, limit_bytes, used_bytes)
+    SELECT u.id, 100 * 1024 * 1024, 0
+    FROM user_profile u
+    WHERE u.id = ANY (p_users)
+    ON CONFLICT (user_id) DO NOTHING;
+
+    PERFORM 1
+    FROM user_storage_quota q
+    WHERE q.user_id = ANY (p_users)
+    ORDER BY q.user_id
+        FOR UPDATE;
+
+    RETURN QUERY
+        WITH actual AS (SELECT q.user_id,
+                               q.used_conv_bytes                                                    AS old_conv,
+                               q.used_doc_bytes                                                     AS old_doc,
+                               q.used_bytes                                                         AS old_total,
+                               q.archived_bytes                                                     AS old_archived,
+                               (SELECT COALESCE(SUM(fn_quota_counted(c.status, c.storage_size)), 0)
+                                FROM conversation c
+                                WHERE c.user_id = q.user_id)::bigint                                AS conv,
+                               (SELECT COALESCE(SUM(fn_quota_counted(d.status,
+                                                                     d.size_bytes + COALESCE(d.processed_text_bytes, 0))), 0)
+                                FROM user_document ud
+                                         JOIN document d ON d.id = ud.document_id
+                                WHERE ud.user_id = q.user_id)::bigint                               AS doc,
+                               ((SELECT COALESCE(SUM(fn_quota_archived(c.status, c.storage_size)), 0)
+                                 FROM conversation c
+                                 WHERE c.user_id = q.user_id) +
+                                (SELECT COALESCE(SUM(fn_quota_archived(d.status,
+                                                                       d.size_bytes + COALESCE(d.processed_text_bytes, 0))), 0)
+                                 FROM user_document ud
+                                          JOIN document d ON d.id = ud.document_id
+                                 WHERE ud.user_id = q.user_id))::bigint                             AS archived
+                        FROM user_storage_quota q
+                        WHERE q.user_id = ANY (p_users)),
+             fixed AS (
+                 UPDATE user_storage_quota q
+                     SET used_conv_bytes = a.conv,
+                         used_doc_bytes = a.doc,
+                         used_bytes = a.conv + a.doc,
+                         archived_bytes = a.archived,
+                         updated_at = now()
+                     FROM actual a
+                     WHERE q.user_id = a.user_id
+                         AND (a.old_conv <> a.conv OR a.old_doc <> a.doc OR a.old_total <> a.conv + a.doc
+                             OR a.old_archived <> a.archived)
+                     RETURNING q.user_id, a.conv - a.old_conv, a.doc - a.old_doc)
+        SELECT * FROM fixed;
+END;
 $$;
 
-CREATE OR REPLACE FUNCTION fn_quota_tag_oldest_20_percent(p_user uuid, include_archived boolean DEFAULT false)
+-- Release the oldest 20% of a user's counted bytes (conversations and documents, oldest first).
+-- One statement: a recursive merge of the two per-user index orders (idx_conv_user_releasable,
+-- idx_user_doc_user_linked) that takes one row per step and stops once the target is reached,
+-- so the cost follows the released rows rather than the user's total.
+-- p_high_water < 1 releases ahead of the limit (background auto-release).
+DROP FUNCTION IF EXISTS fn_quota_tag_oldest_20_percent(uuid, boolean);
+DROP FUNCTION IF EXISTS fn_quota_tag_oldest_20_percent(uuid);
+CREATE OR REPLACE FUNCTION fn_quota_tag_oldest_20_percent(p_user uuid, p_high_water numeric DEFAULT 1)
     RETURNS TABLE
             (
                 tagged_kind  text,
@@ -255,68 +457,141 @@ AS
 $$
 DECLARE
     v_limit  bigint;
-    v_conv   bigint;
-    v_doc    bigint;
     v_total  bigint;
     v_target bigint;
 BEGIN
-    SELECT limit_bytes, used_conv_bytes, used_doc_bytes, used_total_bytes
-    INTO v_limit, v_conv, v_doc, v_total
-    FROM fn_user_quota_state(p_user, include_archived);
+    SELECT q.limit_bytes, q.used_bytes
+    INTO v_limit, v_total
+    FROM user_storage_quota q
+    WHERE q.user_id = p_user;
 
-    IF v_total = 0 OR v_total < v_limit THEN
+    IF v_total IS NULL OR v_total = 0 OR v_limit <= 0 OR v_total < v_limit * p_high_water THEN
         RETURN;
     END IF;
 
     v_target := CEIL(v_total * 0.2);
 
-    CREATE TEMP TABLE IF NOT EXISTS tmp_to_tag
-    (
-        kind  text,
-        rid   uuid,
-        bytes bigint
-    ) ON COMMIT DROP;
-    TRUNCATE TABLE tmp_to_tag;
-
-    WITH assets AS (SELECT 'conversation'::text        AS kind,
-                           c.id                        AS rid,
-                           c.created_at,
-                           COALESCE(c.storage_size, 0) AS bytes
-                    FROM conversation c
-                    WHERE c.user_id = p_user
-                      AND (include_archived OR c.status <> 'archived_quota')
-                    UNION ALL
-                    SELECT 'document'::text                                                AS kind,
-                           d.id                                                            AS rid,
-                           d.created_at,
-                           COALESCE(d.size_bytes, 0) + COALESCE(d.processed_text_bytes, 0) AS bytes
-                    FROM user_document ud
-                             JOIN document d ON d.id = ud.document_id
-                    WHERE ud.user_id = p_user
-                      AND (include_archived OR d.status <> 'archived_quota')),
-         ordered AS (SELECT *, SUM(bytes) OVER (ORDER BY created_at, kind, rid) AS running
-                     FROM assets)
-    INSERT
-    INTO tmp_to_tag(kind, rid, bytes)
-    SELECT kind, rid, bytes
-    FROM ordered
-    WHERE running <= v_target;
-
     RETURN QUERY
-        SELECT kind, rid AS tagged_id, bytes AS tagged_bytes
-        FROM tmp_to_tag;
+        WITH RECURSIVE
+            -- Each row holds the next unreleased conversation (c_*) and document (d_*) of the
+            -- user; a step takes the older of the two and advances only that side's cursor.
+            walk AS (SELECT c.created_at AS c_at,
+                            c.id         AS c_id,
+                            c.bytes      AS c_bytes,
+                            d.linked_at  AS d_at,
+                            d.id         AS d_id,
+                            d.bytes      AS d_bytes,
+                            NULL::text   AS kind,
+                            NULL::uuid   AS rid,
+                            0::bigint    AS bytes,
+                            0::bigint    AS running
+                     FROM (SELECT 1) one
+                              LEFT JOIN LATERAL (SELECT cc.created_at, cc.id, cc.storage_size AS bytes
+                                                 FROM conversation cc
+                                                 WHERE cc.user_id = p_user
+                                                   AND cc.status NOT IN ('deleted', 'archived_quota')
+                                                 ORDER BY cc.created_at, cc.id
+                                                 LIMIT 1) c ON true
+                              LEFT JOIN LATERAL (SELECT ud.linked_at,
+                                                        dd.id,
+                                                        COALESCE(dd.size_bytes, 0) +
+                                                        COALESCE(dd.processed_text_bytes, 0) AS bytes
+                                                 FROM user_document ud
+                                                          JOIN document dd ON dd.id = ud.document_id
+                                                 WHERE ud.user_id = p_user
+                                                   AND dd.status NOT IN ('deleted', 'archived_quota')
+                                                 ORDER BY ud.linked_at, ud.document_id
+                                                 LIMIT 1) d ON true
+                     UNION ALL
+                     SELECT CASE WHEN t.take_conv THEN nc.created_at ELSE w.c_at END,
+                            CASE WHEN t.take_conv THEN nc.id ELSE w.c_id END,
+                            CASE WHEN t.take_conv THEN nc.bytes ELSE w.c_bytes END,
+                            CASE WHEN t.take_conv THEN w.d_at ELSE nd.linked_at END,
+                            CASE WHEN t.take_conv THEN w.d_id ELSE nd.id END,
+                            CASE WHEN t.take_conv THEN w.d_bytes ELSE nd.bytes END,
+                            CASE WHEN t.take_conv THEN 'conversation' ELSE 'document' END,
+                            CASE WHEN t.take_conv THEN w.c_id ELSE w.d_id END,
+                            CASE WHEN t.take_conv THEN w.c_bytes ELSE w.d_bytes END,
+                            w.running + CASE WHEN t.take_conv THEN w.c_bytes ELSE w.d_bytes END
+                     FROM walk w
+                              CROSS JOIN LATERAL (SELECT w.c_id IS NOT NULL
+                                                             AND (w.d_id IS NULL OR w.c_at <= w.d_at) AS take_conv) t
+                              LEFT JOIN LATERAL (SELECT cc.created_at, cc.id, cc.storage_size AS bytes
+                                                 FROM conversation cc
+                                                 WHERE t.take_conv
+                                                   AND cc.user_id = p_user
+                                                   AND cc.status NOT IN ('deleted', 'archived_quota')
+                                                   AND (cc.created_at, cc.id) > (w.c_at, w.c_id)
+                                                 ORDER BY cc.created_at, cc.id
+                                                 LIMIT 1) nc ON true
+                              LEFT JOIN LATERAL (SELECT ud.linked_at,
+                                                        dd.id,
+                                                        COALESCE(dd.size_bytes, 0) +
+                                                        COALESCE(dd.processed_text_bytes, 0) AS bytes
+                                                 FROM user_document ud
+                                                          JOIN document dd ON dd.id = ud.document_id
+                                                 WHERE NOT t.take_conv
+                                                   AND ud.user_id = p_user
+                                                   AND dd.status NOT IN ('deleted', 'archived_quota')
+                                                   AND (ud.linked_at, ud.document_id) > (w.d_at, w.d_id)
+                                                 ORDER BY ud.linked_at, ud.document_id
+                                                 LIMIT 1) nd ON true
+                     WHERE w.running < v_target
+                       AND (w.c_id IS NOT NULL OR w.d_id IS NOT NULL)),
+            picked AS (SELECT w.kind, w.rid, w.bytes
+                       FROM walk w
+                       WHERE w.kind IS NOT NULL),
+            conv_archived AS (
+                UPDATE conversation c
+                    SET status = 'archived_quota'
+                    FROM picked p
+                    WHERE p.kind = 'conversation'
+                        AND c.id = p.rid
+                        AND c.status NOT IN ('deleted', 'archived_quota')
+                    RETURNING c.id),
+            doc_archived AS (
+                UPDATE document d
+                    SET status = 'archived_quota'
+                    FROM picked p
+                    WHERE p.kind = 'document'
+                        AND d.id = p.rid
+                        AND d.status NOT IN ('deleted', 'archived_quota')
+                    RETURNING d.id)
+        SELECT p.kind, p.rid, p.bytes
+        FROM picked p;
+END;
+$$;
 
-    UPDATE conversation c
-    SET status = 'archived_quota'
-    FROM (SELECT rid FROM tmp_to_tag WHERE kind = 'conversation') t
-    WHERE c.id = t.rid
-      AND c.status <> 'archived_quota';
-
-    UPDATE document d
-    SET status = 'archived_quota'
-    FROM (SELECT rid FROM tmp_to_tag WHERE kind = 'document') t
-    WHERE d.id = t.rid
-      AND d.status <> 'archived_quota';
+-- Background auto-release: users at p_high_water of their limit, one advisory lock each
+-- (the same as fn_autorelease_on_message); users being released inline right now are skipped.
+CREATE OR REPLACE FUNCTION fn_quota_autorelease_batch(p_users uuid[], p_high_water numeric)
+    RETURNS TABLE
+            (
+                user_id        uuid,
+                released_rows  bigint,
+                released_bytes bigint
+            )
+    LANGUAGE plpgsql
+AS
+$$
+DECLARE
+    v_user  uuid;
+    v_rows  bigint;
+    v_bytes bigint;
+BEGIN
+    FOREACH v_user IN ARRAY p_users
+        LOOP
+            CONTINUE WHEN NOT pg_try_advisory_xact_lock(hashtext('quota:' || v_user::text));
+            SELECT count(*), COALESCE(SUM(t.tagged_bytes), 0)
+            INTO v_rows, v_bytes
+            FROM fn_quota_tag_oldest_20_percent(v_user, p_high_water) t;
+            IF v_rows > 0 THEN
+                user_id := v_user;
+                released_rows := v_rows;
+                released_bytes := v_bytes;
+                RETURN NEXT;
+            END IF;
+        END LOOP;
 END;
 $$;
 
@@ -360,7 +635,7 @@ BEGIN
         RETURN;
     END IF;
     RETURN QUERY
-        SELECT * FROM fn_quota_tag_oldest_20_percent(p_user, false);
+        SELECT * FROM fn_quota_tag_oldest_20_percent(p_user);
 END;
 $$;
 
@@ -407,33 +682,175 @@ CREATE TRIGGER trg_msg_compute_size
     FOR EACH ROW
 EXECUTE FUNCTION tg_msg_compute_size();
 
--- Conversation storage_size sync
+-- Client fingerprint of a session; app.services.sessions.client_fingerprint computes the same value
+CREATE OR REPLACE FUNCTION fn_session_fingerprint(p_ip text, p_user_agent text) RETURNS text AS
+$$
+SELECT encode(sha256(convert_to(coalesce(p_ip, '') || '|' || coalesce(p_user_agent, ''), 'UTF8')), 'hex');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Merge the sessions of `p_users` that idle-window reuse would have shared: same fingerprint,
+-- each opened within `p_idle` of the previous one. Conversations, messages and the session's
+-- telemetry/safety/api_call_log rows move to the oldest session of each run before the rest are deleted. Returns the number of sessions merged.
+-- Meant to be called for a few hundred users per transaction (see scripts/merge_sessions.py).
+CREATE OR REPLACE FUNCTION fn_merge_redundant_sessions(p_users uuid[], p_idle interval) RETURNS integer AS
+$$
+DECLARE
+    v_ids       uuid[];
+    v_survivors uuid[];
+BEGIN
+    -- Sessions created before fingerprints were recorded
+    UPDATE session
+    SET fingerprint  = fn_session_fingerprint(ip_address, user_agent),
+        last_seen_at = coalesce(last_seen_at, created_at)
+    WHERE user_id = ANY (p_users)
+      AND fingerprint IS NULL;
+
+    WITH gaps AS (SELECT id,
+                         user_id,
+                         fingerprint,
+                         created_at,
+                         CASE WHEN created_at - lag(last_seen_at) OVER w <= p_idle THEN 0 ELSE 1 END AS starts_run
+                  FROM session
+                  WHERE user_id = ANY (p_users)
+                  WINDOW w AS (PARTITION BY user_id, fingerprint ORDER BY created_at, id)),
+         runs AS (SELECT id,
+                         user_id,
+                         fingerprint,
+                         created_at,
+                         sum(starts_run) OVER (PARTITION BY user_id, fingerprint ORDER BY created_at, id) AS run
+                  FROM gaps),
+         mapped AS (SELECT id,
+                           first_value(id) OVER (PARTITION BY user_id, fingerprint, run ORDER BY created_at, id) AS survivor
+                    FROM runs)
+    SELECT array_agg(id), array_agg(survivor)
+    INTO v_ids, v_survivors
+    FROM mapped
+    WHERE id <> survivor;
+
+    IF v_ids IS NULL THEN
+        RETURN 0;
+    END IF;
+
+    -- Repoint before deleting: session deletes cascade to conversations and messages
+    UPDATE conversation c
+    SET session_id = m.survivor
+    FROM unnest(v_ids, v_survivors) AS m(id, survivor)
+    WHERE c.user_id = ANY (p_users)
+      AND c.session_id = m.id;
+
+    -- message.session_id has no index of its own; reach the rows through their conversations
+    UPDATE message msg
+    SET session_id = m.survivor
+    FROM conversation c,
+         unnest(v_ids, v_survivors) AS m(id, survivor)
+    WHERE c.user_id = ANY (p_users)
+      AND msg.conversation_id = c.id
+      AND msg.session_id = m.id;
+
+    UPDATE telemetry_event e
+    SET session_id = m.survivor
+    FROM unnest(v_ids, v_survivors) AS m(id, survivor)
+    WHERE e.session_id = m.id;
+
+    UPDATE safety_event e
+    SET session_id = m.survivor
+    FROM unnest(v_ids, v_survivors) AS m(id, survivor)
+    WHERE e.session_id = m.id;
+
+    UPDATE api_call_log l
+    SET session_id = m.survivor
+    FROM unnest(v_ids, v_survivors) AS m(id, survivor)
+    WHERE l.session_id = m.id;
+
+    UPDATE session s
+    SET last_seen_at = g.seen
+    FROM (SELECT m.survivor, max(d.last_seen_at) AS seen
+          FROM unnest(v_ids, v_survivors) AS m(id, survivor)
+                   JOIN session d ON d.id = m.id
+          GROUP BY m.survivor) g
+    WHERE s.id = g.survivor
+      AND g.seen > s.last_seen_at;
+
+    DELETE FROM session WHERE id = ANY (v_ids);
+    RETURN cardinality(v_ids);
+END;
+$$ LANGUAGE plpgsql;
+
+-- First 160 characters of a message, whitespace collapsed (conversation.last_message_preview)
+CREATE OR REPLACE FUNCTION fn_message_preview(p_content text) RETURNS text AS
+$$
+SELECT left(btrim(regexp_replace(p_content, '\s+', ' ', 'g')), 160);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Re-derive the last-message columns after the newest message was deleted or moved
+CREATE OR REPLACE FUNCTION fn_conv_refresh_last_message(p_conv uuid) RETURNS void AS
+$$
+BEGIN
+    UPDATE conversation
+    SET (last_message_at, last_message_preview) = (SELECT m.created_at, fn_message_preview(m.content_md)
+                                                   FROM message m
+                                                   WHERE m.conversation_id = p_conv
+                                                   ORDER BY m.created_at DESC, m.id DESC
+                                                   LIMIT 1)
+    WHERE id = p_conv;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Conversation storage_size / message_count / last message sync
 CREATE OR REPLACE FUNCTION tg_conv_bytes_from_message() RETURNS trigger AS
 $$
 BEGIN
     IF TG_OP = 'INSERT' THEN
+        -- One UPDATE per message: the sidebar columns ride along with storage_size
         UPDATE conversation
-        SET storage_size = storage_size + NEW.size_bytes
+        SET storage_size         = storage_size + NEW.size_bytes,
+            message_count        = message_count + 1,
+            last_message_at      = CASE
+                                       WHEN last_message_at IS NULL OR NEW.created_at >= last_message_at
+                                           THEN NEW.created_at
+                                       ELSE last_message_at END,
+            last_message_preview = CASE
+                                       WHEN last_message_at IS NULL OR NEW.created_at >= last_message_at
+                                           THEN fn_message_preview(NEW.content_md)
+                                       ELSE last_message_preview END,
+            updated_at           = greatest(updated_at, NEW.created_at)
         WHERE id = NEW.conversation_id;
 
     ELSIF TG_OP = 'UPDATE' THEN
         IF NEW.conversation_id <> OLD.conversation_id THEN
             UPDATE conversation
-            SET storage_size = storage_size - OLD.size_bytes
+            SET storage_size  = storage_size - OLD.size_bytes,
+                message_count = greatest(message_count - 1, 0)
             WHERE id = OLD.conversation_id;
             UPDATE conversation
-            SET storage_size = storage_size + NEW.size_bytes
+            SET storage_size  = storage_size + NEW.size_bytes,
+                message_count = message_count + 1
             WHERE id = NEW.conversation_id;
+            PERFORM fn_conv_refresh_last_message(OLD.conversation_id);
+            PERFORM fn_conv_refresh_last_message(NEW.conversation_id);
         ELSE
+            -- An edit leaves updated_at alone: only new messages move a conversation up the list
             UPDATE conversation
-            SET storage_size = storage_size + (NEW.size_bytes - OLD.size_bytes)
+            SET storage_size         = storage_size + (NEW.size_bytes - OLD.size_bytes),
+                last_message_preview = CASE
+                                           WHEN NEW.created_at = last_message_at
+                                               THEN fn_message_preview(NEW.content_md)
+                                           ELSE last_message_preview END
             WHERE id = NEW.conversation_id;
         END IF;
 
     ELSIF TG_OP = 'DELETE' THEN
         UPDATE conversation
-        SET storage_size = storage_size - OLD.size_bytes
+        SET storage_size  = storage_size - OLD.size_bytes,
+            message_count = greatest(message_count - 1, 0)
         WHERE id = OLD.conversation_id;
+        -- Only a delete of the newest message moves the preview
+        IF EXISTS (SELECT 1
+                   FROM conversation
+                   WHERE id = OLD.conversation_id
+                     AND last_message_at <= OLD.created_at) THEN
+            PERFORM fn_conv_refresh_last_message(OLD.conversation_id);
+        END IF;
     END IF;
     RETURN NULL;
 END;
@@ -441,11 +858,157 @@ $$ LANGUAGE plpgsql;
 
 DROP TRIGGER IF EXISTS trg_msg_conv_bytes ON message;
 CREATE TRIGGER trg_msg_conv_bytes
-    AFTER INSERT OR UPDATE OF size_bytes, conversation_id OR DELETE
+    AFTER INSERT OR UPDATE OF size_bytes, content_md, conversation_id OR DELETE
     ON message
     FOR EACH ROW
 EXECUTE FUNCTION tg_conv_bytes_from_message();
 
+-- ===== Per-user usage counters (user_storage_quota.used_*) =====
+DROP FUNCTION IF EXISTS fn_quota_add(uuid, bigint, bigint);
+CREATE OR REPLACE FUNCTION fn_quota_add(p_user uuid, p_conv_delta bigint, p_doc_delta bigint,
+                                        p_archived_delta bigint DEFAULT 0) RETURNS void AS
+$$
+-- Clamped at zero so drift never fails the user's write; fn_quota_reconcile repairs it
+UPDATE user_storage_quota
+SET used_conv_bytes = GREATEST(used_conv_bytes + p_conv_delta, 0),
+    used_doc_bytes  = GREATEST(used_doc_bytes + p_doc_delta, 0),
+    used_bytes      = GREATEST(used_bytes + p_conv_delta + p_doc_delta, 0),
+    archived_bytes  = GREATEST(archived_bytes + p_archived_delta, 0),
+    updated_at      = now()
+WHERE user_id = p_user;
+$$ LANGUAGE sql;
+
+-- Conversation bytes: storage_size moves with every message (trg_msg_conv_bytes), status with delete/archive
+CREATE OR REPLACE FUNCTION tg_quota_conv_bytes() RETURNS trigger AS
+$$
+DECLARE
+    v_old bigint := 0;
+    v_new bigint := 0;
+    a_old bigint := 0;
+    a_new bigint := 0;
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        v_old := fn_quota_counted(OLD.status, OLD.storage_size);
+        a_old := fn_quota_archived(OLD.status, OLD.storage_size);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        v_new := fn_quota_counted(NEW.status, NEW.storage_size);
+        a_new := fn_quota_archived(NEW.status, NEW.storage_size);
+    END IF;
+
+    IF TG_OP = 'UPDATE' AND NEW.user_id = OLD.user_id THEN
+        IF v_new <> v_old OR a_new <> a_old THEN
+            PERFORM fn_quota_add(NEW.user_id, v_new - v_old, 0, a_new - a_old);
+        END IF;
+    ELSE
+        IF v_old <> 0 OR a_old <> 0 THEN
+            PERFORM fn_quota_add(OLD.user_id, -v_old, 0, -a_old);
+        END IF;
+        IF v_new <> 0 OR a_new <> 0 THEN
+            PERFORM fn_quota_add(NEW.user_id, v_new, 0, a_new);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_quota_conv_bytes ON conversation;
+CREATE TRIGGER trg_quota_conv_bytes
+    AFTER INSERT OR DELETE
+    ON conversation
+    FOR EACH ROW
+EXECUTE FUNCTION tg_quota_conv_bytes();
+
+DROP TRIGGER IF EXISTS trg_quota_conv_bytes_upd ON conversation;
+CREATE TRIGGER trg_quota_conv_bytes_upd
+    AFTER UPDATE
+    ON conversation
+    FOR EACH ROW
+    WHEN (OLD.storage_size IS DISTINCT FROM NEW.storage_size
+        OR OLD.status IS DISTINCT FROM NEW.status
+        OR OLD.user_id IS DISTINCT FROM NEW.user_id)
+EXECUTE FUNCTION tg_quota_conv_bytes();
+
+-- Document bytes count once per linked user (user_document)
+CREATE OR REPLACE FUNCTION tg_quota_doc_bytes() RETURNS trigger AS
+$$
+DECLARE
+    v_old bigint := 0;
+    v_new bigint := 0;
+    a_old bigint := 0;
+    a_new bigint := 0;
+BEGIN
+    v_old := fn_quota_counted(OLD.status, OLD.size_bytes + COALESCE(OLD.processed_text_bytes, 0));
+    a_old := fn_quota_archived(OLD.status, OLD.size_bytes + COALESCE(OLD.processed_text_bytes, 0));
+    IF TG_OP = 'UPDATE' THEN
+        v_new := fn_quota_counted(NEW.status, NEW.size_bytes + COALESCE(NEW.processed_text_bytes, 0));
+        a_new := fn_quota_archived(NEW.status, NEW.size_bytes + COALESCE(NEW.processed_text_bytes, 0));
+    END IF;
+    IF v_new <> v_old OR a_new <> a_old THEN
+        UPDATE user_storage_quota q
+        SET used_doc_bytes = GREATEST(q.used_doc_bytes + (v_new - v_old), 0),
+            used_bytes     = GREATEST(q.used_bytes + (v_new - v_old), 0),
+            archived_bytes = GREATEST(q.archived_bytes + (a_new - a_old), 0),
+            updated_at     = now()
+        FROM user_document ud
+        WHERE ud.document_id = OLD.id
+          AND q.user_id = ud.user_id;
+    END IF;
+    -- BEFORE DELETE: the links are still there to find the users; their cascade then finds no document
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_quota_doc_bytes_upd ON document;
+CREATE TRIGGER trg_quota_doc_bytes_upd
+    AFTER UPDATE
+    ON document
+    FOR EACH ROW
+    WHEN (OLD.size_bytes IS DISTINCT FROM NEW.size_bytes
+        OR OLD.processed_text_bytes IS DISTINCT FROM NEW.processed_text_bytes
+        OR OLD.status IS DISTINCT FROM NEW.status)
+EXECUTE FUNCTION tg_quota_doc_bytes();
+
+DROP TRIGGER IF EXISTS trg_quota_doc_bytes_del ON document;
+CREATE TRIGGER trg_quota_doc_bytes_del
+    BEFORE DELETE
+    ON document
+    FOR EACH ROW
+EXECUTE FUNCTION tg_quota_doc_bytes();
+
+-- Linking / unlinking a document adds / removes its bytes for that user
+CREATE OR REPLACE FUNCTION tg_quota_user_doc_link() RETURNS trigger AS
+$$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        -- No document row: it is being deleted and trg_quota_doc_bytes_del already subtracted it
+        PERFORM fn_quota_add(OLD.user_id, 0,
+                             -fn_quota_counted(d.status, d.size_bytes + COALESCE(d.processed_text_bytes, 0)),
+                             -fn_quota_archived(d.status, d.size_bytes + COALESCE(d.processed_text_bytes, 0)))
+        FROM document d
+        WHERE d.id = OLD.document_id;
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        PERFORM fn_quota_add(NEW.user_id, 0,
+                             fn_quota_counted(d.status, d.size_bytes + COALESCE(d.processed_text_bytes, 0)),
+                             fn_quota_archived(d.status, d.size_bytes + COALESCE(d.processed_text_bytes, 0)))
+        FROM document d
+        WHERE d.id = NEW.document_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_quota_user_doc_link ON user_document;
+CREATE TRIGGER trg_quota_user_doc_link
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, document_id
+    ON user_document
+    FOR EACH ROW
+EXECUTE FUNCTION tg_quota_user_doc_link();
+
 -- New user default quota（100MB）
 CREATE OR REPLACE FUNCTION tg_user_default_quota() RETURNS trigger AS
 $$
@@ -464,6 +1027,208 @@ CREATE TRIGGER trg_user_default_quota
     FOR EACH ROW
 EXECUTE FUNCTION tg_user_default_quota();
 
+-- Blob reference counts: a document that is not deleted holds its blob
+CREATE OR REPLACE FUNCTION tg_blob_refs() RETURNS trigger AS
+$$
+DECLARE
+    v_old text;
+    v_new text;
+BEGIN
+    IF TG_OP <> 'INSERT' AND OLD.status <> 'deleted' THEN
+        v_old := OLD.blob_sha256;
+    END IF;
+    IF TG_OP <> 'DELETE' AND NEW.status <> 'deleted' THEN
+        v_new := NEW.blob_sha256;
+    END IF;
+    IF v_old IS NOT DISTINCT FROM v_new THEN
+        RETURN NULL;
+    END IF;
+    IF v_old IS NOT NULL THEN
+        UPDATE blob
+        SET ref_count  = GREATEST(ref_count - 1, 0),
+            zero_since = CASE WHEN ref_count <= 1 THEN now() END
+        WHERE sha256 = v_old;
+    END IF;
+    IF v_new IS NOT NULL THEN
+        UPDATE blob
+        SET ref_count  = ref_count + 1,
+            zero_since = NULL
+        WHERE sha256 = v_new;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_blob_refs ON document;
+CREATE TRIGGER trg_blob_refs
+    AFTER INSERT OR DELETE OR UPDATE OF blob_sha256, status
+    ON document
+    FOR EACH ROW
+EXECUTE FUNCTION tg_blob_refs();
+
+-- Organization pools follow their members' counters through appended deltas (no pool row lock);
+-- orgs without a pool row cost one lookup and append nothing
+CREATE OR REPLACE FUNCTION fn_org_quota_add(p_user uuid, p_delta bigint) RETURNS void AS
+$$
+INSERT INTO organization_quota_delta (organization_id, delta)
+SELECT o.organization_id, p_delta
+FROM user_profile u
+         JOIN organization_storage_quota o ON o.organization_id = u.organization_id
+WHERE u.id = p_user
+  AND p_delta <> 0;
+$$ LANGUAGE sql;
+
+-- Pool usage including the deltas not folded yet: what quota checks compare against the limit
+CREATE OR REPLACE FUNCTION fn_org_quota_used(p_org uuid) RETURNS bigint AS
+$$
+SELECT GREATEST(o.used_bytes + COALESCE((SELECT SUM(d.delta)
+                                         FROM organization_quota_delta d
+                                         WHERE d.organization_id = o.organization_id), 0), 0)::bigint
+FROM organization_storage_quota o
+WHERE o.organization_id = p_org;
+$$ LANGUAGE sql STABLE;
+
+-- Apply up to p_limit pending deltas to their pools; returns how many were folded. Called by the
+-- background folder; the advisory lock keeps it from interleaving with fn_org_quota_reconcile
+CREATE OR REPLACE FUNCTION fn_org_quota_fold(p_limit integer) RETURNS integer AS
+$$
+DECLARE
+    v_folded integer;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('fn_org_quota_fold'));
+    WITH taken AS (
+        DELETE FROM organization_quota_delta
+            WHERE id IN (SELECT id FROM organization_quota_delta ORDER BY id LIMIT p_limit)
+            RETURNING organization_id, delta),
+         sums AS (SELECT organization_id, SUM(delta) AS delta, count(*) AS n
+                  FROM taken
+                  GROUP BY organization_id),
+         applied AS (
+             UPDATE organization_storage_quota o
+                 SET used_bytes = GREATEST(o.used_bytes + s.delta, 0),
+                     updated_at = now()
+                 FROM sums s
+                 WHERE o.organization_id = s.organization_id
+                 RETURNING 1)
+    SELECT COALESCE(SUM(n), 0)::integer INTO v_folded FROM sums;
+    RETURN v_folded;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION tg_org_quota_from_user() RETURNS trigger AS
+$$
+BEGIN
+    -- A member being deleted is no longer found here; trg_org_quota_member already subtracted it
+    IF TG_OP = 'INSERT' THEN
+        PERFORM fn_org_quota_add(NEW.user_id, NEW.used_bytes);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM fn_org_quota_add(OLD.user_id, -OLD.used_bytes);
+    ELSIF NEW.used_bytes <> OLD.used_bytes THEN
+        PERFORM fn_org_quota_add(NEW.user_id, NEW.used_bytes - OLD.used_bytes);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_org_quota_from_user ON user_storage_quota;
+CREATE TRIGGER trg_org_quota_from_user
+    AFTER INSERT OR DELETE OR UPDATE OF used_bytes
+    ON user_storage_quota
+    FOR EACH ROW
+EXECUTE FUNCTION tg_org_quota_from_user();
+
+-- Members leaving (delete) or moving between organizations take their usage with them
+CREATE OR REPLACE FUNCTION tg_org_quota_member() RETURNS trigger AS
+$$
+DECLARE
+    v_used bigint;
+BEGIN
+    SELECT q.used_bytes INTO v_used FROM user_storage_quota q WHERE q.user_id = OLD.id;
+    IF COALESCE(v_used, 0) <> 0 THEN
+        INSERT INTO organization_quota_delta (organization_id, delta)
+        SELECT o.organization_id, -v_used
+        FROM organization_storage_quota o
+        WHERE o.organization_id = OLD.organization_id;
+        IF TG_OP = 'UPDATE' THEN
+            INSERT INTO organization_quota_delta (organization_id, delta)
+            SELECT o.organization_id, v_used
+            FROM organization_storage_quota o
+            WHERE o.organization_id = NEW.organization_id;
+        END IF;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        RETURN OLD;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_org_quota_member_del ON user_profile;
+CREATE TRIGGER trg_org_quota_member_del
+    BEFORE DELETE
+    ON user_profile
+    FOR EACH ROW
+EXECUTE FUNCTION tg_org_quota_member();
+
+DROP TRIGGER IF EXISTS trg_org_quota_member_move ON user_profile;
+CREATE TRIGGER trg_org_quota_member_move
+    AFTER UPDATE OF organization_id
+    ON user_profile
+    FOR EACH ROW
+    WHEN (OLD.organization_id IS DISTINCT FROM NEW.organization_id)
+EXECUTE FUNCTION tg_org_quota_member();
+
+-- Recompute pools from the members' counters (not their conversations/documents) and drop their
+-- pending deltas, both read in one snapshot; returns the drifted ones (against pool + pending deltas)
+CREATE OR REPLACE FUNCTION fn_org_quota_reconcile(p_orgs uuid[])
+    RETURNS TABLE
+            (
+                organization_id uuid,
+                drift           bigint
+            )
+    LANGUAGE plpgsql
+AS
+$$
+#variable_conflict use_column
+BEGIN
+    -- Same lock as fn_org_quota_fold: a fold in progress would otherwise apply deltas deleted here
+    PERFORM pg_advisory_xact_lock(hashtext('fn_org_quota_fold'));
+    PERFORM 1
+    FROM organization_storage_quota o
+    WHERE o.organization_id = ANY (p_orgs)
+    ORDER BY o.organization_id
+        FOR UPDATE;
+
+    RETURN QUERY
+        WITH pending AS (
+            DELETE FROM organization_quota_delta d
+                WHERE d.organization_id = ANY (p_orgs)
+                RETURNING d.organization_id, d.delta),
+             pending_sums AS (SELECT p.organization_id, SUM(p.delta) AS delta
+                              FROM pending p
+                              GROUP BY p.organization_id),
+             actual AS (SELECT o.organization_id,
+                               o.used_bytes AS pool_used,
+                               (o.used_bytes + COALESCE(ps.delta, 0))::bigint AS old_used,
+                               (SELECT COALESCE(SUM(q.used_bytes), 0)
+                                FROM user_profile u
+                                         JOIN user_storage_quota q ON q.user_id = u.id
+                                WHERE u.organization_id = o.organization_id)::bigint AS used
+                        FROM organization_storage_quota o
+                                 LEFT JOIN pending_sums ps ON ps.organization_id = o.organization_id
+                        WHERE o.organization_id = ANY (p_orgs)),
+             fixed AS (
+                 UPDATE organization_storage_quota o
+                     SET used_bytes = a.used,
+                         updated_at = now()
+                     FROM actual a
+                     WHERE o.organization_id = a.organization_id
+                         AND a.pool_used <> a.used
+                     RETURNING o.organization_id, a.used - a.old_used AS drift)
+        SELECT f.organization_id, f.drift FROM fixed f WHERE f.drift <> 0;
+END;
+$$;
+
 COMMIT;
 
 CREATE OR REPLACE FUNCTION fn_autorelease_on_message(p_user uuid)
@@ -488,6 +1253,6 @@ BEGIN
     END IF;
 
     RETURN QUERY
-        SELECT * FROM fn_quota_tag_oldest_20_percent(p_user, false);
+        SELECT * FROM fn_quota_tag_oldest_20_percent(p_user);
 END;
 $$;
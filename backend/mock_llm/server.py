@@ -70,8 +70,9 @@ def generate_llm_response(question, organisation_name):
     return "".join(responses)
 
 def calculate_tokens(text):
-    """Calculate approximate token count (rough estimate: 1 token ≈ 4 characters)"""
-    return len(text) // 4 + random.randint(1, 10)
+    """Calculate approximate token count (CJK ≈ 1 token per character, other text ≈ 4 characters per token)"""
+    cjk = sum(1 for ch in text if '\u3000' <= ch <= '\u9fff' or '\uac00' <= ch <= '\ud7a3' or '\uff00' <= ch <= '\uffef')
+    return cjk + (len(text) - cjk) // 4 + random.randint(1, 10)
 
 def calculate_reasoning_tokens(text):
     """Calculate reasoning tokens (typically 20-50% of output tokens)"""
@@ -0,0 +1,74 @@
+# scripts/merge_sessions.py
+"""
+One-off cleanup after session reuse: merge the per-conversation sessions created
+before it into one session per client run (fn_merge_redundant_sessions).
+
+Walks user ids in keyset order, BATCH_USERS users per transaction, so each batch
+holds its row locks briefly. lock_timeout makes a batch that collides with live
+traffic give up quickly; it is retried after a pause instead of queueing behind it.
+Safe to re-run: merged users have nothing left to merge.
+
+Usage (from backend/):
+    python scripts/merge_sessions.py
+    BATCH_USERS=100 PAUSE_MS=200 IDLE_S=3600 python scripts/merge_sessions.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import DBAPIError  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.database import AsyncSessionLocal  # noqa: E402
+
+BATCH_USERS = int(os.getenv("BATCH_USERS", "200"))
+PAUSE_MS = float(os.getenv("PAUSE_MS", "50"))
+IDLE_S = float(os.getenv("IDLE_S", str(settings.SESSION_REUSE_IDLE_S)))
+LOCK_TIMEOUT = os.getenv("LOCK_TIMEOUT", "2s")
+MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", "5"))
+
+_NEXT_USERS = text("SELECT id FROM user_profile WHERE id > CAST(:after AS uuid) ORDER BY id LIMIT :n")
+_MERGE = text(
+    "SELECT fn_merge_redundant_sessions(CAST(:users AS uuid[]), make_interval(secs => :idle_s))"
+)
+
+
+async def _merge_batch(user_ids: list[str]) -> int:
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                merged = (await db.execute(_MERGE, {"users": user_ids, "idle_s": IDLE_S})).scalar_one()
+                await db.commit()
+                return int(merged or 0)
+        except DBAPIError as e:
+            if attempt == MAX_ATTEMPTS:
+                raise
+            print(f"  batch retry {attempt}/{MAX_ATTEMPTS - 1}: {e.orig!r}")
+            await asyncio.sleep(PAUSE_MS / 1000 * 2 ** attempt)
+    return 0
+
+
+async def main():
+    after = "00000000-0000-0000-0000-000000000000"
+    users = merged = 0
+    started = time.perf_counter()
+    while True:
+        async with AsyncSessionLocal() as db:
+            ids = [str(r[0]) for r in await db.execute(_NEXT_USERS, {"after": after, "n": BATCH_USERS})]
+        if not ids:
+            break
+        merged += await _merge_batch(ids)
+        users += len(ids)
+        after = ids[-1]
+        print(f"users={users:8d}  sessions merged={merged:9d}  elapsed={time.perf_counter() - started:7.1f}s")
+        await asyncio.sleep(PAUSE_MS / 1000)
+    print(f"done: {merged} redundant sessions merged across {users} users")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
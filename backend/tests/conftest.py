@@ -0,0 +1,5 @@
+# tests/conftest.py
+import os
+
+# Unit tests import app modules, whose settings require a secret; the e2e tests talk to a running server
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
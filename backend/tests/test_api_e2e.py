@@ -404,19 +404,25 @@ def test_send_message_stream(http_session, user_token, conversation):
     )
     assert resp.status_code == 200
 
-    # read a few lines from the stream to verify SSE format
+    # read a few frames from the stream to verify SSE format: "id: N" (for Last-Event-ID resume), then "data: {...}"
     line_count = 0
+    event_ids = []
     for line in resp.iter_lines():
         if not line:
             continue
         decoded = line.decode("utf-8")
+        if decoded.startswith("id:"):
+            event_ids.append(int(decoded[3:].strip()))
+            continue
         assert decoded.startswith("data:")
+        json.loads(decoded[5:])
         line_count += 1
         if line_count >= 3:
             break
 
     resp.close()
     assert line_count >= 1
+    assert event_ids == sorted(event_ids)
 
 
 # ---------- Admin: users & analytics ----------
@@ -0,0 +1,137 @@
+# tests/test_files_download.py
+import datetime
+import hashlib
+import uuid
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+from app.core.database import get_db
+from app.core.deps import get_current_user
+from app.routers import files
+from app.routers.files import _not_modified
+
+CONTENT = b"0123456789" * 100
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+ETAG = f'"{SHA256}"'
+CREATED_AT = datetime.datetime(2025, 5, 1, 8, 0, 0, 500000, tzinfo=datetime.timezone.utc)
+
+
+def _request(**headers) -> Request:
+    raw = [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()]
+    return Request({"type": "http", "method": "GET", "headers": raw})
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({}, False),
+    ({"if_none_match": ETAG}, True),
+    ({"if_none_match": f'"other", W/{ETAG}'}, True),
+    ({"if_none_match": "*"}, True),
+    ({"if_none_match": '"other"'}, False),
+    # If-None-Match wins over If-Modified-Since
+    ({"if_none_match": '"other"', "if_modified_since": formatdate(CREATED_AT.timestamp() + 60, usegmt=True)}, False),
+    # Whole seconds: the sub-second part of the upload time does not count
+    ({"if_modified_since": formatdate(int(CREATED_AT.timestamp()), usegmt=True)}, True),
+    ({"if_modified_since": formatdate(CREATED_AT.timestamp() - 1, usegmt=True)}, False),
+    ({"if_modified_since": "not a date"}, False),
+])
+def test_not_modified(headers, expected):
+    assert _not_modified(_request(**headers), ETAG, CREATED_AT) is expected
+
+
+def test_not_modified_without_etag_ignores_if_none_match():
+    assert _not_modified(_request(if_none_match="*"), None, CREATED_AT) is False
+
+
+class _FakeResult:
+    def __init__(self, doc):
+        self._doc = doc
+
+    def scalar_one_or_none(self):
+        return self._doc
+
+
+class _FakeSession:
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def execute(self, _stmt):
+        return _FakeResult(self.doc)
+
+    async def rollback(self):
+        pass
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / "blob"
+    path.write_bytes(CONTENT)
+    doc = SimpleNamespace(
+        blob_sha256=None, storage_url=str(path), filename="report.txt", mime_type="text/plain",
+        sha256=SHA256, created_at=CREATED_AT,
+    )
+    app = FastAPI()
+    app.include_router(files.router)
+
+    async def fake_db():
+        yield _FakeSession(doc)
+
+    app.dependency_overrides[get_db] = fake_db
+    app.dependency_overrides[get_current_user] = lambda: SimpleNamespace(id=uuid.uuid4())
+    with TestClient(app) as c:
+        c.doc, c.path = doc, path
+        yield c
+
+
+def _url() -> str:
+    return f"/files/{uuid.uuid4()}/content"
+
+
+def test_download_sends_validators(client):
+    r = client.get(_url())
+    assert r.status_code == 200
+    assert r.content == CONTENT
+    assert r.headers["etag"] == ETAG
+    assert r.headers["last-modified"] == formatdate(CREATED_AT.timestamp(), usegmt=True)
+    assert r.headers["cache-control"] == "private, no-cache"
+    assert "report.txt" in r.headers["content-disposition"]
+
+
+def test_conditional_get_answers_304_without_a_body(client):
+    r = client.get(_url(), headers={"If-None-Match": ETAG})
+    assert r.status_code == 304
+    assert r.content == b""
+    assert r.headers["etag"] == ETAG
+
+
+def test_single_range(client):
+    r = client.get(_url(), headers={"Range": "bytes=10-19"})
+    assert r.status_code == 206
+    assert r.content == CONTENT[10:20]
+    assert r.headers["content-range"] == f"bytes 10-19/{len(CONTENT)}"
+
+
+def test_suffix_range(client):
+    r = client.get(_url(), headers={"Range": "bytes=-5"})
+    assert r.status_code == 206
+    assert r.content == CONTENT[-5:]
+
+
+def test_unsatisfiable_range(client):
+    r = client.get(_url(), headers={"Range": f"bytes={len(CONTENT) + 10}-"})
+    assert r.status_code == 416
+
+
+def test_if_range_with_a_stale_etag_sends_the_whole_file(client):
+    r = client.get(_url(), headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert r.status_code == 200
+    assert r.content == CONTENT
+
+
+def test_missing_file_is_gone(client):
+    client.path.unlink()
+    assert client.get(_url()).status_code == 410
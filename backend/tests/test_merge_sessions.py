@@ -0,0 +1,72 @@
+# tests/test_merge_sessions.py
+"""
+fn_merge_redundant_sessions against a real database (console.sql applied).
+Runs in one transaction that is rolled back; skipped when Postgres is unreachable.
+"""
+import asyncio
+import os
+
+import pytest
+
+asyncpg = pytest.importorskip("asyncpg")
+
+DATABASE_URL = os.getenv(
+    "DATABASE_URL", "postgresql+asyncpg://app_user:appuserpass@db:5432/local_test_db_lorgan"
+).replace("postgresql+asyncpg://", "postgresql://")
+
+
+async def _connect():
+    try:
+        return await asyncpg.connect(DATABASE_URL, timeout=3)
+    except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+        pytest.skip(f"Postgres unreachable: {e!r}")
+
+
+async def _merge_keeps_session_rows():
+    conn = await _connect()
+    tx = conn.transaction()
+    await tx.start()
+    try:
+        org_id = await conn.fetchval("INSERT INTO organization (name) VALUES ('merge-test') RETURNING id")
+        user_id = await conn.fetchval(
+            "INSERT INTO user_profile (organization_id, email, password_hash, display_name) "
+            "VALUES ($1, 'merge-test@example.com', 'x', 'merge-test') RETURNING id",
+            org_id,
+        )
+        # Two sessions of one client, the second opened a minute after the first was last seen
+        survivor = await conn.fetchval(
+            "INSERT INTO session (user_id, ip_address, user_agent, created_at) "
+            "VALUES ($1, '10.0.0.1', 'ua', now() - interval '10 minutes') RETURNING id",
+            user_id,
+        )
+        merged = await conn.fetchval(
+            "INSERT INTO session (user_id, ip_address, user_agent, created_at) "
+            "VALUES ($1, '10.0.0.1', 'ua', now() - interval '9 minutes') RETURNING id",
+            user_id,
+        )
+        await conn.execute("INSERT INTO telemetry_event (session_id, kind) VALUES ($1, 'llm.usage')", merged)
+        await conn.execute("INSERT INTO safety_event (session_id, category) VALUES ($1, 'test')", merged)
+        await conn.execute(
+            "INSERT INTO api_call_log (session_id, provider, endpoint, http_status) "
+            "VALUES ($1, 'ollama', '/api/chat', 200)",
+            merged,
+        )
+
+        count = await conn.fetchval(
+            "SELECT fn_merge_redundant_sessions(ARRAY[$1]::uuid[], interval '30 minutes')", user_id
+        )
+        assert count == 1
+        assert await conn.fetchval("SELECT count(*) FROM session WHERE id = $1", merged) == 0
+
+        for table in ("telemetry_event", "safety_event", "api_call_log"):
+            sessions = await conn.fetch(
+                f"SELECT session_id FROM {table} WHERE session_id = ANY($1::uuid[])", [survivor, merged]
+            )
+            assert [r["session_id"] for r in sessions] == [survivor], table
+    finally:
+        await tx.rollback()
+        await conn.close()
+
+
+def test_merge_repoints_session_rows():
+    asyncio.run(_merge_keeps_session_rows())
@@ -0,0 +1,51 @@
+# tests/test_pagination.py
+import datetime
+import uuid
+
+import pytest
+from sqlalchemy import Column, Integer, MetaData, Table, create_engine, select
+
+from app.services.pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_after
+
+
+def test_cursor_round_trip():
+    ts = datetime.datetime(2025, 3, 1, 12, 30, 5, 123456, tzinfo=datetime.timezone.utc)
+    row_id = uuid.uuid4()
+    cursor = encode_cursor(ts, row_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (ts, row_id)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not a cursor",
+    "%%%",
+    encode_cursor(datetime.datetime(2025, 1, 1), uuid.uuid4())[:-6],  # truncated id
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("descending", [True, False])
+def test_keyset_pages_cover_every_row_once_with_timestamp_ties(descending):
+    rows = Table("rows", MetaData(), Column("ts", Integer), Column("id", Integer))
+    engine = create_engine("sqlite://")
+    rows.metadata.create_all(engine)
+    # Many rows share a timestamp: the id settles the order
+    data = [{"ts": i // 3, "id": i} for i in range(20)]
+    order = (rows.c.ts.desc(), rows.c.id.desc()) if descending else (rows.c.ts, rows.c.id)
+    with engine.connect() as conn:
+        conn.execute(rows.insert(), data)
+        expected = [tuple(r) for r in conn.execute(select(rows.c.ts, rows.c.id).order_by(*order))]
+        seen, after = [], None
+        while True:
+            stmt = select(rows.c.ts, rows.c.id).order_by(*order).limit(4)
+            if after is not None:
+                stmt = stmt.where(keyset_after(rows.c.ts, rows.c.id, *after, descending=descending))
+            page = [tuple(r) for r in conn.execute(stmt)]
+            if not page:
+                break
+            seen.extend(page)
+            after = page[-1]
+    assert seen == expected
@@ -0,0 +1,58 @@
+# tests/test_sessions.py
+"""
+Session reuse on conversation create against a real database (console.sql applied).
+Runs in one transaction that is rolled back; skipped when Postgres is unreachable.
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+from app.services.sessions import create_conversation_in_session
+
+
+async def _two_conversations_from_one_client(monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_REUSE_IDLE_S", 1800)
+    engine = create_async_engine(settings.DATABASE_URL, poolclass=NullPool, connect_args={"timeout": 3})
+    try:
+        conn = await engine.connect()
+    except (OSError, asyncio.TimeoutError) as e:
+        await engine.dispose()
+        pytest.skip(f"Postgres unreachable: {e!r}")
+    tx = await conn.begin()
+    try:
+        db = AsyncSession(bind=conn)
+        org_id = (await db.execute(
+            text("INSERT INTO organization (name) VALUES ('reuse-test') RETURNING id")
+        )).scalar_one()
+        user_id = (await db.execute(
+            text("INSERT INTO user_profile (organization_id, email, password_hash, display_name) "
+                 "VALUES (:org, 'reuse-test@example.com', 'x', 'reuse-test') RETURNING id"),
+            {"org": org_id},
+        )).scalar_one()
+
+        first = await create_conversation_in_session(db, user_id, "10.0.0.1", "ua", "first")
+        second = await create_conversation_in_session(db, user_id, "10.0.0.1", "ua", "second")
+        other = await create_conversation_in_session(db, user_id, "10.0.0.2", "ua", "other client")
+
+        sessions = dict((await db.execute(
+            text("SELECT id, session_id FROM conversation WHERE id IN (:a, :b, :c)"),
+            {"a": first["id"], "b": second["id"], "c": other["id"]},
+        )).all())
+        assert sessions[first["id"]] == sessions[second["id"]]
+        assert sessions[other["id"]] != sessions[first["id"]]
+        states = (await db.execute(
+            text("SELECT DISTINCT state FROM session WHERE user_id = :u"), {"u": user_id}
+        )).scalars().all()
+        assert states == ["active"]
+    finally:
+        await tx.rollback()
+        await conn.close()
+        await engine.dispose()
+
+
+def test_conversations_from_one_client_share_a_session(monkeypatch):
+    asyncio.run(_two_conversations_from_one_client(monkeypatch))
@@ -0,0 +1,113 @@
+# tests/test_sse.py
+import asyncio
+from contextlib import aclosing
+
+from app.services.sse import _Coalescer, coalesce_deltas, encode_frame, iter_frames
+
+
+async def _events(*events):
+    for ev in events:
+        yield ev
+
+
+async def _collect(agen):
+    return [ev async for ev in agen]
+
+
+def test_coalescer_merges_runs_of_the_same_type():
+    async def run():
+        c = _Coalescer(interval_ms=0, max_bytes=0)
+        c.push({"type": "delta", "delta": "Hel"})
+        c.push({"type": "delta", "delta": "lo"})
+        c.push({"type": "thinking", "reasoning": "hmm"})
+        c.push({"type": "delta", "delta": ""})  # empty pieces are dropped
+        c.push({"type": "complete", "id": 1})
+        return list(c.ready)
+
+    assert asyncio.run(run()) == [
+        {"type": "delta", "delta": "Hello"},
+        {"type": "thinking", "delta": "hmm"},
+        {"type": "complete", "id": 1},
+    ]
+
+
+def test_coalescer_flushes_at_max_bytes():
+    async def run():
+        c = _Coalescer(interval_ms=0, max_bytes=4)
+        for piece in ("ab", "cd", "e"):
+            c.push({"type": "delta", "delta": piece})
+        flushed = list(c.ready)
+        c.take()
+        return flushed, list(c.ready)
+
+    flushed, after_take = asyncio.run(run())
+    assert flushed == [{"type": "delta", "delta": "abcd"}]
+    assert after_take[-1] == {"type": "delta", "delta": "e"}
+
+
+def test_coalescer_flushes_on_timer():
+    async def run():
+        c = _Coalescer(interval_ms=10, max_bytes=0)
+        c.push({"type": "delta", "delta": "a"})
+        assert not c.ready
+        await asyncio.wait_for(c.wake.wait(), timeout=1)
+        return list(c.ready)
+
+    assert asyncio.run(run()) == [{"type": "delta", "delta": "a"}]
+
+
+def test_coalesce_deltas_preserves_text_and_order():
+    upstream = [{"type": "delta", "delta": c} for c in "streamed"] + [{"type": "complete"}]
+    out = asyncio.run(_collect(coalesce_deltas(_events(*upstream), interval_ms=1000, max_bytes=0)))
+    assert out == [{"type": "delta", "delta": "streamed"}, {"type": "complete"}]
+
+
+def test_coalesce_deltas_reraises_upstream_errors_after_flushing():
+    async def failing():
+        yield {"type": "delta", "delta": "partial"}
+        raise RuntimeError("upstream died")
+
+    async def run():
+        seen = []
+        try:
+            async for ev in coalesce_deltas(failing(), interval_ms=1000, max_bytes=0):
+                seen.append(ev)
+        except RuntimeError as e:
+            return seen, str(e)
+        return seen, None
+
+    assert asyncio.run(run()) == ([{"type": "delta", "delta": "partial"}], "upstream died")
+
+
+
+def test_closing_coalesce_deltas_early_closes_upstream():
+    async def run(interval_ms):
+        closed = []
+
+        async def upstream():
+            try:
+                while True:
+                    yield {"type": "complete"}
+                    await asyncio.sleep(0)
+            finally:
+                closed.append(True)
+
+        async with aclosing(coalesce_deltas(upstream(), interval_ms=interval_ms, max_bytes=0)) as events:
+            async for _ in events:
+                break
+        return closed
+
+    assert asyncio.run(run(1000)) == [True]
+    assert asyncio.run(run(0)) == [True]
+
+def test_iter_frames_round_trip_across_chunk_boundaries():
+    stream = encode_frame({"type": "delta", "delta": "é"}, event_id=1) + encode_frame({"type": "complete"})
+
+    async def chunks():
+        for i in range(0, len(stream), 5):
+            yield stream[i:i + 5]
+
+    assert asyncio.run(_collect(iter_frames(chunks()))) == [
+        (1, '{"type":"delta","delta":"é"}'.encode()),
+        (None, b'{"type":"complete"}'),
+    ]
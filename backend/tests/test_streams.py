@@ -0,0 +1,186 @@
+# tests/test_streams.py
+import asyncio
+import json
+import uuid
+
+import pytest
+
+from app.core.config import settings
+from app.services.streams import GenerationInProgress, LiveStream, StreamRegistry, _Subscriber
+
+
+def _stream() -> LiveStream:
+    return LiveStream(uuid.uuid4(), uuid.uuid4())
+
+
+def _ids(frames: bytes) -> list[int]:
+    return [int(line[4:]) for line in frames.split(b"\n") if line.startswith(b"id: ")]
+
+
+def _events(frames: bytes) -> list[dict]:
+    return [json.loads(line[6:]) for line in frames.split(b"\n") if line.startswith(b"data: ")]
+
+
+def test_prefill_new_viewer_gets_a_snapshot_once_anything_was_published():
+    stream = _stream()
+    sub = _Subscriber()
+    stream._prefill(sub, None)
+    assert not sub.resync and not sub.queue
+
+    stream.publish({"type": "delta", "delta": "Hi"})
+    sub = _Subscriber()
+    stream._prefill(sub, None)
+    assert sub.resync and not sub.queue
+
+
+def test_prefill_replays_only_frames_after_last_event_id_with_interleaved_streams():
+    a, b = _stream(), _stream()
+    # Ids are process-wide: the two streams' ids interleave
+    for i in range(3):
+        a.publish({"type": "delta", "delta": f"a{i}"})
+        b.publish({"type": "delta", "delta": f"b{i}"})
+    a_ids = [event_id for event_id, _ in a.frames]
+
+    sub = _Subscriber()
+    a._prefill(sub, a_ids[0])
+    replay = sub.drain()
+    assert _ids(replay) == a_ids[1:]
+    assert [ev["delta"] for ev in _events(replay)] == ["a1", "a2"]
+    assert not sub.resync
+
+
+def test_prefill_caught_up_client_gets_nothing():
+    stream = _stream()
+    stream.publish({"type": "delta", "delta": "x"})
+    sub = _Subscriber()
+    stream._prefill(sub, stream.last_id)
+    assert not sub.queue and not sub.resync
+
+
+def test_prefill_resyncs_when_the_gap_was_trimmed(monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_BUFFER_MAX_FRAMES", 2)
+    stream = _stream()
+    for i in range(4):
+        stream.publish({"type": "delta", "delta": str(i)})
+    first_id = stream.frames[0][0]
+
+    sub = _Subscriber()
+    stream._prefill(sub, first_id - 2)
+    assert sub.resync and not sub.queue
+
+    sub = _Subscriber()
+    stream._prefill(sub, first_id - 1)
+    assert not sub.resync and len(_ids(sub.drain())) == 2
+
+
+def test_prefill_resyncs_when_the_backlog_exceeds_the_queue_budget(monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_SUBSCRIBER_QUEUE_BYTES", 100)
+    stream = _stream()
+    first = None
+    for _ in range(5):
+        stream.publish({"type": "delta", "delta": "x" * 40})
+        first = first or stream.last_id
+    sub = _Subscriber()
+    stream._prefill(sub, first)
+    assert sub.resync and not sub.queue
+
+
+def test_registry_refuses_a_second_live_generation():
+    async def run():
+        registry = StreamRegistry()
+        cid, uid = uuid.uuid4(), uuid.uuid4()
+        release = asyncio.Event()
+
+        async def produce(stream):
+            await release.wait()
+
+        first = registry.start(cid, uid, produce)
+        with pytest.raises(GenerationInProgress):
+            registry.start(cid, uid, produce)
+        assert registry.get(cid, uid) is first
+
+        release.set()
+        await first.task
+        assert not registry.busy(cid)
+        second = registry.start(cid, uid, produce)
+        assert second is not first
+        await second.task
+
+    asyncio.run(run())
+
+
+def _slow_subscriber(stream: LiveStream, monkeypatch, policy: str, queue_bytes: int = 200) -> _Subscriber:
+    monkeypatch.setattr(settings, "STREAM_SLOW_CONSUMER_POLICY", policy)
+    monkeypatch.setattr(settings, "STREAM_SUBSCRIBER_QUEUE_BYTES", queue_bytes)
+    sub = _Subscriber()
+    stream._subscribers.add(sub)
+    return sub
+
+
+def test_resync_policy_drops_the_backlog_for_a_snapshot(monkeypatch):
+    stream = _stream()
+    sub = _slow_subscriber(stream, monkeypatch, "resync")
+    for _ in range(10):
+        stream.publish({"type": "delta", "delta": "x" * 40})
+    assert sub.resync and not sub.queue
+    assert not sub.dropped and not sub.spilling
+    snapshot = _events(stream.snapshot_frame())[0]
+    assert snapshot["type"] == "snapshot" and snapshot["answer"] == "x" * 400
+
+
+def test_drop_policy_ends_the_subscriber(monkeypatch):
+    stream = _stream()
+    sub = _slow_subscriber(stream, monkeypatch, "drop")
+    for _ in range(10):
+        stream.publish({"type": "delta", "delta": "x" * 40})
+    assert sub.dropped and not sub.queue
+
+
+def test_dropped_follower_gets_a_slow_consumer_error(monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_SLOW_CONSUMER_POLICY", "drop")
+    monkeypatch.setattr(settings, "STREAM_SUBSCRIBER_QUEUE_BYTES", 200)
+    stream = _stream()
+
+    async def run():
+        frames = []
+        follower = asyncio.create_task(_drain(stream.follow(), frames))
+        await asyncio.sleep(0)
+        # Published without yielding to the follower: it falls behind
+        for _ in range(10):
+            stream.publish({"type": "delta", "delta": "y" * 40})
+        stream.close()
+        await asyncio.wait_for(follower, timeout=1)
+        return frames
+
+    frames = asyncio.run(run())
+    assert _events(frames[-1]) == [{"type": "error", "error": "slow_consumer"}]
+    assert stream.subscribers == 0
+
+
+async def _drain(agen, out: list) -> None:
+    async for chunk in agen:
+        out.append(chunk)
+
+
+def test_spill_policy_keeps_every_frame_in_order(monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_SPILL_MAX_BYTES", 1 << 20)
+    stream = _stream()
+    sub = _slow_subscriber(stream, monkeypatch, "spill")
+    for i in range(20):
+        stream.publish({"type": "delta", "delta": f"{i:02d}" * 20})
+    assert sub.spilling and not sub.resync and not sub.dropped
+
+    received = sub.drain()
+    while sub.spilling:
+        received += sub.read_spill()
+    assert _ids(received) == [event_id for event_id, _ in stream.frames]
+    assert "".join(ev["delta"] for ev in _events(received)) == "".join(f"{i:02d}" * 20 for i in range(20))
+
+
+def test_spill_policy_drops_a_subscriber_past_the_spill_cap(monkeypatch):
+    monkeypatch.setattr(settings, "STREAM_SPILL_MAX_BYTES", 300)
+    stream = _stream()
+    sub = _slow_subscriber(stream, monkeypatch, "spill")
+    for _ in range(20):
+        stream.publish({"type": "delta", "delta": "x" * 40})
+    assert sub.dropped and not sub.spilling and not sub.queue
@@ -0,0 +1,70 @@
+# tests/test_tokens.py
+from app.services.tokens import (
+    PER_MESSAGE_OVERHEAD_TOKENS,
+    TokenEstimator,
+    batch_features,
+    model_family,
+    text_features,
+)
+
+
+def test_text_features_split_cjk_ascii_other():
+    assert text_features("ab 你好 é") == (2, 4, 1)
+    assert text_features(None) == (0, 0, 0)
+
+
+
+def test_batch_features_match_text_features():
+    texts = ["plain ascii", None, "", "你好，世界 and ascii", "한국어 ｱｲ é", "nul\x00inside 你"]
+    assert batch_features(texts) == [text_features(t) for t in texts]
+    assert batch_features(["你好"]) == [(2, 0, 0)]
+
+def test_model_family():
+    assert model_family("qwen3:4b") == "qwen"
+    assert model_family("gemma3:1b") == "gemma"
+    assert model_family("llama3") == "default"
+    assert model_family(None) == "default"
+
+
+def test_estimate_uses_family_priors():
+    est = TokenEstimator()
+    assert est.estimate("") == 0
+    assert est.estimate("a" * 400, "qwen3:4b") == 100
+    assert est.estimate("你" * 100, "qwen3:4b") == 75
+    assert est.estimate("你" * 100, "mistral") == 100
+    # Never 0 for non-empty text
+    assert est.estimate("a") == 1
+
+
+def test_estimate_batch_matches_estimate():
+    est = TokenEstimator()
+    texts = ["hello world", "", None, "你好，世界", "x" * 1000]
+    assert est.estimate_batch(texts, "qwen3") == [est.estimate(t, "qwen3") for t in texts]
+
+
+def test_estimate_messages_adds_overhead():
+    est = TokenEstimator()
+    messages = [{"role": "user", "content": "a" * 40}, {"role": "assistant", "content": None}]
+    assert est.estimate_messages(messages) == 10 + 2 * PER_MESSAGE_OVERHEAD_TOKENS
+
+
+def test_observe_output_converges_towards_observed_ratio():
+    est = TokenEstimator()
+    text = "a" * 500
+    # This tokenizer spends one token per 2.5 ASCII chars instead of the prior 4
+    for _ in range(100):
+        est.observe_output("qwen3", text, 200)
+    assert abs(est.estimate(text, "qwen3") - 200) <= 10
+    assert est.snapshot()["qwen"]["samples"] == 100
+    # Other families keep their priors
+    assert est.estimate(text, "gemma3") == 125
+
+
+def test_observe_prompt_ignores_prefix_cache_hits():
+    est = TokenEstimator()
+    messages = [{"role": "user", "content": "a" * 2000}]
+    # Far below the estimate (500): most of the prompt came from the cache
+    est.observe_prompt("qwen3", messages, 50)
+    assert "qwen" not in est.snapshot() or est.snapshot()["qwen"]["samples"] == 0
+    est.observe_prompt("qwen3", messages, 600 + PER_MESSAGE_OVERHEAD_TOKENS)
+    assert est.snapshot()["qwen"]["samples"] == 1
@@ -0,0 +1,27 @@
+# tests/test_upload_sessions.py
+import pytest
+
+from app.services.upload_sessions import merge_ranges
+
+
+@pytest.mark.parametrize("ranges, merged", [
+    ([], []),
+    ([(0, 10)], [(0, 10)]),
+    # Adjacent chunks join: end is exclusive
+    ([(0, 10), (10, 20), (20, 25)], [(0, 25)]),
+    # Gaps stay visible, so the client knows what to resend
+    ([(0, 10), (20, 30)], [(0, 10), (20, 30)]),
+    # Parallel chunks arrive in any order
+    ([(20, 30), (0, 10), (10, 20)], [(0, 30)]),
+    # A re-sent, longer or contained chunk
+    ([(0, 10), (5, 15), (6, 8)], [(0, 15)]),
+    ([(0, 100), (10, 20), (90, 120)], [(0, 120)]),
+])
+def test_merge_ranges(ranges, merged):
+    assert merge_ranges(ranges) == merged
+
+
+def test_complete_file_is_one_range():
+    size, chunk = 10_000, 1024
+    chunks = [(start, min(start + chunk, size)) for start in range(0, size, chunk)]
+    assert merge_ranges(reversed(chunks)) == [(0, size)]
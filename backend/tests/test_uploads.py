@@ -0,0 +1,92 @@
+# tests/test_uploads.py
+import asyncio
+import hashlib
+
+import pytest
+from starlette.requests import Request
+
+from app.services.uploads import UploadError, UploadQuotaExceeded, receive_multipart_file
+
+BOUNDARY = "----test-boundary"
+
+
+def _body(content: bytes, filename: str = "notes.txt", fields: dict | None = None, file_field: str = "file") -> bytes:
+    parts = []
+    for name, value in (fields or {}).items():
+        parts.append(
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        )
+    parts.append(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{filename}"\r\n'
+        f"Content-Type: text/plain\r\n\r\n".encode() + content + b"\r\n"
+    )
+    parts.append(f"--{BOUNDARY}--\r\n".encode())
+    return b"".join(parts)
+
+
+def _request(body: bytes, chunk_size: int = 1000, content_type: str | None = None) -> Request:
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+
+    async def receive():
+        chunk = chunks.pop(0)
+        return {"type": "http.request", "body": chunk, "more_body": bool(chunks)}
+
+    content_type = content_type or f"multipart/form-data; boundary={BOUNDARY}"
+    scope = {"type": "http", "method": "POST", "headers": [(b"content-type", content_type.encode())]}
+    return Request(scope, receive)
+
+
+def _receive(body: bytes, temp_path, **kwargs):
+    chunk_size = kwargs.pop("chunk_size", 1000)
+    content_type = kwargs.pop("content_type", None)
+    return asyncio.run(receive_multipart_file(_request(body, chunk_size, content_type), temp_path, **kwargs))
+
+
+def test_file_and_fields_are_parsed(tmp_path):
+    content = b"hello multipart " * 500
+    temp_path = tmp_path / "upload.part"
+    upload = _receive(_body(content, fields={"conversation_id": "abc"}), temp_path, chunk_size=333)
+
+    assert upload.filename == "notes.txt"
+    assert upload.content_type == "text/plain"
+    assert upload.fields == {"conversation_id": "abc"}
+    assert upload.size_bytes == len(content)
+    assert upload.sha256 == hashlib.sha256(content).hexdigest()
+    assert temp_path.read_bytes() == content
+
+
+def test_admit_cuts_the_upload_off_and_removes_the_temp_file(tmp_path):
+    temp_path = tmp_path / "upload.part"
+    asked = []
+
+    def admit(received):
+        asked.append(received)
+        return received <= 2500
+
+    with pytest.raises(UploadQuotaExceeded) as exc:
+        _receive(_body(b"x" * 10000), temp_path, admit=admit, chunk_size=1000)
+    assert 2500 < exc.value.received < 10000
+    # Asked as the file grew, not once at the end
+    assert len(asked) > 1 and asked == sorted(asked)
+    assert not temp_path.exists()
+
+
+@pytest.mark.parametrize("body, content_type, error", [
+    (b"plain", "text/plain", "expected multipart/form-data"),
+    (_body(b"data")[:-20], None, "incomplete multipart body"),
+    (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="x"\r\n\r\n1\r\n--{BOUNDARY}--\r\n'.encode(), None,
+     "missing file field: file"),
+    (_body(b"data", file_field="other"), None, "unexpected file field: other"),
+])
+def test_malformed_uploads_are_rejected(tmp_path, body, content_type, error):
+    temp_path = tmp_path / "upload.part"
+    with pytest.raises(UploadError, match=error):
+        _receive(body, temp_path, content_type=content_type)
+    assert not temp_path.exists()
+
+
+def test_second_file_part_is_rejected(tmp_path):
+    one = _body(b"a")
+    two = one[:one.rindex(f"--{BOUNDARY}--".encode())] + _body(b"b")
+    with pytest.raises(UploadError, match="only one file per upload"):
+        _receive(two, tmp_path / "upload.part")
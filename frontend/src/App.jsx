@@ -20,6 +20,20 @@ import {getStorageWarningLevel, isStorageFull, STORAGE_CONFIG,} from './utils/st
 import {cn} from './components/ui/utils';
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
+// Pages of a conversation (newest first): the newest is loaded when the conversation opens,
+// older ones as the user scrolls up; reasoning is loaded when its panel is opened
+const MESSAGES_QUERY = 'limit=50';
+// Sidebar conversations, most recently active first: the first page on load,
+// the next ones as the sidebar is scrolled down
+const CONVERSATIONS_QUERY = 'limit=50';
+
+// One page of a keyset-paged list: {items, nextCursor}, nextCursor null on the last page
+const fetchPage = async (api, path, query, cursor = null) => {
+    const params = new URLSearchParams(query);
+    if (cursor) params.set('cursor', cursor);
+    const {data, nextCursor} = await api.request(`${path}?${params.toString()}`, {withNextCursor: true});
+    return {items: Array.isArray(data) ? data : [], nextCursor: nextCursor || null};
+};
 
 const areUsersEqual = (a, b) => {
     if (a === b) return true;
@@ -54,6 +68,9 @@ function AuthenticatedApp() {
     const location = useLocation();
     const navigate = useNavigate();
     const [conversations, setConversations] = useState([]);
+    // X-Next-Cursor of the last loaded sidebar page; null once every conversation is listed
+    const [conversationsCursor, setConversationsCursor] = useState(null);
+    const [loadingMoreConversations, setLoadingMoreConversations] = useState(false);
     const [activeConversationId, setActiveConversationId] = useState(null);
     const [documents, setDocuments] = useState([]);
     const [telemetry, setTelemetry] = useState(null);
@@ -113,6 +130,7 @@ function AuthenticatedApp() {
     const hasLoadedUsersRef = React.useRef(false);
 
     const conversationsApi = useApi();
+    const moreConversationsApi = useApi();
     const conversationApi = useApi();
     const documentsApi = useApi();
     const telemetryApi = useApi();
@@ -152,8 +170,14 @@ function AuthenticatedApp() {
         updatedAt: conv.updated_at,
         messages: existing?.messages || [],
         messagesLoaded: existing?.messagesLoaded ?? false,
+        // X-Next-Cursor of the oldest loaded message page; null once the start is reached
+        olderCursor: existing?.olderCursor ?? null,
+        loadingOlder: existing?.loadingOlder ?? false,
         archived: existing?.archived ?? false,
         storageSize: typeof conv.storage_size === 'number' ? conv.storage_size : existing?.storageSize ?? 0,
+        messageCount: conv.message_count ?? existing?.messageCount ?? 0,
+        lastMessageAt: conv.last_message_at ?? existing?.lastMessageAt ?? null,
+        lastMessagePreview: conv.last_message_preview ?? existing?.lastMessagePreview ?? '',
     });
 
     const mapMessage = (message) => {
@@ -162,6 +186,8 @@ function AuthenticatedApp() {
             ? meta.document_ids
             : [];
         const reasoning = typeof meta.reasoning === 'string' ? meta.reasoning : '';
+        // History pages leave meta.reasoning out and flag it with meta.has_reasoning
+        const hasReasoning = Boolean(reasoning) || Boolean(meta.has_reasoning);
 
         return {
             id: message.id,
@@ -172,6 +198,7 @@ function AuthenticatedApp() {
             metadata: meta,
             attachedDocuments: documentIds,
             reasoning,
+            hasReasoning,
         };
     };
 
@@ -275,7 +302,7 @@ function AuthenticatedApp() {
                 if (cancelled) return;
 
                 const [convs, docs] = await Promise.all([
-                    loadConversations({preloadMessages: true}),
+                    loadConversations(),
                     loadDocuments(),
                 ]);
 
@@ -314,7 +341,7 @@ function AuthenticatedApp() {
     // Reload conversations when the active organization changes
     useEffect(() => {
         if (!authUserId || !selectedOrganizationId) return;
-        loadConversations({preloadMessages: true});
+        loadConversations();
     }, [authUserId, selectedOrganizationId]);
 
     // Load admin user list when settings page is opened
@@ -429,33 +456,22 @@ function AuthenticatedApp() {
         }
     };
 
-    const loadConversations = async ({preloadMessages = false} = {}) => {
+    // First sidebar page. Conversations from further pages already scrolled in are kept
+    // after it (with their cursor); message pages already loaded are kept too.
+    const loadConversations = async () => {
         try {
-            const data = await conversationsApi.request('/api/v1/chat/conversations');
-            if (!Array.isArray(data)) {
-                setConversations([]);
-                return [];
-            }
-
-            const mapped = data.map(conv => mapConversation(conv));
-
-            if (preloadMessages && mapped.length > 0) {
-                const conversationsWithMessages = await Promise.all(
-                    mapped.map(async conv => {
-                        try {
-                            const msgs = await conversationApi.request(`/api/v1/chat/conversations/${conv.id}/messages`);
-                            const mappedMsgs = Array.isArray(msgs) ? msgs.map(mapMessage) : [];
-                            return {...conv, messages: mappedMsgs, messagesLoaded: true};
-                        } catch {
-                            return conv;
-                        }
-                    })
-                );
-                setConversations(conversationsWithMessages);
-                return conversationsWithMessages;
+            const {items, nextCursor} = await fetchPage(conversationsApi, '/api/v1/chat/conversations', CONVERSATIONS_QUERY);
+            const mapped = items.map(conv => mapConversation(conv));
+            const pageIds = new Set(items.map(conv => conv.id));
+            const keepTail = Boolean(nextCursor) && conversations.some(conv => !pageIds.has(conv.id));
+            if (!keepTail) {
+                setConversationsCursor(nextCursor);
             }
-
-            setConversations(mapped);
+            setConversations(prev => {
+                const existingById = new Map(prev.map(conv => [conv.id, conv]));
+                const page = items.map(conv => mapConversation(conv, existingById.get(conv.id)));
+                return keepTail ? [...page, ...prev.filter(conv => !pageIds.has(conv.id))] : page;
+            });
             return mapped;
         } catch (error) {
             toast.error(error instanceof Error ? error.message : 'Failed to load conversations');
@@ -463,17 +479,46 @@ function AuthenticatedApp() {
         }
     };
 
+    // Next sidebar page, appended when the conversation list is scrolled to the bottom
+    const loadMoreConversations = async () => {
+        if (!conversationsCursor || loadingMoreConversations) return;
+        setLoadingMoreConversations(true);
+        try {
+            const {items, nextCursor} = await fetchPage(
+                moreConversationsApi, '/api/v1/chat/conversations', CONVERSATIONS_QUERY, conversationsCursor
+            );
+            setConversations(prev => {
+                const seen = new Set(prev.map(conv => conv.id));
+                return [...prev, ...items.filter(conv => !seen.has(conv.id)).map(conv => mapConversation(conv))];
+            });
+            setConversationsCursor(nextCursor);
+        } catch (error) {
+            toast.error(error instanceof Error ? error.message : 'Failed to load more conversations');
+        } finally {
+            setLoadingMoreConversations(false);
+        }
+    };
+
+    // Newest message page of a conversation. Older pages already scrolled in are kept
+    // (with their cursor) as long as they join up with the new page.
     const loadConversation = async (conversationId) => {
         try {
-            const data = await conversationApi.request(`/api/v1/chat/conversations/${conversationId}/messages`);
-            const mapped = Array.isArray(data) ? data.map(mapMessage) : [];
+            const {items, nextCursor} = await fetchPage(
+                conversationApi, `/api/v1/chat/conversations/${conversationId}/messages`, MESSAGES_QUERY
+            );
+            // The API pages newest first; the chat renders oldest first
+            const mapped = items.slice().reverse().map(mapMessage);
 
             setConversations(prev =>
-                prev.map(conv =>
-                    conv.id === conversationId
-                        ? {...conv, messages: mapped, messagesLoaded: true}
-                        : conv
-                )
+                prev.map(conv => {
+                    if (conv.id !== conversationId) return conv;
+                    const existing = conv.messagesLoaded ? conv.messages || [] : [];
+                    const joinAt = mapped.length > 0 ? existing.findIndex(msg => msg.id === mapped[0].id) : -1;
+                    if (nextCursor && joinAt > 0) {
+                        return {...conv, messages: [...existing.slice(0, joinAt), ...mapped], messagesLoaded: true};
+                    }
+                    return {...conv, messages: mapped, messagesLoaded: true, olderCursor: nextCursor};
+                })
             );
 
             return mapped;
@@ -483,6 +528,65 @@ function AuthenticatedApp() {
         }
     };
 
+    // Next older message page, prepended when the message list is scrolled to the top
+    const loadOlderMessages = async (conversationId) => {
+        const conversation = conversations.find(conv => conv.id === conversationId);
+        if (!conversation?.olderCursor || conversation.loadingOlder) return;
+
+        const setLoadingOlder = (loadingOlder) =>
+            setConversations(prev =>
+                prev.map(conv => (conv.id === conversationId ? {...conv, loadingOlder} : conv))
+            );
+
+        setLoadingOlder(true);
+        try {
+            const {items, nextCursor} = await fetchPage(
+                conversationApi,
+                `/api/v1/chat/conversations/${conversationId}/messages`,
+                MESSAGES_QUERY,
+                conversation.olderCursor,
+            );
+            const older = items.slice().reverse().map(mapMessage);
+            setConversations(prev =>
+                prev.map(conv => {
+                    if (conv.id !== conversationId) return conv;
+                    const existing = conv.messages || [];
+                    const seen = new Set(existing.map(msg => msg.id));
+                    return {
+                        ...conv,
+                        messages: [...older.filter(msg => !seen.has(msg.id)), ...existing],
+                        olderCursor: nextCursor,
+                        loadingOlder: false,
+                    };
+                })
+            );
+        } catch (error) {
+            setLoadingOlder(false);
+            toast.error(error instanceof Error ? error.message : 'Failed to load earlier messages');
+        }
+    };
+
+    const loadMessageReasoning = async (conversationId, messageId) => {
+        try {
+            const message = await conversationApi.fetchMessage(conversationId, messageId);
+            const reasoning = typeof message?.meta?.reasoning === 'string' ? message.meta.reasoning : '';
+            setConversations(prev =>
+                prev.map(conv =>
+                    conv.id === conversationId
+                        ? {
+                            ...conv,
+                            messages: (conv.messages || []).map(msg =>
+                                msg.id === messageId ? {...msg, reasoning, hasReasoning: Boolean(reasoning)} : msg
+                            ),
+                        }
+                        : conv
+                )
+            );
+        } catch (error) {
+            toast.error(error instanceof Error ? error.message : 'Failed to load reasoning');
+        }
+    };
+
     const loadQuotaUsage = async () => {
         try {
             const data = await quotaApi.request('/api/v1/quota/info');
@@ -1071,7 +1175,12 @@ function AuthenticatedApp() {
             setIsGenerating(false);
             setCanRetry(false);
 
-            const updatedConversations = await loadConversations({preloadMessages: true});
+            const updatedConversations = await loadConversations();
+            try {
+                await loadConversation(conversationId);
+            } catch {
+                // Error already handled inside loadConversation
+            }
             await loadQuotaUsage();
 
             setActiveConversationId(conversationId);
@@ -1199,7 +1308,13 @@ function AuthenticatedApp() {
             });
 
             if (activeConversationId === conversationId) {
-                setActiveConversationId(updatedList[0]?.id || null);
+                const next = conversations.find(conv => conv.id !== conversationId);
+                setActiveConversationId(next?.id || null);
+                if (next && !next.messagesLoaded) {
+                    loadConversation(next.id).catch(() => {
+                        // Error already handled inside loadConversation
+                    });
+                }
             }
 
             await loadQuotaUsage();
@@ -1397,6 +1512,9 @@ function AuthenticatedApp() {
                         timeRange={filters.timeRange}
                         onTimeRangeChange={handleTimeRangeChange}
                         newChatDisabled={storageFull}
+                        hasMore={Boolean(conversationsCursor)}
+                        loadingMore={loadingMoreConversations}
+                        onLoadMore={loadMoreConversations}
                         // documents={documents}
                     />
 
@@ -1430,6 +1548,10 @@ function AuthenticatedApp() {
                                 storageQuota={storageQuota}
                                 user={effectiveUser}
                                 onManageStorage={handleManageStorage}
+                                onLoadReasoning={(messageId) => loadMessageReasoning(activeConversationId, messageId)}
+                                hasOlderMessages={Boolean(activeConversation?.olderCursor)}
+                                loadingOlderMessages={Boolean(activeConversation?.loadingOlder)}
+                                onLoadOlderMessages={() => loadOlderMessages(activeConversationId)}
                             />
                         }
                     />
@@ -31,6 +31,9 @@ import {DropdownMenu, DropdownMenuContent, DropdownMenuItem, DropdownMenuTrigger
 import {cn} from '../ui/utils';
 import {formatBytes} from '../../utils/storageConfig';
 
+// The next page is requested once the list is scrolled this close to the bottom
+const LOAD_MORE_THRESHOLD_PX = 120;
+
 const TIME_RANGE_LABELS = {
     'all': 'All Time',
     '1h': 'Last Hour',
@@ -52,9 +55,25 @@ export function ChatSidebar({
                                 timeRange = 'all',
                                 onTimeRangeChange,
                                 newChatDisabled = false,
+                                hasMore = false,
+                                loadingMore = false,
+                                onLoadMore,
                                 // documents
                             }) {
     const [searchQuery, setSearchQuery] = useState('');
+    const listRef = React.useRef(null);
+
+    React.useEffect(() => {
+        const viewport = listRef.current?.querySelector('[data-radix-scroll-area-viewport]');
+        if (!viewport || !hasMore || !onLoadMore) return undefined;
+        const handleScroll = () => {
+            if (loadingMore) return;
+            if (viewport.scrollHeight - viewport.scrollTop - viewport.clientHeight > LOAD_MORE_THRESHOLD_PX) return;
+            onLoadMore();
+        };
+        viewport.addEventListener('scroll', handleScroll, {passive: true});
+        return () => viewport.removeEventListener('scroll', handleScroll);
+    }, [hasMore, loadingMore, onLoadMore]);
 
     const formatTimeAgo = (dateString) => {
         const date = new Date(dateString);
@@ -227,7 +246,7 @@ export function ChatSidebar({
             </div>
 
             {/* Scrollable Conversations List */}
-            <div className="flex-1 min-h-0 overflow-hidden">
+            <div ref={listRef} className="flex-1 min-h-0 overflow-hidden">
                 <ScrollArea className="h-full">
                     {conversations.length === 0 ? (
                         <div className="p-6 text-center">
@@ -353,6 +372,19 @@ export function ChatSidebar({
                                     ))}
                                 </div>
                             )}
+
+                            {/* Further pages load on scroll; the button covers lists too short to scroll */}
+                            {hasMore && (
+                                <Button
+                                    variant="ghost"
+                                    size="sm"
+                                    className="w-full text-xs text-gray-500 dark:text-gray-400"
+                                    onClick={() => onLoadMore?.()}
+                                    disabled={loadingMore}
+                                >
+                                    {loadingMore ? 'Loading...' : 'Load more'}
+                                </Button>
+                            )}
                         </div>
                     )}
                 </ScrollArea>
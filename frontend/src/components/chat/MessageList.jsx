@@ -6,13 +6,22 @@ import { AlertCircle, Check, ChevronDown, ChevronUp, Copy } from "lucide-react";
 import { Button } from "../ui/button";
 import { Skeleton } from "../ui/skeleton";
 
+// Older messages are requested once the list is scrolled this close to the top
+const LOAD_OLDER_THRESHOLD_PX = 80;
+
 export function MessageList({
   messages = [],
   isGenerating = false,
   user,
   attachedDocuments = [],
+  onLoadReasoning,
+  hasOlder = false,
+  loadingOlder = false,
+  onLoadOlder,
 }) {
   const scrollAreaRef = useRef(null);
+  // Scroll position taken before an older page is requested, restored once it is prepended
+  const olderAnchorRef = useRef(null);
   const [copiedMessageId, setCopiedMessageId] = React.useState(null);
   const [collapsedReasoning, setCollapsedReasoning] = React.useState(new Set());
   const autoCollapsedRef = useRef(new Set());
@@ -50,24 +59,53 @@ export function MessageList({
     return `${fallback} tokens`;
   };
 
+  const getScrollContainer = () =>
+    scrollAreaRef.current?.querySelector("[data-radix-scroll-area-viewport]");
+
   useEffect(() => {
-    // Auto-scroll to bottom when new messages arrive
-    if (scrollAreaRef.current) {
-      const scrollContainer = scrollAreaRef.current.querySelector(
-        "[data-radix-scroll-area-viewport]"
-      );
-      if (scrollContainer) {
-        scrollContainer.scrollTop = scrollContainer.scrollHeight;
-      }
+    const scrollContainer = getScrollContainer();
+    if (!scrollContainer) return;
+    // An older page was prepended: keep the same messages in view
+    const anchor = olderAnchorRef.current;
+    if (anchor && messages.length > anchor.count && messages[messages.length - 1]?.id === anchor.lastId) {
+      olderAnchorRef.current = null;
+      scrollContainer.scrollTop =
+        scrollContainer.scrollHeight - anchor.scrollHeight + anchor.scrollTop;
+      return;
     }
+    // Auto-scroll to bottom when new messages arrive
+    scrollContainer.scrollTop = scrollContainer.scrollHeight;
   }, [messages, isGenerating]);
 
+  useEffect(() => {
+    // The request finished without prepending anything (failed or empty page)
+    if (!loadingOlder) olderAnchorRef.current = null;
+  }, [loadingOlder]);
+
+  useEffect(() => {
+    const scrollContainer = getScrollContainer();
+    if (!scrollContainer || !hasOlder || !onLoadOlder) return undefined;
+    const handleScroll = () => {
+      if (loadingOlder || olderAnchorRef.current) return;
+      if (scrollContainer.scrollTop > LOAD_OLDER_THRESHOLD_PX) return;
+      olderAnchorRef.current = {
+        scrollHeight: scrollContainer.scrollHeight,
+        scrollTop: scrollContainer.scrollTop,
+        count: messages.length,
+        lastId: messages[messages.length - 1]?.id,
+      };
+      onLoadOlder();
+    };
+    scrollContainer.addEventListener("scroll", handleScroll, { passive: true });
+    return () => scrollContainer.removeEventListener("scroll", handleScroll);
+  }, [messages, hasOlder, loadingOlder, onLoadOlder]);
+
   useEffect(() => {
     setCollapsedReasoning((prev) => {
       const next = new Set(prev);
       let changed = false;
       messages.forEach((msg) => {
-        if (!msg.reasoning) return;
+        if (!msg.reasoning && !msg.hasReasoning) return;
         if (msg.status === "generating") {
           if (next.has(msg.id)) {
             next.delete(msg.id);
@@ -109,7 +147,12 @@ export function MessageList({
       .filter(Boolean);
   };
 
-  const toggleReasoningVisibility = (messageId) => {
+  const toggleReasoningVisibility = (message) => {
+    const messageId = message.id;
+    // History pages leave reasoning out: fetch it the first time the panel is opened
+    if (collapsedReasoning.has(messageId) && !message.reasoning && message.hasReasoning) {
+      onLoadReasoning?.(messageId);
+    }
     setCollapsedReasoning((prev) => {
       const next = new Set(prev);
       if (next.has(messageId)) {
@@ -152,6 +195,11 @@ export function MessageList({
       className="h-full px-3 md:px-6 py-2 md:py-3"
     >
       <div className="space-y-4 md:space-y-6 max-w-4xl mx-auto w-full">
+        {loadingOlder && (
+          <div className="text-center text-xs text-muted-foreground py-2">
+            Loading earlier messages...
+          </div>
+        )}
         {messages.map((message) => (
           <div key={message.id} className="group">
             {message.role === "user" ? (
@@ -239,7 +287,7 @@ export function MessageList({
                     </span>
                   </div>
 
-                  {message.reasoning && (
+                  {(message.reasoning || message.hasReasoning) && (
                     <div className="bg-gray-50 dark:bg-gray-900/50 border border-gray-200 dark:border-gray-700 rounded-xl p-2 mb-2">
                       <div className="flex items-center justify-between gap-2">
                         <div className="flex items-center gap-2">
@@ -252,7 +300,7 @@ export function MessageList({
                           variant="ghost"
                           size="sm"
                           className="h-7 px-2 text-xs text-gray-600 dark:text-gray-300"
-                          onClick={() => toggleReasoningVisibility(message.id)}
+                          onClick={() => toggleReasoningVisibility(message)}
                         >
                           {collapsedReasoning.has(message.id) ? (
                             <span className="inline-flex items-center gap-1">
@@ -275,7 +323,7 @@ export function MessageList({
                             overflowWrap: "anywhere",
                           }}
                         >
-                          {message.reasoning}
+                          {message.reasoning || "Loading ..."}
                         </div>
                       )}
                     </div>
@@ -19,6 +19,8 @@ export function useApi() {
             requireAuth = true,
             signal,
             timeoutMs = 15000,
+            // Resolve to {data, nextCursor} with the X-Next-Cursor header of a paged list
+            withNextCursor = false,
         } = config;
 
         if (requireAuth && !accessToken) {
@@ -116,6 +118,9 @@ export function useApi() {
             }
 
             setState({data, loading: false, error: null});
+            if (withNextCursor) {
+                return {data, nextCursor: response.headers.get('X-Next-Cursor')};
+            }
             return data;
         } catch (error) {
             let errorMessage = 'Request failed';
@@ -148,15 +153,33 @@ export function useApi() {
         return request(`/api/v1/admin/users?${query}`);
     }, [request]);
 
-    const fetchConversations = useCallback(async () => {
-        return request('/api/v1/chat/conversations');
+    const fetchConversations = useCallback(async ({limit = 200, cursor} = {}) => {
+        // Most recently active first; pass the X-Next-Cursor header of a page as `cursor` for the next one
+        const params = {limit: String(limit)};
+        if (cursor) params.cursor = cursor;
+        const query = new URLSearchParams(params).toString();
+        return request(`/api/v1/chat/conversations?${query}`);
     }, [request]);
 
-    const fetchConversationMessages = useCallback(async (conversationId) => {
+    const fetchConversationMessages = useCallback(async (conversationId, {limit = 200, cursor, include} = {}) => {
         if (!conversationId) {
             throw new Error('conversationId is required');
         }
-        return request(`/api/v1/chat/conversations/${conversationId}/messages`);
+        // Newest first; pass the X-Next-Cursor header of a page as `cursor` for older messages.
+        // meta.reasoning is only sent with include='reasoning' (see fetchMessage)
+        const params = {limit: String(limit)};
+        if (include) params.include = include;
+        if (cursor) params.cursor = cursor;
+        const query = new URLSearchParams(params).toString();
+        return request(`/api/v1/chat/conversations/${conversationId}/messages?${query}`);
+    }, [request]);
+
+    const fetchMessage = useCallback(async (conversationId, messageId) => {
+        if (!conversationId || !messageId) {
+            throw new Error('conversationId and messageId are required');
+        }
+        // A single message with all of its meta, including reasoning
+        return request(`/api/v1/chat/conversations/${conversationId}/messages/${messageId}`);
     }, [request]);
 
     const fetchDocuments = useCallback(async ({page = 1, pageSize = 100} = {}) => {
@@ -265,6 +288,7 @@ export function useApi() {
         fetchUsers,
         fetchConversations,
         fetchConversationMessages,
+        fetchMessage,
         fetchDocuments,
         fetchQuotaInfo,
         fetchTelemetrySummary,
@@ -29,6 +29,10 @@ export function DashboardPage({
                                   storageQuota,
                                   user,
                                   onManageStorage,
+                                  onLoadReasoning,
+                                  hasOlderMessages,
+                                  loadingOlderMessages,
+                                  onLoadOlderMessages,
                               }) {
     const selectedOrganization = organizations.find((org) => org.id === selectedOrganizationId);
     const organizationName = selectedOrganization?.displayName || selectedOrganization?.name;
@@ -159,7 +163,9 @@ export function DashboardPage({
 
                         <div className="flex-1 min-h-0 overflow-hidden ">
                             <MessageList messages={displayMessages} isGenerating={isGenerating} user={user}
-                                         attachedDocuments={documents}/>
+                                         attachedDocuments={documents} onLoadReasoning={onLoadReasoning}
+                                         hasOlder={hasOlderMessages} loadingOlder={loadingOlderMessages}
+                                         onLoadOlder={onLoadOlderMessages}/>
                         </div>
                     </>
                 )}
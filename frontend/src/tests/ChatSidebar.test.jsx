@@ -143,4 +143,35 @@ describe("ChatSidebar Component", () => {
     fireEvent.click(screen.getByText("Today Chat"));
     expect(mockFn).toHaveBeenCalledWith("1");
   });
+
+  test("Load more fetches the next page only while there is one", () => {
+    const mockFn = vi.fn();
+
+    const { rerender } = render(
+      <ChatSidebar
+        conversations={mockConversations}
+        activeConversationId={null}
+        onSelectConversation={() => {}}
+        onNewConversation={() => {}}
+        hasMore
+        onLoadMore={mockFn}
+      />
+    );
+
+    fireEvent.click(screen.getByText("Load more"));
+    expect(mockFn).toHaveBeenCalledTimes(1);
+
+    rerender(
+      <ChatSidebar
+        conversations={mockConversations}
+        activeConversationId={null}
+        onSelectConversation={() => {}}
+        onNewConversation={() => {}}
+        hasMore={false}
+        onLoadMore={mockFn}
+      />
+    );
+
+    expect(screen.queryByText("Load more")).not.toBeInTheDocument();
+  });
 });